@@ -4219,6 +4219,32 @@ async function pollGameStatus() {
     }
 }
 
+function subscribeLiveSocket() {
+    const socket = gameState.ws;
+    if (!socket || socket.readyState !== WebSocket.OPEN) {
+        return;
+    }
+    try {
+        socket.send(gameState.token
+            ? JSON.stringify({ action: 'subscribe', token: gameState.token })
+            : 'subscribe');
+    } catch (err) {
+        console.warn('WebSocket subscribe failed:', err);
+        scheduleLiveSocketReconnect('subscribe_failed');
+    }
+}
+
+function handleForcedLogout(message) {
+    gameState.gameActive = false;
+    gameState.token = null;
+    gameState.username = null;
+    clearAuth();
+    stopHeartbeat();
+    hud.classList.add('hidden');
+    showScreen('login');
+    alert(message);
+}
+
 function connectLiveSocket() {
     if (gameState.ws && (gameState.ws.readyState === WebSocket.OPEN || gameState.ws.readyState === WebSocket.CONNECTING)) {
         return;
@@ -4247,17 +4273,18 @@ function connectLiveSocket() {
             setHudStatus('Live connection restored.');
         }
 
-        try {
-            socket.send('subscribe');
-        } catch (err) {
-            console.warn('WebSocket subscribe failed:', err);
-            scheduleLiveSocketReconnect('subscribe_failed');
-        }
+        subscribeLiveSocket();
     };
 
     socket.onmessage = async (event) => {
         try {
             const data = JSON.parse(event.data);
+            if (data.event === 'player_kicked' || data.event === 'player_banned') {
+                handleForcedLogout(data.event === 'player_banned'
+                    ? 'Your team has been banned by the admin.'
+                    : 'You were removed from the session by the admin. Join again to continue.');
+                return;
+            }
             if (data.event === 'session_update') {
                 const payload = data.payload || {};
                 updateTimerDisplay(payload.remaining_seconds || 0);
@@ -4331,6 +4358,7 @@ async function validateStoredToken() {
         gameState.username = data.username;
         gameState.token = token;
         gameState.sessionId = data.session_id;
+        subscribeLiveSocket();
         gameState.score = data.score || 0;
         gameState.level = data.current_level || 0;
         scoreDisplay.textContent = gameState.score;
@@ -4495,6 +4523,7 @@ async function startGame() {
         gameState.username = data.username;
         gameState.token = data.token;
         gameState.sessionId = data.session_id;
+        subscribeLiveSocket();
         gameState.score = data.score || 0;
         gameState.level = data.current_level || 0;
         gameState.isCompleted = false;
@@ -4636,7 +4665,8 @@ async function loadLevel(level, path = null, restoreOptions = null, options = {}
     }
 
     try {
-        const response = await fetch(url);
+        /* Signed-in players may get their own variants of a level's questions. */
+        const response = await fetch(url, gameState.token ? { headers: { Authorization: `Bearer ${gameState.token}` } } : undefined);
         if (!response.ok) {
             throw new Error('Failed to load level');
         }
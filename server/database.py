@@ -1,16 +1,43 @@
+import os
+import re
+import time
+from contextlib import contextmanager
+
 from sqlalchemy import create_engine, event, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import declarative_base, sessionmaker
 
 DATABASE_URL = "sqlite:///./questarena.db"
+ASYNC_DATABASE_URL = "sqlite+aiosqlite:///./questarena.db"
+SCHEMA_LOCK_PATH = "./questarena.db.lock"
 
+# Synchronous engine: schema creation, migrations and offline scripts only.
 engine = create_engine(
     DATABASE_URL,
     connect_args={"check_same_thread": False},
     pool_pre_ping=True,
 )
 
+# Request handlers and background jobs use the async engine, so a slow query
+# (or one waiting on busy_timeout) parks its coroutine instead of the event loop.
+async_engine = create_async_engine(ASYNC_DATABASE_URL, pool_pre_ping=True)
+
+# The write queue's engine: a single connection used only by the writer thread,
+# so player writes never contend with each other for SQLite's lock.  pysqlite's
+# implicit transaction handling is switched off so SAVEPOINTs nest inside an
+# explicit BEGIN IMMEDIATE.
+writer_engine = create_engine(
+    DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    pool_size=1,
+    max_overflow=0,
+    pool_pre_ping=True,
+)
+
 
 @event.listens_for(engine, "connect")
+@event.listens_for(async_engine.sync_engine, "connect")
+@event.listens_for(writer_engine, "connect")
 def set_sqlite_pragma(dbapi_connection, connection_record):
     cursor = dbapi_connection.cursor()
     cursor.execute("PRAGMA journal_mode=WAL;")
@@ -20,7 +47,21 @@ def set_sqlite_pragma(dbapi_connection, connection_record):
     cursor.close()
 
 
+@event.listens_for(writer_engine, "connect")
+def _writer_autocommit(dbapi_connection, connection_record):
+    dbapi_connection.isolation_level = None
+
+
+@event.listens_for(writer_engine, "begin")
+def _writer_begin(conn):
+    conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# expire_on_commit=False: attributes stay readable after commit, since an
+# AsyncSession cannot lazily reload them.
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+WriterSessionLocal = sessionmaker(bind=writer_engine, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
 
@@ -32,6 +73,81 @@ def _migrate_schema() -> None:
         existing_cols = {row[1] for row in result}
         if "code_attempted" not in existing_cols:
             conn.execute(text("ALTER TABLE players ADD COLUMN code_attempted BOOLEAN NOT NULL DEFAULT 0"))
+        if "completion_remaining_seconds" not in existing_cols:
+            conn.execute(text("ALTER TABLE players ADD COLUMN completion_remaining_seconds INTEGER"))
+            _backfill_completion_remaining(conn)
+        if "token_generation" not in existing_cols:
+            conn.execute(text("ALTER TABLE players ADD COLUMN token_generation INTEGER NOT NULL DEFAULT 0"))
+            if "auth_token" in existing_cols:
+                # Tokens issued before generations carry none and count as generation 0, so
+                # players whose token was already revoked start at 1; then drop the stored JWTs.
+                conn.execute(text("UPDATE players SET token_generation = 1 WHERE auth_token IS NULL"))
+                conn.execute(text("UPDATE players SET auth_token = NULL"))
+
+        result = conn.execute(text("PRAGMA table_info(sessions)"))
+        session_cols = {row[1] for row in result}
+        if "ends_at" not in session_cols:
+            conn.execute(text("ALTER TABLE sessions ADD COLUMN ends_at DATETIME"))
+        if "paused_at" not in session_cols:
+            conn.execute(text("ALTER TABLE sessions ADD COLUMN paused_at DATETIME"))
+        if "paused_seconds" not in session_cols:
+            conn.execute(text("ALTER TABLE sessions ADD COLUMN paused_seconds INTEGER NOT NULL DEFAULT 0"))
+        if "question_set" not in session_cols:
+            conn.execute(text("ALTER TABLE sessions ADD COLUMN question_set VARCHAR(64)"))
+        if "question_seed" not in session_cols:
+            conn.execute(text("ALTER TABLE sessions ADD COLUMN question_seed INTEGER NOT NULL DEFAULT 0"))
+
+
+def _backfill_completion_remaining(conn) -> None:
+    """One-time parse of "…; remaining_seconds=1234" completion logs into the new column."""
+    logs = conn.execute(
+        text(
+            "SELECT logs.player_id, logs.details FROM logs "
+            "JOIN players ON players.id = logs.player_id AND players.session_id = logs.session_id "
+            "WHERE players.completed_at IS NOT NULL "
+            "AND logs.action_type IN ('final_challenge_complete', 'game_complete') "
+            "ORDER BY logs.timestamp, logs.id"
+        )
+    )
+    remaining_by_player: dict[int, int] = {}
+    for player_id, details in logs:
+        match = re.search(r"remaining_seconds\s*=\s*(\d+)", details or "")
+        if match:
+            remaining_by_player[player_id] = int(match.group(1))
+    if remaining_by_player:
+        conn.execute(
+            text("UPDATE players SET completion_remaining_seconds = :remaining WHERE id = :player_id"),
+            [{"player_id": pid, "remaining": value} for pid, value in remaining_by_player.items()],
+        )
+
+
+@contextmanager
+def schema_lock():
+    """Hold an exclusive lock on SCHEMA_LOCK_PATH so only one worker process sets up the schema at a time."""
+    with open(SCHEMA_LOCK_PATH, "a+b") as handle:
+        if os.name == "nt":
+            import msvcrt
+
+            handle.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+                    break
+                except OSError:
+                    time.sleep(0.05)
+            try:
+                yield
+            finally:
+                handle.seek(0)
+                msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
 
 
 def ensure_performance_indexes() -> None:
@@ -42,9 +158,6 @@ def ensure_performance_indexes() -> None:
         conn.execute(text("CREATE INDEX IF NOT EXISTS ix_logs_session_timestamp ON logs (session_id, timestamp DESC)"))
 
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
@@ -1,19 +1,26 @@
-import asyncio
 import logging
 import os
+from datetime import datetime, timedelta
 
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import HTMLResponse
 from fastapi.staticfiles import StaticFiles
 
-from database import Base, SessionLocal, engine, ensure_performance_indexes
+from database import Base, SessionLocal, async_engine, engine, ensure_performance_indexes, schema_lock, writer_engine
 from models import SessionModel
 from routes.admin import router as admin_router
 from routes.auth import router as auth_router
 from routes.player import router as player_router
 from routes.session import router as session_router
-from services.timer import timer_loop
+from services.audit_log import audit_log
+from services.broker import broker
+from services.presence import presence
+from services.question_bank import question_sets
+from services.scheduler import scheduler
+from services.session_state import session_state
+from services.timer import schedule_background_jobs
+from services.write_queue import write_queue
 
 logging.getLogger("websockets.protocol").setLevel(logging.CRITICAL)
 logging.getLogger("websockets.server").setLevel(logging.CRITICAL)
@@ -33,45 +40,71 @@ app.include_router(admin_router)
 app.include_router(player_router)
 app.include_router(session_router)
 
-_timer_task: asyncio.Task | None = None
+
+def prepare_database() -> None:
+    """Create and migrate the schema and make sure a live session exists.
+
+    Every uvicorn worker runs startup at the same moment, so this runs under
+    a file lock: the first worker does the work and the others find it done.
+    """
+    with schema_lock():
+        Base.metadata.create_all(bind=engine)
+        ensure_performance_indexes()
+
+        db = SessionLocal()
+        try:
+            live = (
+                db.query(SessionModel)
+                .filter(SessionModel.status.in_(["waiting", "running", "paused"]))
+                .order_by(SessionModel.created_at.desc())
+                .first()
+            )
+            if not live:
+                db.add(
+                    SessionModel(
+                        name="Default Session",
+                        duration_minutes=30,
+                        remaining_seconds=30 * 60,
+                        status="waiting",
+                    )
+                )
+                db.commit()
+            elif live.status == "running" and live.ends_at is None:
+                # Running since before sessions kept a deadline: resume from the last snapshot.
+                live.ends_at = datetime.utcnow() + timedelta(seconds=live.remaining_seconds)
+                db.commit()
+        finally:
+            db.close()
 
 
 @app.on_event("startup")
 async def startup() -> None:
-    global _timer_task
+    prepare_database()
+    schedule_background_jobs()
+    await broker.start()
 
-    Base.metadata.create_all(bind=engine)
-    ensure_performance_indexes()
     db = SessionLocal()
     try:
-        live = (
-            db.query(SessionModel)
-            .filter(SessionModel.status.in_(["waiting", "running", "paused"]))
-            .order_by(SessionModel.created_at.desc())
-            .first()
-        )
-        if not live:
-            db.add(
-                SessionModel(
-                    name="Default Session",
-                    duration_minutes=30,
-                    remaining_seconds=30 * 60,
-                    status="waiting",
-                )
-            )
-            db.commit()
+        latest = session_state.load(db)
+        if latest is not None:
+            await question_sets.for_session(latest)  # read its question set before the first request
     finally:
         db.close()
 
-    _timer_task = asyncio.create_task(timer_loop())
+    await write_queue.start()
+    await audit_log.start()
+    await scheduler.start()
 
 
 @app.on_event("shutdown")
 async def shutdown() -> None:
-    global _timer_task
-    if _timer_task:
-        _timer_task.cancel()
-        _timer_task = None
+    await scheduler.stop()
+    await presence.flush()
+    await audit_log.stop()
+    await write_queue.stop()
+    await broker.stop()
+    writer_engine.dispose()
+    await async_engine.dispose()
 
 
 @app.get("/admin", response_class=HTMLResponse)
@@ -15,9 +15,14 @@ class SessionModel(Base):
     end_time = Column(DateTime, nullable=True)
     duration_minutes = Column(Integer, nullable=False, default=30)
     remaining_seconds = Column(Integer, nullable=False, default=30 * 60)
+    ends_at = Column(DateTime, nullable=True)
+    paused_at = Column(DateTime, nullable=True)
+    paused_seconds = Column(Integer, nullable=False, default=0)
     status = Column(String(20), nullable=False, default="waiting")
     leaderboard_frozen = Column(Boolean, nullable=False, default=False)
     frozen_snapshot = Column(Text, nullable=True)
+    question_set = Column(String(64), nullable=True)  # None: the default questions.json
+    question_seed = Column(Integer, nullable=False, default=0)
     created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
 
     players = relationship("Player", back_populates="session", cascade="all, delete-orphan")
@@ -37,8 +42,10 @@ class Player(Base):
     ip_address = Column(String(64), nullable=True)
     is_active = Column(Boolean, nullable=False, default=True)
     is_banned = Column(Boolean, nullable=False, default=False)
-    auth_token = Column(Text, nullable=True)
+    # Bumped to revoke every token issued so far (kick, ban, rejoin); tokens carry it as "gen".
+    token_generation = Column(Integer, nullable=False, default=0)
     completed_at = Column(DateTime, nullable=True)
+    completion_remaining_seconds = Column(Integer, nullable=True)
     code_attempted = Column(Boolean, nullable=False, default=False)
 
     session = relationship("SessionModel", back_populates="players")
@@ -1,13 +1,17 @@
 import csv
 import io
+import secrets
 from datetime import datetime
+from typing import Any, Callable
 
-from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
 from fastapi.responses import StreamingResponse
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from database import get_db
-from models import Log, Player, SessionModel
+from models import Player, SessionModel
 from schemas import (
     AdjustScoreRequest,
     CreateSessionRequest,
@@ -15,15 +19,33 @@ from schemas import (
     MoveLevelRequest,
     TimeAdjustRequest,
 )
-from services.anti_cheat import duplicate_ip_map
+from services.audit_log import audit_log
 from services.leaderboard import (
     analytics_for_session,
-    compute_time_taken_seconds,
     get_leaderboard,
-    set_leaderboard_freeze,
+    leaderboard_index,
+    live_player_rows,
+    leaderboard_freeze_values,
 )
-from services.realtime import manager
-from services.security import require_admin
+from services.leaderboard_feed import leaderboard_feed, publish_leaderboard
+from services.presence import presence
+from services.question_bank import QuestionBankError, question_sets
+from services.realtime import manager, player_topic
+from services.response_cache import response_cache
+from services.scheduler import scheduler
+from services.security import principal_cache, require_admin
+from services.session_clock import (
+    adjust_clock,
+    pause_clock,
+    resume_clock,
+    session_remaining_seconds,
+    session_update_payload,
+    start_clock,
+    stop_clock,
+)
+from services.session_state import LIVE_STATUSES, session_state
+from services.solved_questions import solved_questions
+from services.write_queue import write_queue
 
 router = APIRouter(prefix="/api/admin", tags=["admin"])
 
@@ -39,149 +61,155 @@ def _verify_admin(authorization: str | None) -> None:
     require_admin(token)
 
 
-def _current_live_session(db: Session) -> SessionModel | None:
-    return (
-        db.query(SessionModel)
-        .filter(SessionModel.status.in_(["waiting", "running", "paused"]))
-        .order_by(SessionModel.created_at.desc())
-        .first()
-    )
+def _update_player(player_id: int, **values):
+    """UPDATE one player and return its row.
 
+    Run through the write queue, with relative changes written as SQL
+    expressions, so a concurrent credit from a player route is never
+    overwritten by a value read earlier.
+    """
+    return update(Player).where(Player.id == player_id).values(**values).returning(Player)
+
+
+def _revoke_tokens(player_id: int, **values):
+    return _update_player(player_id, token_generation=Player.token_generation + 1, **values)
 
-def _log(db: Session, session_id: int, action_type: str, details: str, player_id: int | None = None):
-    db.add(
-        Log(
-            session_id=session_id,
-            player_id=player_id,
-            action_type=action_type,
-            details=details,
-        )
-    )
+
+async def _write_live_session(
+    change: Callable[[SessionModel], Any], *, status_code: int = 404, detail: str = "No active session"
+) -> tuple[SessionModel, Any]:
+    """Apply `change` to the live session's row through the write queue.
+
+    Returns the row and whatever `change` returned.  `change` runs on the
+    writer against the current row, so it checks the status there (raising
+    HTTPException) rather than on a copy read earlier.
+    """
+    live = session_state.live
+    if live is None:
+        raise HTTPException(status_code=status_code, detail=detail)
+    session_id = live.id
+
+    def write(wdb: Session) -> tuple[SessionModel, Any]:
+        session = wdb.get(SessionModel, session_id)
+        if session is None:
+            raise HTTPException(status_code=status_code, detail=detail)
+        return session, change(session)
+
+    return await write_queue.submit(write)
 
 
 @router.post("/session/create")
 async def create_session(
     body: CreateSessionRequest,
     authorization: str | None = Header(default=None, alias="Authorization"),
-    db: Session = Depends(get_db),
 ):
     _verify_admin(authorization)
+    question_set = body.question_set.strip() if body.question_set and body.question_set.strip() else None
+    if question_set is not None:
+        try:
+            await question_sets.load(question_set)
+        except QuestionBankError as exc:
+            raise HTTPException(status_code=400, detail=f"Invalid question set: {exc}") from exc
+
+    live_id = session_state.live.id if session_state.live else None
+
+    def create(wdb: Session) -> tuple[SessionModel | None, SessionModel]:
+        live = wdb.get(SessionModel, live_id) if live_id is not None else None
+        if live is not None and live.status in LIVE_STATUSES:
+            stop_clock(live)
+        else:
+            live = None
+        session = SessionModel(
+            name=body.name.strip(),
+            duration_minutes=body.duration_minutes,
+            remaining_seconds=body.duration_minutes * 60,
+            status="waiting",
+            question_set=question_set,
+            question_seed=secrets.randbelow(2**31),  # picks each player's question variants
+            created_at=datetime.utcnow(),
+        )
+        wdb.add(session)
+        wdb.flush()
+        return live, session
 
-    live = _current_live_session(db)
+    live, session = await write_queue.submit(create)
     if live:
-        live.status = "ended"
-        live.end_time = datetime.utcnow()
-        _log(db, live.id, "session_ended", "Auto-ended due to new session creation")
-
-    session = SessionModel(
-        name=body.name.strip(),
-        duration_minutes=body.duration_minutes,
-        remaining_seconds=body.duration_minutes * 60,
-        status="waiting",
-        created_at=datetime.utcnow(),
-    )
-    db.add(session)
-    db.flush()
-    _log(db, session.id, "session_created", f"Session '{session.name}' created")
-    db.commit()
-    db.refresh(session)
-
-    await manager.broadcast(
-        "session_update",
-        {
-            "session_id": session.id,
-            "status": session.status,
-            "remaining_seconds": session.remaining_seconds,
-            "duration_minutes": session.duration_minutes,
-        },
-    )
+        principal_cache.invalidate_session(live.id)
+        audit_log.record(live.id, "session_ended", "Auto-ended due to new session creation")
+    audit_log.record(session.id, "session_created", f"Session '{session.name}' created")
+
+    if live:
+        session_state.track(live)
+    session_state.track(session)
+    await manager.broadcast("session_update", session_update_payload(session))
 
     return {
         "id": session.id,
         "name": session.name,
         "status": session.status,
         "duration_minutes": session.duration_minutes,
-        "remaining_seconds": session.remaining_seconds,
+        "remaining_seconds": session_remaining_seconds(session),
+        "question_set": session.question_set,
     }
 
 
 @router.post("/session/start")
 async def start_session(
     authorization: str | None = Header(default=None, alias="Authorization"),
-    db: Session = Depends(get_db),
 ):
     _verify_admin(authorization)
-    session = _current_live_session(db)
-    if not session:
-        raise HTTPException(status_code=404, detail="No session found")
-    if session.status == "ended":
-        raise HTTPException(status_code=400, detail="Cannot start an ended session")
-
-    session.status = "running"
-    if not session.start_time:
-        session.start_time = datetime.utcnow()
-    _log(db, session.id, "session_started", "Session started")
-    db.commit()
-
-    await manager.broadcast(
-        "session_update",
-        {
-            "session_id": session.id,
-            "status": session.status,
-            "remaining_seconds": session.remaining_seconds,
-            "duration_minutes": session.duration_minutes,
-        },
-    )
+    live = session_state.live
+    if live is not None:
+        await question_sets.for_session(live)  # read its question set before players ask for it
+
+    def start(session: SessionModel) -> None:
+        if session.status == "ended":
+            raise HTTPException(status_code=400, detail="Cannot start an ended session")
+        start_clock(session)
+
+    session, _ = await _write_live_session(start, detail="No session found")
+    audit_log.record(session.id, "session_started", "Session started")
+
+    session_state.track(session)
+    await manager.broadcast("session_update", session_update_payload(session))
     return {"ok": True}
 
 
 @router.post("/session/pause")
 async def pause_session(
     authorization: str | None = Header(default=None, alias="Authorization"),
-    db: Session = Depends(get_db),
 ):
     _verify_admin(authorization)
-    session = _current_live_session(db)
-    if not session or session.status != "running":
-        raise HTTPException(status_code=400, detail="No running session to pause")
-    session.status = "paused"
-    _log(db, session.id, "session_paused", "Session paused")
-    db.commit()
-
-    await manager.broadcast(
-        "session_update",
-        {
-            "session_id": session.id,
-            "status": session.status,
-            "remaining_seconds": session.remaining_seconds,
-            "duration_minutes": session.duration_minutes,
-        },
-    )
+
+    def pause(session: SessionModel) -> None:
+        if session.status != "running":
+            raise HTTPException(status_code=400, detail="No running session to pause")
+        pause_clock(session)
+
+    session, _ = await _write_live_session(pause, status_code=400, detail="No running session to pause")
+    audit_log.record(session.id, "session_paused", "Session paused")
+
+    session_state.track(session)
+    await manager.broadcast("session_update", session_update_payload(session))
     return {"ok": True}
 
 
 @router.post("/session/resume")
 async def resume_session(
     authorization: str | None = Header(default=None, alias="Authorization"),
-    db: Session = Depends(get_db),
 ):
     _verify_admin(authorization)
-    session = _current_live_session(db)
-    if not session or session.status != "paused":
-        raise HTTPException(status_code=400, detail="No paused session to resume")
-    session.status = "running"
-    _log(db, session.id, "session_resumed", "Session resumed")
-    db.commit()
-
-    await manager.broadcast(
-        "session_update",
-        {
-            "session_id": session.id,
-            "status": session.status,
-            "remaining_seconds": session.remaining_seconds,
-            "duration_minutes": session.duration_minutes,
-        },
-    )
+
+    def resume(session: SessionModel) -> None:
+        if session.status != "paused":
+            raise HTTPException(status_code=400, detail="No paused session to resume")
+        resume_clock(session)
+
+    session, _ = await _write_live_session(resume, status_code=400, detail="No paused session to resume")
+    audit_log.record(session.id, "session_resumed", "Session resumed")
+
+    session_state.track(session)
+    await manager.broadcast("session_update", session_update_payload(session))
     return {"ok": True}
 
 
@@ -189,94 +217,60 @@ async def resume_session(
 async def add_time(
     body: TimeAdjustRequest,
     authorization: str | None = Header(default=None, alias="Authorization"),
-    db: Session = Depends(get_db),
 ):
     _verify_admin(authorization)
-    session = _current_live_session(db)
-    if not session:
-        raise HTTPException(status_code=404, detail="No active session")
+    session, remaining = await _write_live_session(lambda session: adjust_clock(session, body.minutes * 60))
+    audit_log.record(session.id, "session_time_adjusted", f"+{body.minutes} minutes")
 
-    session.remaining_seconds += body.minutes * 60
-    _log(db, session.id, "session_time_adjusted", f"+{body.minutes} minutes")
-    db.commit()
-
-    await manager.broadcast(
-        "session_update",
-        {
-            "session_id": session.id,
-            "status": session.status,
-            "remaining_seconds": session.remaining_seconds,
-            "duration_minutes": session.duration_minutes,
-        },
-    )
-    return {"ok": True, "remaining_seconds": session.remaining_seconds}
+    session_state.track(session)
+    await manager.broadcast("session_update", session_update_payload(session))
+    return {"ok": True, "remaining_seconds": remaining}
 
 
 @router.post("/session/subtract_time")
 async def subtract_time(
     body: TimeAdjustRequest,
     authorization: str | None = Header(default=None, alias="Authorization"),
-    db: Session = Depends(get_db),
 ):
     _verify_admin(authorization)
-    session = _current_live_session(db)
-    if not session:
-        raise HTTPException(status_code=404, detail="No active session")
 
-    session.remaining_seconds = max(0, session.remaining_seconds - (body.minutes * 60))
-    if session.remaining_seconds == 0:
-        session.status = "ended"
-        session.end_time = datetime.utcnow()
-    _log(db, session.id, "session_time_adjusted", f"-{body.minutes} minutes")
-    db.commit()
+    def subtract(session: SessionModel) -> int:
+        remaining = adjust_clock(session, -body.minutes * 60)
+        if remaining == 0:
+            stop_clock(session, remaining=0)
+        return remaining
 
-    await manager.broadcast(
-        "session_update",
-        {
-            "session_id": session.id,
-            "status": session.status,
-            "remaining_seconds": session.remaining_seconds,
-            "duration_minutes": session.duration_minutes,
-        },
-    )
-    return {"ok": True, "remaining_seconds": session.remaining_seconds}
+    session, remaining = await _write_live_session(subtract)
+    if remaining == 0:
+        principal_cache.invalidate_session(session.id)
+    audit_log.record(session.id, "session_time_adjusted", f"-{body.minutes} minutes")
+
+    session_state.track(session)
+    await manager.broadcast("session_update", session_update_payload(session))
+    return {"ok": True, "remaining_seconds": remaining}
 
 
 @router.post("/session/end")
 async def force_end_session(
     authorization: str | None = Header(default=None, alias="Authorization"),
-    db: Session = Depends(get_db),
 ):
     _verify_admin(authorization)
-    session = _current_live_session(db)
-    if not session:
-        raise HTTPException(status_code=404, detail="No active session")
-
-    session.status = "ended"
-    session.end_time = datetime.utcnow()
-    session.remaining_seconds = 0
-    _log(db, session.id, "session_ended", "Force ended by admin")
-    db.commit()
+    session, _ = await _write_live_session(lambda session: stop_clock(session, remaining=0))
+    principal_cache.invalidate_session(session.id)
+    audit_log.record(session.id, "session_ended", "Force ended by admin")
 
-    await manager.broadcast(
-        "session_update",
-        {
-            "session_id": session.id,
-            "status": session.status,
-            "remaining_seconds": session.remaining_seconds,
-            "duration_minutes": session.duration_minutes,
-        },
-    )
+    session_state.track(session)
+    await manager.broadcast("session_update", session_update_payload(session))
     return {"ok": True}
 
 
 @router.get("/sessions")
 async def list_sessions(
     authorization: str | None = Header(default=None, alias="Authorization"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     _verify_admin(authorization)
-    rows = db.query(SessionModel).order_by(SessionModel.created_at.desc()).all()
+    rows = (await db.scalars(select(SessionModel).order_by(SessionModel.created_at.desc()))).all()
     return [
         {
             "id": row.id,
@@ -285,7 +279,9 @@ async def list_sessions(
             "start_time": row.start_time.isoformat() if row.start_time else None,
             "end_time": row.end_time.isoformat() if row.end_time else None,
             "duration_minutes": row.duration_minutes,
-            "remaining_seconds": row.remaining_seconds,
+            "remaining_seconds": session_remaining_seconds(row),
+            "paused_seconds": row.paused_seconds or 0,
+            "question_set": row.question_set,
             "created_at": row.created_at.isoformat() if row.created_at else None,
         }
         for row in rows
@@ -296,71 +292,67 @@ async def list_sessions(
 async def delete_session(
     session_id: int,
     authorization: str | None = Header(default=None, alias="Authorization"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     _verify_admin(authorization)
-    session = db.query(SessionModel).filter(SessionModel.id == session_id).first()
-    if not session:
-        raise HTTPException(status_code=404, detail="Session not found")
-    if session.status in ("running", "paused", "waiting"):
-        raise HTTPException(status_code=400, detail="Cannot delete live session")
-
-    db.delete(session)
-    db.commit()
+    # Land this session's queued audit events first, so the cascade below sees and deletes them.
+    await audit_log.flush()
+
+    def delete(wdb: Session) -> None:
+        session = wdb.get(SessionModel, session_id)
+        if not session:
+            raise HTTPException(status_code=404, detail="Session not found")
+        if session.status in LIVE_STATUSES:
+            raise HTTPException(status_code=400, detail="Cannot delete live session")
+        wdb.delete(session)
+
+    await write_queue.submit(delete)
+    leaderboard_index.drop_session(session_id)
+    leaderboard_feed.discard(session_id)
+    solved_questions.clear()  # the session's players are gone and their ids may be reused
+    principal_cache.invalidate_session(session_id)
+    latest = session_state.latest
+    if latest is not None and latest.id == session_id:
+        await session_state.reload(db)
     return {"ok": True}
 
 
 @router.get("/players/live")
 async def live_players(
     authorization: str | None = Header(default=None, alias="Authorization"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     _verify_admin(authorization)
-    session = _current_live_session(db)
+    session = await session_state.load_live(db)
     if not session:
         return []
 
-    players = db.query(Player).filter(Player.session_id == session.id).all()
-    dup_map = duplicate_ip_map(players)
-    now = datetime.utcnow()
-
-    return [
-        {
-            "id": player.id,
-            "username": player.username,
-            "score": player.score,
-            "current_level": player.current_level,
-            "time_taken_seconds": compute_time_taken_seconds(player, session),
-            "is_completed": bool(player.completed_at),
-            "last_active_seconds_ago": (
-                max(0, int((now - player.last_active).total_seconds()))
-                if player.last_active
-                else None
-            ),
-            "ip_address": player.ip_address,
-            "is_active": player.is_active,
-            "is_banned": player.is_banned,
-            "duplicate_ip": bool(player.ip_address and dup_map.get(player.ip_address, 0) > 1),
-        }
-        for player in players
-    ]
+    return await live_player_rows(db, session)
 
 
 @router.post("/player/{player_id}/kick")
 async def kick_player(
     player_id: int,
     authorization: str | None = Header(default=None, alias="Authorization"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     _verify_admin(authorization)
-    player = db.query(Player).filter(Player.id == player_id).first()
+    player = await db.get(Player, player_id)
     if not player:
         raise HTTPException(status_code=404, detail="Player not found")
 
-    player.is_active = False
-    player.auth_token = None
-    _log(db, player.session_id, "player_kick", f"Player {player.username} kicked", player_id=player.id)
-    db.commit()
+    def kick(wdb: Session) -> bool:
+        was_active = wdb.scalar(select(Player.is_active).where(Player.id == player_id))
+        wdb.execute(_revoke_tokens(player_id, is_active=False))
+        return was_active
+
+    was_active = await write_queue.submit(kick)
+    audit_log.record(player.session_id, "player_kick", f"Player {player.username} kicked", player_id=player.id)
+    if was_active:
+        session_state.adjust_players(player.session_id, active=-1)
+    presence.forget(player.id)
+    principal_cache.invalidate_player(player.id)
+    await manager.broadcast("player_kicked", {"player_id": player.id}, topic=player_topic(player.id))
     return {"ok": True}
 
 
@@ -368,18 +360,33 @@ async def kick_player(
 async def ban_player(
     player_id: int,
     authorization: str | None = Header(default=None, alias="Authorization"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     _verify_admin(authorization)
-    player = db.query(Player).filter(Player.id == player_id).first()
+    player = await db.get(Player, player_id)
     if not player:
         raise HTTPException(status_code=404, detail="Player not found")
 
-    player.is_banned = True
-    player.is_active = False
-    player.auth_token = None
-    _log(db, player.session_id, "player_ban", f"Player {player.username} banned", player_id=player.id)
-    db.commit()
+    def ban(wdb: Session):
+        before = wdb.execute(
+            select(Player.is_banned, Player.is_active, Player.completed_at).where(Player.id == player_id)
+        ).one()
+        wdb.execute(_revoke_tokens(player_id, is_banned=True, is_active=False))
+        return before
+
+    was_banned, was_active, completed_at = await write_queue.submit(ban)
+    audit_log.record(player.session_id, "player_ban", f"Player {player.username} banned", player_id=player.id)
+    leaderboard_index.remove(player.id)
+    if not was_banned:
+        session_state.adjust_players(
+            player.session_id,
+            active=-1 if was_active else 0,
+            banned=1,
+            completed=-1 if completed_at is not None else 0,
+        )
+    presence.forget(player.id)
+    principal_cache.invalidate_player(player.id)
+    await manager.broadcast("player_banned", {"player_id": player.id}, topic=player_topic(player.id))
     return {"ok": True}
 
 
@@ -387,18 +394,28 @@ async def ban_player(
 async def reset_player_progress(
     player_id: int,
     authorization: str | None = Header(default=None, alias="Authorization"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     _verify_admin(authorization)
-    player = db.query(Player).filter(Player.id == player_id).first()
+    player = await db.get(Player, player_id)
     if not player:
         raise HTTPException(status_code=404, detail="Player not found")
 
-    player.score = 0
-    player.current_level = 0
-    player.completed_at = None
-    _log(db, player.session_id, "player_reset", "Progress reset", player_id=player.id)
-    db.commit()
+    def reset(wdb: Session):
+        before = wdb.execute(select(Player.completed_at, Player.is_banned).where(Player.id == player_id)).one()
+        row = wdb.scalars(
+            _update_player(player_id, score=0, current_level=0, completed_at=None, completion_remaining_seconds=None)
+        ).one()
+        return before.completed_at is not None and not before.is_banned, row
+
+    was_completed, player = await write_queue.submit(reset)
+    audit_log.record(player.session_id, "player_reset", "Progress reset", player_id=player.id)
+    if was_completed:
+        session_state.adjust_players(player.session_id, completed=-1)
+    solved_questions.reset(player.id)
+    principal_cache.invalidate_player(player.id)
+    session = await db.get(SessionModel, player.session_id)
+    leaderboard_index.upsert(player, session)
     return {"ok": True}
 
 
@@ -407,16 +424,17 @@ async def move_player_level(
     player_id: int,
     body: MoveLevelRequest,
     authorization: str | None = Header(default=None, alias="Authorization"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     _verify_admin(authorization)
-    player = db.query(Player).filter(Player.id == player_id).first()
+    player = await db.get(Player, player_id)
     if not player:
         raise HTTPException(status_code=404, detail="Player not found")
 
-    player.current_level = body.level
-    _log(db, player.session_id, "player_move_level", f"Moved to {body.level}", player_id=player.id)
-    db.commit()
+    player = await write_queue.submit(lambda wdb: wdb.scalars(_update_player(player_id, current_level=body.level)).one())
+    audit_log.record(player.session_id, "player_move_level", f"Moved to {body.level}", player_id=player.id)
+    session = await db.get(SessionModel, player.session_id)
+    leaderboard_index.upsert(player, session)
     return {"ok": True}
 
 
@@ -425,16 +443,19 @@ async def adjust_player_score(
     player_id: int,
     body: AdjustScoreRequest,
     authorization: str | None = Header(default=None, alias="Authorization"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     _verify_admin(authorization)
-    player = db.query(Player).filter(Player.id == player_id).first()
+    player = await db.get(Player, player_id)
     if not player:
         raise HTTPException(status_code=404, detail="Player not found")
 
-    player.score += body.delta
-    _log(db, player.session_id, "player_score_adjust", f"Score delta {body.delta}", player_id=player.id)
-    db.commit()
+    player = await write_queue.submit(
+        lambda wdb: wdb.scalars(_update_player(player_id, score=Player.score + body.delta)).one()
+    )
+    audit_log.record(player.session_id, "player_score_adjust", f"Score delta {body.delta}", player_id=player.id)
+    session = await db.get(SessionModel, player.session_id)
+    leaderboard_index.upsert(player, session)
     return {"ok": True, "new_score": player.score}
 
 
@@ -442,54 +463,114 @@ async def adjust_player_score(
 async def freeze_leaderboard(
     body: FreezeLeaderboardRequest,
     authorization: str | None = Header(default=None, alias="Authorization"),
-    db: Session = Depends(get_db),
 ):
     _verify_admin(authorization)
-    session = _current_live_session(db)
-    if not session:
+    live = session_state.live
+    if live is None:
         raise HTTPException(status_code=404, detail="No active session")
+    values = await leaderboard_freeze_values(live, body.frozen)
 
-    set_leaderboard_freeze(session, body.frozen)
-    _log(db, session.id, "leaderboard_freeze", f"Frozen={body.frozen}")
-    db.commit()
+    def freeze(session: SessionModel) -> None:
+        for field, value in values.items():
+            setattr(session, field, value)
 
-    await manager.broadcast(
-        "leaderboard_update",
-        {
-            "session_id": session.id,
-            "frozen": session.leaderboard_frozen,
-            "rows": get_leaderboard(session),
-        },
-    )
+    session, _ = await _write_live_session(freeze)
+    session_state.track(session)
+    audit_log.record(session.id, "leaderboard_freeze", f"Frozen={body.frozen}")
+
+    await publish_leaderboard(session)
 
     return {"ok": True, "frozen": session.leaderboard_frozen}
 
 
+@router.get("/realtime/metrics")
+async def realtime_metrics(authorization: str | None = Header(default=None, alias="Authorization")):
+    _verify_admin(authorization)
+    return manager.metrics()
+
+
+@router.get("/scheduler/metrics")
+async def scheduler_metrics(authorization: str | None = Header(default=None, alias="Authorization")):
+    _verify_admin(authorization)
+    return scheduler.metrics()
+
+
+@router.get("/questions")
+async def question_bank_status(authorization: str | None = Header(default=None, alias="Authorization")):
+    _verify_admin(authorization)
+    return question_sets.metrics()
+
+
+@router.post("/questions")
+async def upload_question_bank(
+    request: Request,
+    question_set: str | None = Query(default=None, alias="set"),
+    authorization: str | None = Header(default=None, alias="Authorization"),
+):
+    """Replace questions.json, or the named set (`?set=`), with the request body (the whole bank as JSON)."""
+    _verify_admin(authorization)
+    latest = session_state.latest
+    # Variants are picked modulo the pool size: don't reassign them under a live session.
+    pinned = latest is not None and latest.status in ("running", "paused") and latest.question_set == question_set
+    try:
+        bank = await question_sets.upload(question_set, await request.body(), pinned=pinned)
+    except QuestionBankError as exc:
+        raise HTTPException(status_code=400, detail=f"Invalid question bank: {exc}") from exc
+    if latest is not None:
+        target = f"Question set '{question_set}'" if question_set else "Question bank"
+        audit_log.record(latest.id, "question_bank_upload", f"{target} v{bank.version} ({bank.digest}) uploaded")
+    return {**bank.describe(), "set": question_set}
+
+
+@router.get("/cache/metrics")
+async def cache_metrics(authorization: str | None = Header(default=None, alias="Authorization")):
+    _verify_admin(authorization)
+    return response_cache.metrics()
+
+
+@router.get("/session/metrics")
+async def session_metrics(authorization: str | None = Header(default=None, alias="Authorization")):
+    _verify_admin(authorization)
+    return session_state.metrics()
+
+
+@router.get("/auth/metrics")
+async def auth_metrics(authorization: str | None = Header(default=None, alias="Authorization")):
+    _verify_admin(authorization)
+    return principal_cache.metrics()
+
+
+@router.get("/writes/metrics")
+async def write_queue_metrics(authorization: str | None = Header(default=None, alias="Authorization")):
+    _verify_admin(authorization)
+    return {**write_queue.metrics(), "presence": presence.metrics(), "audit_log": audit_log.metrics()}
+
+
 @router.get("/analytics/{session_id}")
 async def analytics(
     session_id: int,
     authorization: str | None = Header(default=None, alias="Authorization"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     _verify_admin(authorization)
-    session = db.query(SessionModel).filter(SessionModel.id == session_id).first()
+    session = await db.get(SessionModel, session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
-    return analytics_for_session(session)
+    return await analytics_for_session(session)
 
 
 @router.get("/export/{session_id}")
 async def export_csv(
     session_id: int,
     authorization: str | None = Header(default=None, alias="Authorization"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     _verify_admin(authorization)
-    session = db.query(SessionModel).filter(SessionModel.id == session_id).first()
+    session = await db.get(SessionModel, session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
 
-    rows = get_leaderboard(session)
+    rows = await get_leaderboard(session)
 
     output = io.StringIO()
     writer = csv.writer(output)
@@ -1,26 +1,32 @@
 from datetime import datetime
 
 from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from database import get_db
-from models import Log, Player, PlayerQuestionClear, SessionModel
+from models import Player, PlayerQuestionClear, SessionModel
 from schemas import AdminLoginRequest, RegisterRequest, ValidateTokenRequest
-from services.security import create_admin_token, create_player_token, decode_token
+from services.audit_log import audit_log
+from services.leaderboard import leaderboard_index
+from services.presence import presence
+from services.security import (
+    create_admin_token,
+    create_player_token,
+    decode_token,
+    principal_cache,
+    token_generation,
+)
+from services.session_clock import session_remaining_seconds
+from services.session_state import session_state
+from services.solved_questions import solved_questions
+from services.write_queue import write_queue
 
 router = APIRouter(prefix="/api", tags=["auth"])
 ADMIN_PASSWORD = "arena2026"
 
 
-def _get_live_session(db: Session) -> SessionModel | None:
-    return (
-        db.query(SessionModel)
-        .filter(SessionModel.status.in_(["waiting", "running", "paused"]))
-        .order_by(SessionModel.created_at.desc())
-        .first()
-    )
-
-
 @router.post("/admin_login")
 async def admin_login(body: AdminLoginRequest):
     if body.password != ADMIN_PASSWORD:
@@ -29,12 +35,12 @@ async def admin_login(body: AdminLoginRequest):
 
 
 @router.post("/player/register")
-async def register_player(body: RegisterRequest, request: Request, db: Session = Depends(get_db)):
+async def register_player(body: RegisterRequest, request: Request):
     username = body.username.strip()
     if not username:
         raise HTTPException(status_code=400, detail="Username is required")
 
-    active_session = _get_live_session(db)
+    active_session = session_state.live
     if not active_session:
         raise HTTPException(status_code=400, detail="No active session. Ask admin to create one.")
 
@@ -44,78 +50,64 @@ async def register_player(body: RegisterRequest, request: Request, db: Session =
         if active_session.status == "running" and active_session.start_time
         else datetime.utcnow()
     )
-    existing = db.query(Player).filter(Player.username == username).first()
 
-    if existing:
+    def register(wdb: Session) -> tuple[Player, bool | None]:
+        """The joined player, and whether it moved here from an older session (None: new player)."""
+        existing = wdb.scalar(select(Player).where(Player.username == username))
+        if existing is None:
+            player = Player(
+                username=username,
+                session_id=active_session.id,
+                score=0,
+                current_level=0,
+                join_time=baseline_join_time,
+                last_active=datetime.utcnow(),
+                ip_address=ip_address,
+                is_active=True,
+                is_banned=False,
+            )
+            wdb.add(player)
+            wdb.flush()
+            return player, None
+
         if existing.is_banned:
             raise HTTPException(status_code=403, detail="Player is banned")
 
-        if existing.session_id != active_session.id:
-            db.query(PlayerQuestionClear).filter(PlayerQuestionClear.player_id == existing.id).delete()
+        moved = existing.session_id != active_session.id
+        if moved:
+            wdb.execute(delete(PlayerQuestionClear).where(PlayerQuestionClear.player_id == existing.id))
             existing.session_id = active_session.id
             existing.score = 0
             existing.current_level = 0
             existing.join_time = baseline_join_time
             existing.completed_at = None
+            existing.completion_remaining_seconds = None
             existing.is_active = False
-            existing.auth_token = None
 
-        if existing.is_active and existing.auth_token:
+        # Kick, ban and session end all clear is_active along with revoking the token.
+        if existing.is_active:
             raise HTTPException(status_code=409, detail="Username already active on another device")
 
-        token = create_player_token(existing.id, existing.session_id, existing.username)
-        existing.auth_token = token
+        existing.token_generation += 1
         existing.last_active = datetime.utcnow()
         existing.is_active = True
         existing.ip_address = ip_address
-        db.add(
-            Log(
-                session_id=active_session.id,
-                player_id=existing.id,
-                action_type="player_rejoin",
-                details=f"Rejoined from {ip_address}",
-            )
-        )
-        db.commit()
-        db.refresh(existing)
-
-        return {
-            "token": token,
-            "session_id": active_session.id,
-            "username": existing.username,
-            "score": existing.score,
-            "current_level": existing.current_level,
-            "remaining_seconds": active_session.remaining_seconds,
-            "status": active_session.status,
-        }
-
-    player = Player(
-        username=username,
-        session_id=active_session.id,
-        score=0,
-        current_level=0,
-        join_time=baseline_join_time,
-        last_active=datetime.utcnow(),
-        ip_address=ip_address,
-        is_active=True,
-        is_banned=False,
-    )
-    db.add(player)
-    db.flush()
-
-    token = create_player_token(player.id, player.session_id, player.username)
-    player.auth_token = token
-
-    db.add(
-        Log(
-            session_id=active_session.id,
-            player_id=player.id,
-            action_type="player_join",
-            details=f"Joined from {ip_address}",
-        )
-    )
-    db.commit()
-    db.refresh(player)
+        return existing, moved
+
+    # Through the single writer: a burst of joins at session start never contends for the lock.
+    player, moved = await write_queue.submit(register)
+    token = create_player_token(player.id, player.session_id, player.username, player.token_generation)
+
+    if moved is None:
+        session_state.adjust_players(active_session.id, total=1, active=1)
+        audit_log.record(active_session.id, "player_join", f"Joined from {ip_address}", player_id=player.id)
+    else:
+        session_state.adjust_players(active_session.id, total=1 if moved else 0, active=1)
+        solved_questions.reset(player.id)
+        principal_cache.invalidate_player(player.id)  # the previous token was just replaced
+        audit_log.record(active_session.id, "player_rejoin", f"Rejoined from {ip_address}", player_id=player.id)
+    leaderboard_index.upsert(player, active_session)
+    presence.touch(player.id, player.session_id, player.token_generation)
 
     return {
         "token": token,
@@ -123,13 +115,13 @@ async def register_player(body: RegisterRequest, request: Request, db: Session =
         "username": player.username,
         "score": player.score,
         "current_level": player.current_level,
-        "remaining_seconds": active_session.remaining_seconds,
+        "remaining_seconds": session_remaining_seconds(active_session),
         "status": active_session.status,
     }
 
 
 @router.post("/validate-token")
-async def validate_token(body: ValidateTokenRequest, db: Session = Depends(get_db)):
+async def validate_token(body: ValidateTokenRequest, db: AsyncSession = Depends(get_db)):
     payload = decode_token(body.token)
     if payload.get("role") != "player":
         raise HTTPException(status_code=401, detail="Invalid token role")
@@ -138,26 +130,41 @@ async def validate_token(body: ValidateTokenRequest, db: Session = Depends(get_d
     if not player_id:
         raise HTTPException(status_code=401, detail="Invalid token")
 
-    player = db.query(Player).filter(Player.id == int(player_id)).first()
+    player = await db.get(Player, int(player_id))
     if not player:
         raise HTTPException(status_code=401, detail="Player not found")
     if player.is_banned:
         raise HTTPException(status_code=403, detail="Player is banned")
-    if player.auth_token != body.token:
+    if token_generation(payload) != player.token_generation:
         raise HTTPException(status_code=401, detail="Token expired due to another login")
 
-    session = db.query(SessionModel).filter(SessionModel.id == player.session_id).first()
+    session = await db.get(SessionModel, player.session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     if session.status == "ended":
-        player.auth_token = None
-        player.is_active = False
-        db.commit()
+        player_id, generation = player.id, player.token_generation
+
+        def revoke(wdb: Session) -> bool:
+            """Whether the player was active; a token replaced meanwhile is left alone."""
+            current = select(Player.is_active).where(Player.id == player_id, Player.token_generation == generation)
+            was_active = wdb.scalar(current)
+            if was_active is None:
+                return False
+            wdb.execute(
+                update(Player)
+                .where(Player.id == player_id)
+                .values(token_generation=Player.token_generation + 1, is_active=False)
+                .execution_options(synchronize_session=False)
+            )
+            return was_active
+
+        was_active = await write_queue.submit(revoke)
+        principal_cache.invalidate_player(player.id)
+        if was_active:
+            session_state.adjust_players(player.session_id, active=-1)
         raise HTTPException(status_code=401, detail="Session ended. Please join the current session.")
 
-    player.last_active = datetime.utcnow()
-    player.is_active = True
-    db.commit()
+    presence.touch(player.id, player.session_id, player.token_generation)
 
     return {
         "valid": True,
@@ -165,6 +172,6 @@ async def validate_token(body: ValidateTokenRequest, db: Session = Depends(get_d
         "session_id": player.session_id,
         "score": player.score,
         "current_level": player.current_level,
-        "remaining_seconds": session.remaining_seconds,
+        "remaining_seconds": session_remaining_seconds(session),
         "session_status": session.status,
     }
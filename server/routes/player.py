@@ -1,49 +1,39 @@
 from datetime import datetime
 
 from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import func, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from database import get_db
-from models import Log, Player, PlayerQuestionClear, SessionModel
+from models import Player, PlayerQuestionClear, SessionModel
 from schemas import PlayerEventRequest, SubmitAnswerRequest, SubmitCodeRequest, SyncStateRequest
+from services.audit_log import audit_log
+from services.leaderboard import leaderboard_index
 from services.ollama_judge import judge_code
-from services.security import get_current_player
+from services.presence import presence
+from services.question_bank import question_sets
+from services.realtime import manager, player_topic
+from services.security import PlayerPrincipal, get_current_player, get_current_principal
+from services.session_clock import session_remaining_seconds
+from services.session_state import session_state
+from services.solved_questions import solved_questions
+from services.write_queue import write_queue
 
 router = APIRouter(prefix="/api", tags=["player"])
 
-# Per-level scoring: maps (level, path_hint) -> points for correct answer
-# path_hint is derived from question_id prefix: "e" for easy, "h" for hard, None for flat
-SCORE_TABLE = {
-    (0, None): 10,
-    (1, None): 15,
-    (2, None): 20,
-    (3, "e"): 10,
-    (3, "h"): 40,
-    (4, "e"): 15,
-    (4, "h"): 60,
-}
-
-
-def _path_hint_from_qid(question_id: str) -> str | None:
-    """Detect easy/hard from question ID convention: q3_e1 -> 'e', q3_h1 -> 'h'."""
-    parts = question_id.split("_")
-    if len(parts) >= 2:
-        tag = parts[1]
-        if tag.startswith("e"):
-            return "e"
-        if tag.startswith("h"):
-            return "h"
-    return None
-
-
-def _normalize_answer(value: str | None) -> str:
-    if value is None:
-        return ""
-    return " ".join(str(value).strip().split()).casefold()
-
-
-def _ensure_session_running(db: Session, player: Player) -> SessionModel:
-    session = db.query(SessionModel).filter(SessionModel.id == player.session_id).first()
+
+async def _player_session(db: AsyncSession, session_id: int) -> SessionModel | None:
+    """The player's session: the in-memory snapshot when it is the newest one (almost always)."""
+    latest = session_state.latest
+    if latest is not None and latest.id == session_id:
+        return latest
+    return await db.get(SessionModel, session_id)
+
+
+async def _ensure_session_running(db: AsyncSession, player: Player | PlayerPrincipal) -> SessionModel:
+    session = await _player_session(db, player.session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     if session.status not in ("running", "paused", "waiting"):
@@ -51,120 +41,130 @@ def _ensure_session_running(db: Session, player: Player) -> SessionModel:
     return session
 
 
-def _get_question_by_id(level_data: dict, q_id: str):
-    for key in ("questions", "easy", "hard"):
-        if key in level_data:
-            for q in level_data[key]:
-                if q.get("id") == q_id:
-                    return q
-    if "hidden_route" in level_data:
-        for q in level_data["hidden_route"].get("questions", []):
-            if q.get("id") == q_id:
-                return q
-    return None
+# Player fields read after a queued write commits (responses, leaderboard index).
+_SNAPSHOT_FIELDS = (
+    "id",
+    "session_id",
+    "username",
+    "score",
+    "current_level",
+    "join_time",
+    "completed_at",
+    "completion_remaining_seconds",
+    "is_banned",
+)
+
+
+_SNAPSHOT_COLUMNS = [getattr(Player, field) for field in _SNAPSHOT_FIELDS]
+
+_INSERT_CLEAR = sqlite_insert(PlayerQuestionClear.__table__).on_conflict_do_nothing(
+    index_elements=["player_id", "question_id"]
+)
+
+
+def _snapshot(player: Player) -> Player:
+    """Transient copy of a player loaded by a write intent, safe to read once its batch is done."""
+    return Player(**{field: getattr(player, field) for field in _SNAPSHOT_FIELDS})
+
+
+async def _current_score(db: AsyncSession, session: SessionModel, player_id: int) -> int:
+    score = leaderboard_index.cached_score(session.id, player_id)
+    if score is None:
+        score = await db.scalar(select(Player.score).where(Player.id == player_id))
+    return score
 
 
 @router.post("/player/heartbeat")
-async def heartbeat(player: Player = Depends(get_current_player), db: Session = Depends(get_db)):
-    player.last_active = datetime.utcnow()
-    player.is_active = True
-    db.commit()
+async def heartbeat(player: PlayerPrincipal = Depends(get_current_principal)):
+    # A principal cached on this worker can outlive a kick or ban on another one until the
+    # broker invalidation arrives; a touch is harmless then (the flush checks the generation).
+    presence.touch(player.id, player.session_id, player.generation)
     return {"ok": True}
 
 
 @router.post("/player/activity")
-async def player_activity(
-    body: PlayerEventRequest,
-    player: Player = Depends(get_current_player),
-    db: Session = Depends(get_db),
-):
-    player.last_active = datetime.utcnow()
-    db.add(
-        Log(
-            session_id=player.session_id,
-            player_id=player.id,
-            action_type=f"player_event:{body.event_type}",
-            details=body.details,
-        )
-    )
-    db.commit()
+async def player_activity(body: PlayerEventRequest, player: PlayerPrincipal = Depends(get_current_principal)):
+    # Like heartbeat, tolerates a just-revoked cached principal: it only touches and audits.
+    presence.touch(player.id, player.session_id, player.generation)
+    audit_log.record(player.session_id, f"player_event:{body.event_type}", body.details, player_id=player.id)
     return {"ok": True}
 
 
 @router.post("/submit_answer")
 async def submit_answer(
     body: SubmitAnswerRequest,
-    player: Player = Depends(get_current_player),
-    db: Session = Depends(get_db),
+    player: PlayerPrincipal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db),
 ):
-    session = _ensure_session_running(db, player)
+    session = await _ensure_session_running(db, player)
     if session.status != "running":
         raise HTTPException(status_code=403, detail="Session is not currently running")
 
-    from routes.session import QUESTIONS
-
-    level_key = str(body.level)
-    if level_key not in QUESTIONS:
-        raise HTTPException(status_code=404, detail="Level not found")
-
-    question = _get_question_by_id(QUESTIONS[level_key], body.question_id)
-    if not question:
+    bank = await question_sets.for_session(session)
+    question = bank.index.get((body.level, body.question_id))
+    if question is None:
+        if str(body.level) not in bank.questions:
+            raise HTTPException(status_code=404, detail="Level not found")
         raise HTTPException(status_code=404, detail="Question not found")
 
-    already_cleared = (
-        db.query(PlayerQuestionClear)
-        .filter(
-            PlayerQuestionClear.player_id == player.id,
-            PlayerQuestionClear.question_id == body.question_id,
+    presence.touch(player.id, player.session_id, player.generation)
+    if body.question_id in await solved_questions.of(db, player.id):
+        return {"status": "already_answered", "new_score": await _current_score(db, session, player.id)}
+    if not question.is_correct(body.answer, question.variant_for(session.question_seed, player.id)):
+        return {"status": "wrong", "new_score": await _current_score(db, session, player.id)}
+
+    player_id, session_id = player.id, player.session_id
+    clear = {"player_id": player_id, "session_id": session_id, "question_id": body.question_id, "level": body.level}
+    # The principal may be cached from before a kick or ban on another worker: credit
+    # only a row still at its token generation and not banned.
+    credit_player = (
+        update(Player)
+        .where(
+            Player.id == player_id,
+            Player.token_generation == player.generation,
+            Player.is_banned.is_(False),
         )
-        .first()
+        .values(score=Player.score + question.points, current_level=func.max(Player.current_level, body.level))
+        .returning(*_SNAPSHOT_COLUMNS)
+        .execution_options(synchronize_session=False)
     )
 
-    if already_cleared:
-        player.last_active = datetime.utcnow()
-        db.commit()
-        return {"status": "already_answered", "new_score": player.score}
-
-    expected_answer = _normalize_answer(question.get("answer"))
-    submitted_answer = _normalize_answer(body.answer)
-    is_correct = expected_answer == submitted_answer
-    player.last_active = datetime.utcnow()
-
-    if is_correct:
-        db.add(
-            PlayerQuestionClear(
-                player_id=player.id,
-                session_id=player.session_id,
-                question_id=body.question_id,
-                level=body.level,
-            )
-        )
-        hint = _path_hint_from_qid(body.question_id)
-        points = SCORE_TABLE.get((body.level, hint), 10)
-        player.score += points
-        player.current_level = max(player.current_level, body.level)
-        db.add(
-            Log(
-                session_id=player.session_id,
-                player_id=player.id,
-                action_type="level_complete",
-                details=f"Level {body.level} question {body.question_id} solved",
-            )
-        )
-        db.commit()
-        return {"status": "correct", "new_score": player.score}
-
-    db.commit()
-    return {"status": "wrong", "new_score": player.score}
+    def credit(wdb: Session) -> Player | None:
+        # The unique (player_id, question_id) clear is the guard: only the request
+        # that inserts it scores, so duplicate submits can never credit twice.
+        if wdb.execute(_INSERT_CLEAR, clear).rowcount != 1:
+            return None
+        row = wdb.execute(credit_player).one_or_none()
+        if row is None:
+            # Raising rolls the clear back with the rest of this intent.
+            banned = wdb.execute(select(Player.is_banned).where(Player.id == player_id)).scalar()
+            if banned:
+                raise HTTPException(status_code=403, detail="Player is banned")
+            raise HTTPException(status_code=401, detail="Token no longer valid")
+        return Player(**row._mapping)
+
+    credited = await write_queue.submit(credit)
+    solved_questions.add(player_id, body.question_id)
+    if credited is None:
+        # Cleared already, possibly by a concurrent submit from another tab.
+        return {"status": "already_answered", "new_score": await _current_score(db, session, player_id)}
+    audit_log.record(
+        credited.session_id,
+        "level_complete",
+        f"Level {body.level} question {body.question_id} solved",
+        player_id=player_id,
+    )
+    leaderboard_index.upsert(credited, session)
+    return {"status": "correct", "new_score": credited.score}
 
 
 @router.post("/submit_code")
 async def submit_code(
     body: SubmitCodeRequest,
     player: Player = Depends(get_current_player),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
-    session = _ensure_session_running(db, player)
+    session = await _ensure_session_running(db, player)
     if session.status != "running":
         raise HTTPException(status_code=403, detail="Session is not currently running")
 
@@ -174,15 +174,26 @@ async def submit_code(
     if player.code_attempted:
         return {"status": "WRONG", "already_attempted": True}
 
+    player_id, session_id = player.id, player.session_id
+    presence.touch(player_id, session_id, player.token_generation)
+
+    def claim_attempt(wdb: Session) -> bool:
+        result = wdb.execute(
+            update(Player)
+            .where(Player.id == player_id, Player.code_attempted.is_(False), Player.completed_at.is_(None))
+            .values(code_attempted=True)
+            .execution_options(synchronize_session=False)
+        )
+        return result.rowcount == 1
+
     # Mark attempt immediately so retries are blocked even if the request crashes.
-    player.code_attempted = True
-    player.last_active = datetime.utcnow()
-    db.commit()
+    if not await write_queue.submit(claim_attempt):
+        return {"status": "WRONG", "already_attempted": True}
 
     # Pull the coding question text so the model has full context.
-    from routes.session import QUESTIONS
+    bank = await question_sets.for_session(session)
     question_text = (
-        QUESTIONS.get("5", {})
+        bank.questions.get("5", {})
         .get("question", {})
         .get("text", "Solve the given programming problem.")
     )
@@ -190,104 +201,126 @@ async def submit_code(
     # Ask Ollama (qwen2.5-coder:1.5b) to judge the submission.
     correct = await judge_code(question_text, body.code)
 
+    def record_verdict(wdb: Session) -> tuple[Player, bool]:
+        """The judged player, and whether this verdict is what completed the game."""
+        if not correct:
+            return _snapshot(wdb.get(Player, player_id)), False
+        # /player/complete may have finished the game while the code was being judged:
+        # the points still count, but the first completion keeps its time.
+        newly_completed = (
+            wdb.execute(
+                update(Player)
+                .where(Player.id == player_id, Player.completed_at.is_(None))
+                .values(completed_at=datetime.utcnow(), completion_remaining_seconds=session_remaining_seconds(session))
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            == 1
+        )
+        row = wdb.execute(
+            update(Player)
+            .where(Player.id == player_id)
+            .values(score=Player.score + 100, current_level=func.max(Player.current_level, 6))
+            .returning(*_SNAPSHOT_COLUMNS)
+            .execution_options(synchronize_session=False)
+        ).one()
+        return Player(**row._mapping), newly_completed
+
+    judged, newly_completed = await write_queue.submit(record_verdict)
     if correct:
-        player.score += 100
-        player.current_level = max(player.current_level, 6)
-        player.completed_at = datetime.utcnow()
-        db.add(
-            Log(
-                session_id=player.session_id,
-                player_id=player.id,
-                action_type="final_challenge_complete",
-                details=f"Coding challenge solved; remaining_seconds={session.remaining_seconds}",
-            )
+        audit_log.record(
+            session_id,
+            "final_challenge_complete",
+            f"Coding challenge solved; remaining_seconds={judged.completion_remaining_seconds}",
+            player_id=player_id,
         )
+        leaderboard_index.upsert(judged, session)
+        if newly_completed:
+            session_state.adjust_players(session_id, completed=1)
     else:
-        db.add(
-            Log(
-                session_id=player.session_id,
-                player_id=player.id,
-                action_type="final_challenge_failed",
-                details="Coding challenge submission judged WRONG",
-            )
+        audit_log.record(
+            session_id, "final_challenge_failed", "Coding challenge submission judged WRONG", player_id=player_id
         )
-
-    db.commit()
-    return {"status": "CORRECT" if correct else "WRONG", "new_score": player.score}
+    verdict = {"status": "CORRECT" if correct else "WRONG", "new_score": judged.score}
+    await manager.broadcast("judge_verdict", verdict, topic=player_topic(player_id))
+    return verdict
 
 
 @router.post("/sync")
 async def sync_state(
     body: SyncStateRequest,
     player: Player = Depends(get_current_player),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     """Accept client-side score/level updates (e.g. cutscene bonuses) and
     persist them to the database so the leaderboard stays in sync."""
-    session = _ensure_session_running(db, player)
+    session = await _ensure_session_running(db, player)
     if session.status != "running":
         raise HTTPException(status_code=403, detail="Session is not currently running")
 
-    changed = False
-
-    if body.score != player.score:
-        old_score = player.score
-        player.score = body.score
-        db.add(
-            Log(
-                session_id=player.session_id,
-                player_id=player.id,
-                action_type="sync_score",
-                details=f"Score synced from {old_score} to {body.score}",
-            )
-        )
-        changed = True
-
-    if body.current_level > player.current_level:
-        old_level = player.current_level
-        player.current_level = body.current_level
-        db.add(
-            Log(
-                session_id=player.session_id,
-                player_id=player.id,
-                action_type="sync_level",
-                details=f"Level synced from {old_level} to {body.current_level}",
-            )
-        )
-        changed = True
+    presence.touch(player.id, player.session_id, player.token_generation)
+    if body.score == player.score and body.current_level <= player.current_level:
+        return {"ok": True, "score": player.score, "current_level": player.current_level}
+
+    player_id = player.id
+
+    def apply_sync(wdb: Session) -> tuple[Player, list[tuple[str, str]]]:
+        current = wdb.get(Player, player_id)
+        events = []
+
+        if body.score != current.score:
+            events.append(("sync_score", f"Score synced from {current.score} to {body.score}"))
+            current.score = body.score
+
+        if body.current_level > current.current_level:
+            events.append(("sync_level", f"Level synced from {current.current_level} to {body.current_level}"))
+            current.current_level = body.current_level
 
-    if changed:
-        player.last_active = datetime.utcnow()
-        db.commit()
+        return _snapshot(current), events
 
-    return {"ok": True, "score": player.score, "current_level": player.current_level}
+    synced, events = await write_queue.submit(apply_sync)
+    for action_type, details in events:
+        audit_log.record(synced.session_id, action_type, details, player_id=player_id)
+    if events:
+        leaderboard_index.upsert(synced, session)
+
+    return {"ok": True, "score": synced.score, "current_level": synced.current_level}
 
 
 @router.post("/player/complete")
 async def mark_complete(
     player: Player = Depends(get_current_player),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     """Mark the player as having completed the game.  Freezes timer and
     ensures current_level reflects the final level (5)."""
-    session = db.query(SessionModel).filter(SessionModel.id == player.session_id).first()
+    session = await _player_session(db, player.session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
 
     if player.completed_at is not None:
         return {"ok": True, "already_completed": True}
 
-    player.completed_at = datetime.utcnow()
-    player.current_level = max(player.current_level, 5)
-    player.last_active = datetime.utcnow()
+    player_id = player.id
+    presence.touch(player_id, player.session_id, player.token_generation)
 
-    db.add(
-        Log(
-            session_id=player.session_id,
-            player_id=player.id,
-            action_type="game_complete",
-            details=f"Player marked game complete; remaining_seconds={session.remaining_seconds}",
-        )
+    def complete(wdb: Session) -> Player | None:
+        current = wdb.get(Player, player_id)
+        if current.completed_at is not None:
+            return None
+        current.completed_at = datetime.utcnow()
+        current.completion_remaining_seconds = session_remaining_seconds(session)
+        current.current_level = max(current.current_level, 5)
+        return _snapshot(current)
+
+    completed = await write_queue.submit(complete)
+    if completed is None:
+        return {"ok": True, "already_completed": True}
+    audit_log.record(
+        completed.session_id,
+        "game_complete",
+        f"Player marked game complete; remaining_seconds={completed.completion_remaining_seconds}",
+        player_id=player_id,
     )
-    db.commit()
-    return {"ok": True, "score": player.score, "current_level": player.current_level}
+    leaderboard_index.upsert(completed, session)
+    session_state.adjust_players(completed.session_id, completed=1)
+    return {"ok": True, "score": completed.score, "current_level": completed.current_level}
@@ -1,52 +1,33 @@
 import json
 import logging
-import os
 from contextlib import suppress
 
-from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from sqlalchemy import select
 
-from database import get_db
-from models import Player, SessionModel
-from services.leaderboard import get_leaderboard
-from services.realtime import manager
+from database import AsyncSessionLocal
+from models import SessionModel
+from services.leaderboard import get_leaderboard, leaderboard_index
+from services.leaderboard_feed import leaderboard_feed
+from services.question_bank import question_sets
+from services.realtime import ADMIN_TOPIC, manager, player_topic, session_topic
+from services.response_cache import response_cache
+from services.security import PlayerPrincipal, decode_token, oauth2_scheme, resolve_principal
+from services.session_clock import session_remaining_seconds
+from services.session_state import session_state
 
 router = APIRouter(tags=["session"])
 logger = logging.getLogger(__name__)
 
-_questions_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "questions.json")
-with open(_questions_path, "r", encoding="utf-8") as file:
-    QUESTIONS = json.load(file)
 
-
-def get_current_session(db: Session) -> SessionModel | None:
-    return (
-        db.query(SessionModel)
-        .filter(SessionModel.status.in_(["waiting", "running", "paused"]))
-        .order_by(SessionModel.created_at.desc())
-        .first()
-    )
+@router.get("/api/game_status")
+async def game_status():
+    return await response_cache.get("game_status", (), session_state.version, _game_status)
 
 
-@router.get("/api/game_status")
-async def game_status(db: Session = Depends(get_db)):
-    session = get_current_session(db)
+async def _game_status() -> dict:
+    session = session_state.latest
     if not session:
-        latest = db.query(SessionModel).order_by(SessionModel.created_at.desc()).first()
-        if latest:
-            player_count = (
-                db.query(Player)
-                .filter(Player.session_id == latest.id, Player.is_banned.is_(False))
-                .count()
-            )
-            return {
-                "session_id": latest.id,
-                "name": latest.name,
-                "status": latest.status,
-                "remaining_seconds": latest.remaining_seconds,
-                "duration_minutes": latest.duration_minutes,
-                "player_count": player_count,
-            }
         return {
             "session_id": None,
             "name": None,
@@ -54,59 +35,131 @@ async def game_status(db: Session = Depends(get_db)):
             "remaining_seconds": 0,
             "duration_minutes": 0,
             "player_count": 0,
+            "active_count": 0,
+            "completed_count": 0,
         }
 
-    player_count = (
-        db.query(Player)
-        .filter(Player.session_id == session.id, Player.is_banned.is_(False))
-        .count()
-    )
-
+    counts = session_state.player_counts
     return {
         "session_id": session.id,
         "name": session.name,
         "status": session.status,
-        "remaining_seconds": session.remaining_seconds,
+        "remaining_seconds": session_remaining_seconds(session),
         "duration_minutes": session.duration_minutes,
-        "player_count": player_count,
+        "player_count": session_state.player_count,
+        "active_count": counts["active"],
+        "completed_count": counts["completed"],
     }
 
 
-@router.get("/api/questions/{level}")
-async def get_questions(level: int, path: str | None = None):
-    key = str(level)
-    if key not in QUESTIONS:
-        raise HTTPException(status_code=404, detail="Level not found")
-
-    level_data = QUESTIONS[key]
-
-    if "easy" in level_data and "hard" in level_data:
-        if path in ("easy", "hard"):
-            return {"questions": level_data[path], "title": level_data["title"]}
-        return {
-            "message": "Choose path",
-            "paths": ["easy", "hard"],
-            "title": level_data["title"],
-        }
-
-    if level == 1 and path == "backlog_king":
-        return {"questions": level_data["hidden_route"]["questions"], "title": "Backlog King Route"}
+async def _optional_player(token: str | None) -> tuple[PlayerPrincipal | None, SessionModel | None]:
+    """The caller and its session if a valid player token came with the request."""
+    if not token:
+        return None, None
+    latest = session_state.latest
+    async with AsyncSessionLocal() as db:
+        try:
+            player = await resolve_principal(db, token)
+        except HTTPException:
+            return None, None  # a stale token still gets the shared questions
+        if latest is not None and latest.id == player.session_id:
+            return player, latest
+        return player, await db.get(SessionModel, player.session_id)
 
-    if "questions" in level_data:
-        return {"questions": level_data["questions"], "title": level_data["title"]}
 
-    if "question" in level_data:
-        return {"question": level_data["question"], "title": level_data["title"]}
+@router.get("/api/questions/{level}")
+async def get_questions(
+    level: int,
+    request: Request,
+    path: str | None = None,
+    token: str | None = Depends(oauth2_scheme),
+):
+    player, session = await _optional_player(token)
+    session = session or session_state.latest
+    bank = await question_sets.for_session(session) if session else question_sets.default.current
+    responses = bank.responses.get(level)
+    if responses is None:
+        raise HTTPException(status_code=404, detail="Level not found")
+    if path not in responses:
+        path = None
 
-    return level_data
+    if level in bank.variant_levels:
+        # Every player gets their own variants of this level's questions.
+        if player is None:
+            raise HTTPException(status_code=401, detail="Sign in to get this level's questions")
+        return bank.player_response(level, path, session.question_seed, player.id).respond(request)
+    return responses[path].respond(request)
 
 
 @router.get("/api/leaderboard")
-async def leaderboard(db: Session = Depends(get_db)):
-    session = get_current_session(db)
+async def leaderboard(limit: int | None = Query(default=None, ge=1)):
+    session = session_state.live
     if not session:
         return []
-    return get_leaderboard(session)
+    version = (session_state.version, leaderboard_index.version)
+    return await response_cache.get("leaderboard", (limit,), version, lambda: get_leaderboard(session, limit))
+
+
+async def _send_leaderboard_snapshots(websocket: WebSocket) -> None:
+    session_ids = [
+        int(topic.split(":", 1)[1]) for topic in manager.topics_of(websocket) if topic.startswith("session:")
+    ]
+    if not session_ids:
+        return
+    async with AsyncSessionLocal() as db:
+        sessions = (await db.scalars(select(SessionModel).where(SessionModel.id.in_(session_ids)))).all()
+    payloads = [await leaderboard_feed.snapshot(session) for session in sessions]
+    for payload in payloads:
+        # None: this worker has no copy yet and the leader will publish one to the topic.
+        if payload is not None:
+            await manager.send(websocket, "leaderboard_snapshot", payload)
+
+
+async def _authorize_topics(message: dict) -> set[str]:
+    """Resolve the topics a subscribe message may listen to, from its JWT."""
+    token = str(message.get("token") or "")
+    requested = message.get("topics")
+    async with AsyncSessionLocal() as db:
+        if decode_token(token).get("role") == "admin":
+            if requested:
+                return {str(topic) for topic in requested}
+            live = session_state.live
+            return {ADMIN_TOPIC, session_topic(live.id)} if live else {ADMIN_TOPIC}
+
+        player = await resolve_principal(db, token)
+        allowed = {player_topic(player.id), session_topic(player.session_id)}
+
+    # A player gets only its own topic unless it asks for the session's leaderboard feed,
+    # so the feed is not fanned out to every player socket that never renders it.
+    topics = {str(topic) for topic in requested} if requested else {player_topic(player.id)}
+    if not topics <= allowed:
+        raise HTTPException(status_code=403, detail="Topic not allowed")
+    return topics
+
+
+async def _handle_client_message(websocket: WebSocket, text: str) -> None:
+    if text.strip() == "resync":
+        await _send_leaderboard_snapshots(websocket)
+        return
+    try:
+        message = json.loads(text)
+    except json.JSONDecodeError:
+        return  # legacy "subscribe" pings carry no token
+    if not isinstance(message, dict):
+        return
+
+    action = message.get("action")
+    if action == "resync":
+        await _send_leaderboard_snapshots(websocket)
+    elif action == "subscribe":
+        try:
+            topics = await _authorize_topics(message)
+        except HTTPException as exc:
+            await manager.send(websocket, "subscribe_error", {"detail": exc.detail})
+            return
+        manager.subscribe(websocket, topics)
+        await manager.send(websocket, "subscribed", {"topics": sorted(topics)})
+        await _send_leaderboard_snapshots(websocket)
 
 
 @router.websocket("/ws/live")
@@ -114,7 +167,7 @@ async def live_ws(websocket: WebSocket):
     await manager.connect(websocket)
     try:
         while True:
-            await websocket.receive_text()
+            await _handle_client_message(websocket, await websocket.receive_text())
     except WebSocketDisconnect:
         pass
     except OSError as exc:
@@ -8,6 +8,7 @@ class AdminLoginRequest(BaseModel):
 class CreateSessionRequest(BaseModel):
     name: str = Field(min_length=1, max_length=120)
     duration_minutes: int = Field(default=30, ge=5, le=240)
+    question_set: str | None = Field(default=None, max_length=64)
 
 
 class RegisterRequest(BaseModel):
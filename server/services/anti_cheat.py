@@ -1,23 +1,18 @@
 from collections import Counter
-from datetime import datetime, timedelta
 
+from sqlalchemy import update
 from sqlalchemy.orm import Session
 
 from models import Player
 
 
-def mark_inactive_players(db: Session, timeout_minutes: int = 5) -> int:
-    threshold = datetime.utcnow() - timedelta(minutes=timeout_minutes)
-    stale_players = (
-        db.query(Player)
-        .filter(Player.is_active.is_(True), Player.last_active < threshold)
-        .all()
-    )
-    for player in stale_players:
-        player.is_active = False
-    if stale_players:
-        db.commit()
-    return len(stale_players)
+def mark_inactive_players(db: Session, player_ids: list[int]) -> int:
+    """Flag players inactive; the inactivity sweep picks them from the presence map."""
+    if not player_ids:
+        return 0
+    stmt = update(Player).where(Player.id.in_(player_ids), Player.is_active.is_(True))
+    result = db.execute(stmt.values(is_active=False).execution_options(synchronize_session=False))
+    return result.rowcount
 
 
 def duplicate_ip_map(players: list[Player]) -> dict[str, int]:
@@ -0,0 +1,167 @@
+"""
+Batched audit-log pipeline for the `logs` table.
+
+Routes used to add a `Log` row to their own transaction for every join,
+solve, sync, client event and admin action.  They now `record()` a
+structured event instead: a synchronous append to a bounded in-process
+buffer that never touches the database.  A background task drains the
+buffer every `FLUSH_INTERVAL_SECONDS`, or as soon as `FLUSH_ROWS` events
+are waiting, and bulk-inserts them with one executemany through the write
+queue, so audit rows ride along with the single writer instead of
+competing with it.
+
+The buffer holds at most `MAX_PENDING` events.  Once it is full (the
+database has been unwritable for a while) new events are dropped and
+counted rather than blocking or growing without bound; a batch that fails
+to insert is put back once and dropped if it fails again.  `stop()` flushes
+whatever is left, so a clean shutdown loses nothing.
+
+Audit rows therefore land up to one flush interval after the change they
+describe, and are not rolled back with it: they record what a request did,
+not part of its state.
+"""
+
+import asyncio
+import logging
+import os
+from collections import Counter, deque
+from datetime import datetime
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from models import Log
+from services.write_queue import write_queue
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL_SECONDS = float(os.getenv("QUESTARENA_AUDIT_FLUSH_MS", "250")) / 1000
+FLUSH_ROWS = 500
+MAX_PENDING = 20_000
+
+_LOG_INSERT = insert(Log.__table__)
+
+
+class AuditLog:
+    def __init__(
+        self,
+        interval: float = FLUSH_INTERVAL_SECONDS,
+        flush_rows: int = FLUSH_ROWS,
+        max_pending: int = MAX_PENDING,
+    ):
+        self._interval = interval
+        self._flush_rows = flush_rows
+        self._max_pending = max_pending
+        self._pending: deque[dict] = deque()
+        self._wake: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+        self._stopping = False
+        self._retrying = False
+        self.enqueued = 0
+        self.flushes = 0
+        self.rows_flushed = 0
+        self.flush_failures = 0
+        self.dropped = 0
+        self._dropped_by_action: Counter[str] = Counter()
+
+    def record(
+        self,
+        session_id: int,
+        action_type: str,
+        details: str | None = None,
+        player_id: int | None = None,
+    ) -> None:
+        """Queue one audit event; returns immediately."""
+        if len(self._pending) >= self._max_pending:
+            self._drop([action_type])
+            return
+        self._pending.append(
+            {
+                "session_id": session_id,
+                "player_id": player_id,
+                "action_type": action_type,
+                "details": details,
+                "timestamp": datetime.utcnow(),
+            }
+        )
+        self.enqueued += 1
+        if self._wake is not None and len(self._pending) >= self._flush_rows:
+            self._wake.set()
+
+    async def flush(self) -> int:
+        """Insert everything queued so far; returns the number of rows written."""
+        if not self._pending:
+            return 0
+        batch = list(self._pending)
+        self._pending.clear()
+        try:
+            await write_queue.submit(lambda db: _insert_logs(db, batch))
+        except Exception:
+            self.flush_failures += 1
+            if self._retrying:
+                logger.exception("Dropping %d audit events after a second failed insert", len(batch))
+                self._retrying = False
+                self._drop([row["action_type"] for row in batch])
+            else:
+                logger.exception("Audit log flush of %d events failed; retrying on the next flush", len(batch))
+                self._retrying = True
+                room = self._max_pending - len(self._pending)
+                self._drop([row["action_type"] for row in batch[room:]])
+                self._pending.extendleft(reversed(batch[:room]))
+            return 0
+        self._retrying = False
+        self.flushes += 1
+        self.rows_flushed += len(batch)
+        return len(batch)
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._stopping = False
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the flusher after writing out everything still queued."""
+        if self._task is not None:
+            self._stopping = True
+            self._wake.set()
+            await self._task
+            self._task = self._wake = None
+        await self.flush()
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self._interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    def _drop(self, action_types: list[str]) -> None:
+        if not action_types:
+            return
+        self.dropped += len(action_types)
+        self._dropped_by_action.update(action_types)
+
+    def metrics(self) -> dict:
+        return {
+            "running": self._task is not None,
+            "pending": len(self._pending),
+            "max_pending": self._max_pending,
+            "flush_interval_ms": self._interval * 1000,
+            "flush_rows": self._flush_rows,
+            "enqueued": self.enqueued,
+            "flushes": self.flushes,
+            "rows_flushed": self.rows_flushed,
+            "flush_failures": self.flush_failures,
+            "dropped": self.dropped,
+            "dropped_by_action": dict(self._dropped_by_action.most_common(10)),
+        }
+
+
+def _insert_logs(db: Session, rows: list[dict]) -> None:
+    db.execute(_LOG_INSERT, rows)  # one executemany for the whole batch
+
+
+audit_log = AuditLog()
@@ -0,0 +1,225 @@
+"""
+Pub/sub backends that carry realtime events between worker processes.
+
+    local  (default)  in-process delivery; one uvicorn worker holds every socket
+    hub               a built-in TCP hub on 127.0.0.1; run with several workers
+
+In hub mode every worker tries to bind the hub address at startup.  The one
+that succeeds hosts the hub and becomes the leader (it runs the session
+timer); all workers, the leader included, connect to the hub as clients.
+The hub relays every frame to every client in the order it received them,
+so all workers observe the same total order and each publisher's messages
+stay FIFO.  If the hub process exits, the survivors reconnect and one of
+them takes the hub (and the leadership) over.
+
+Writes are never awaited, so buffers are bounded instead: a connection
+whose unsent frames pass `BUFFER_LIMIT_BYTES` (a peer that stopped
+reading, or a hub that did) is dropped and reconnects.  Frames can be lost
+whenever a connection drops, so after every reconnect the worker publishes
+on `RESYNC_CHANNEL`; each worker's state listeners then rebuild what they
+mirror from the database rather than trust the gap.
+
+Configuration:
+    QUESTARENA_BROKER        "local" or "hub"
+    QUESTARENA_BROKER_HOST   hub bind address (default 127.0.0.1)
+    QUESTARENA_BROKER_PORT   hub port (default 8765)
+"""
+
+import asyncio
+import json
+import logging
+import os
+import struct
+from collections import defaultdict, deque
+from contextlib import suppress
+from typing import Any, Callable
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the stdlib encoder
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+BROKER_MODE = os.getenv("QUESTARENA_BROKER", "local").strip().lower()
+HUB_HOST = os.getenv("QUESTARENA_BROKER_HOST", "127.0.0.1")
+HUB_PORT = int(os.getenv("QUESTARENA_BROKER_PORT", "8765"))
+
+_HEADER = struct.Struct("!I")
+_RECONNECT_DELAY_SECONDS = 0.2
+BUFFER_LIMIT_BYTES = 8 * 1024 * 1024
+# Frames published while disconnected; older ones are dropped (the resync covers them).
+PENDING_LIMIT = 10_000
+RESYNC_CHANNEL = "resync"
+
+Handler = Callable[[Any], None]
+
+
+def _dumps(value: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(",", ":")).encode("utf-8")
+
+
+async def _read_frame(reader: asyncio.StreamReader) -> bytes:
+    header = await reader.readexactly(_HEADER.size)
+    (length,) = _HEADER.unpack(header)
+    return await reader.readexactly(length)
+
+
+class LocalBroker:
+    """Delivers published messages synchronously to handlers in this process."""
+
+    distributed = False
+    is_leader = True
+
+    def __init__(self):
+        self._handlers: dict[str, list[Handler]] = defaultdict(list)
+
+    def subscribe(self, channel: str, handler: Handler) -> None:
+        self._handlers[channel].append(handler)
+
+    def publish(self, channel: str, message: Any) -> None:
+        self._dispatch(channel, message)
+
+    def _dispatch(self, channel: str, message: Any) -> None:
+        for handler in self._handlers.get(channel, ()):
+            try:
+                handler(message)
+            except Exception:
+                logger.exception("Broker handler for %r failed", channel)
+
+    async def start(self) -> None:
+        return None
+
+    async def stop(self) -> None:
+        return None
+
+
+class HubBroker(LocalBroker):
+    """Relays messages through a TCP hub hosted by one of the worker processes."""
+
+    distributed = True
+
+    def __init__(self, host: str = HUB_HOST, port: int = HUB_PORT):
+        super().__init__()
+        self.host = host
+        self.port = port
+        self.is_leader = False
+        self._server: asyncio.AbstractServer | None = None
+        self._hub_peers: dict[asyncio.StreamWriter, asyncio.Task] = {}
+        self._writer: asyncio.StreamWriter | None = None
+        self._pending: deque[bytes] = deque(maxlen=PENDING_LIMIT)
+        self._connected = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._connected_once = False
+
+    def publish(self, channel: str, message: Any) -> None:
+        body = _dumps({"c": channel, "m": message})
+        frame = _HEADER.pack(len(body)) + body
+        if self._writer is None:
+            self._pending.append(frame)
+        elif not _write_bounded(self._writer, frame):
+            logger.warning("Realtime hub is not reading; reconnecting")
+
+    async def start(self, timeout: float = 5.0) -> None:
+        self._task = asyncio.create_task(self._run())
+        with suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(self._connected.wait(), timeout=timeout)
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        if self._writer:
+            self._writer.close()
+        if self._server:
+            self._server.close()
+            self._server = None
+        # Closing a peer ends its relay loop with EOF rather than cancellation.
+        peer_tasks = list(self._hub_peers.values())
+        for peer in list(self._hub_peers):
+            peer.close()
+        if peer_tasks:
+            await asyncio.wait(peer_tasks, timeout=1.0)
+        self.is_leader = False
+
+    async def _run(self) -> None:
+        while True:
+            await self._try_host()
+            try:
+                reader, writer = await asyncio.open_connection(self.host, self.port)
+            except OSError:
+                await asyncio.sleep(_RECONNECT_DELAY_SECONDS)
+                continue
+
+            self._writer = writer
+            while self._pending:
+                writer.write(self._pending.popleft())
+            if self._connected_once:
+                # Frames may have been lost with the old connection, both ways.
+                self.publish(RESYNC_CHANNEL, {"pid": os.getpid()})
+            self._connected_once = True
+            self._connected.set()
+            try:
+                while True:
+                    body = await _read_frame(reader)
+                    envelope = json.loads(body)
+                    self._dispatch(envelope["c"], envelope["m"])
+            except (asyncio.IncompleteReadError, ConnectionError, OSError):
+                logger.warning("Lost connection to realtime hub at %s:%d; reconnecting", self.host, self.port)
+            finally:
+                self._writer = None
+                self._connected.clear()
+                writer.close()
+            await asyncio.sleep(_RECONNECT_DELAY_SECONDS)
+
+    async def _try_host(self) -> None:
+        if self._server is not None:
+            return
+        try:
+            self._server = await asyncio.start_server(self._serve_peer, self.host, self.port)
+        except OSError:
+            return  # another worker hosts the hub
+        self.is_leader = True
+        logger.info("Hosting realtime hub on %s:%d", self.host, self.port)
+
+    async def _serve_peer(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._hub_peers[writer] = asyncio.current_task()
+        try:
+            while True:
+                body = await _read_frame(reader)
+                frame = _HEADER.pack(len(body)) + body
+                for peer in list(self._hub_peers):
+                    if not _write_bounded(peer, frame):
+                        logger.warning("Dropping a realtime hub peer that stopped reading")
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._hub_peers.pop(writer, None)
+            writer.close()
+
+
+def _write_bounded(writer: asyncio.StreamWriter, frame: bytes) -> bool:
+    """Queue a frame; if the connection is backed up, abort it instead (its worker reconnects and resyncs)
+    and return False.  Frames for a connection already closing are dropped the same way."""
+    if writer.transport.is_closing():
+        return True
+    if writer.transport.get_write_buffer_size() + len(frame) > BUFFER_LIMIT_BYTES:
+        writer.transport.abort()
+        return False
+    writer.write(frame)
+    return True
+
+
+def _create_broker() -> LocalBroker:
+    if BROKER_MODE == "hub":
+        return HubBroker()
+    if BROKER_MODE != "local":
+        logger.warning("Unknown QUESTARENA_BROKER=%r; using the local broker", BROKER_MODE)
+    return LocalBroker()
+
+
+broker = _create_broker()
@@ -1,8 +1,24 @@
+import asyncio
+import heapq
 import json
-import re
+import logging
+from collections import Counter
 from datetime import datetime
+from itertools import islice
+from typing import Callable
 
+from sortedcontainers import SortedList
+from sqlalchemy import Integer, case, cast, func, literal, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import AsyncSessionLocal
 from models import Player, SessionModel
+from services.anti_cheat import duplicate_ip_map
+from services.broker import RESYNC_CHANNEL, broker
+from services.presence import presence
+from services.session_clock import session_remaining_seconds
+
+logger = logging.getLogger(__name__)
 
 
 def _session_total_seconds(session: SessionModel) -> int:
@@ -12,36 +28,19 @@ def _session_total_seconds(session: SessionModel) -> int:
 def _clamp_remaining(session: SessionModel, remaining_seconds: int | None) -> int:
     total = _session_total_seconds(session)
     if remaining_seconds is None:
-        return max(0, min(total, int(session.remaining_seconds or 0)))
+        return max(0, min(total, session_remaining_seconds(session)))
     return max(0, min(total, int(remaining_seconds)))
 
 
-def _extract_completion_remaining_from_logs(player: Player, session: SessionModel) -> int | None:
-    # Expected details format: "…; remaining_seconds=1234"
-    # Matches both "final_challenge_complete" and "game_complete" log types.
-    completion_actions = {"final_challenge_complete", "game_complete"}
-    for log in sorted(player.logs or [], key=lambda row: row.timestamp or datetime.min, reverse=True):
-        if log.session_id != session.id:
-            continue
-        if log.action_type not in completion_actions:
-            continue
-        details = log.details or ""
-        match = re.search(r"remaining_seconds\s*=\s*(\d+)", details)
-        if match:
-            return int(match.group(1))
-    return None
-
-
 def compute_time_taken_seconds(player: Player, session: SessionModel) -> int:
     total = _session_total_seconds(session)
     if total <= 0:
         return 0
 
     if player.completed_at:
-        # Best case: we logged the remaining_seconds at completion time
-        completion_remaining = _extract_completion_remaining_from_logs(player, session)
-        if completion_remaining is not None:
-            return max(0, total - _clamp_remaining(session, completion_remaining))
+        # Best case: we recorded the remaining_seconds at completion time
+        if player.completion_remaining_seconds is not None:
+            return max(0, total - _clamp_remaining(session, player.completion_remaining_seconds))
 
         # Fallback for completed players: use completed_at - join_time
         # This freezes the timer at the exact completion moment instead of
@@ -54,48 +53,442 @@ def compute_time_taken_seconds(player: Player, session: SessionModel) -> int:
     return max(0, total - _clamp_remaining(session, None))
 
 
-def _serialize_player(player: Player, session: SessionModel) -> dict:
-    time_taken_seconds = compute_time_taken_seconds(player, session)
+class LeaderboardRow:
+    """Slim leaderboard record read straight from SQL, outside the identity map."""
+
+    __slots__ = ("rank", "player_id", "username", "score", "current_level", "time_taken_seconds", "is_completed")
+
+    def __init__(self, rank, player_id, username, score, current_level, time_taken_seconds, is_completed):
+        self.rank = rank
+        self.player_id = player_id
+        self.username = username
+        self.score = score
+        self.current_level = current_level
+        self.time_taken_seconds = time_taken_seconds
+        self.is_completed = bool(is_completed)
+
+
+def _epoch_micros(column):
+    """Microseconds since the epoch of a stored DateTime, exactly.
+
+    SQLite's own date functions round fractional seconds to milliseconds, so the
+    whole seconds and the six stored microsecond digits are read separately.
+    """
+    return cast(func.strftime("%s", func.substr(column, 1, 19)), Integer) * 1_000_000 + cast(
+        func.substr(column, 21, 6), Integer
+    )
+
+
+def leaderboard_query(session: SessionModel):
+    """Rank, time taken and completion for every non-banned player in one statement."""
+    total = _session_total_seconds(session)
+    live_time = max(0, total - _clamp_remaining(session, None))
+
+    # Whole seconds truncated like int(timedelta.total_seconds()) in compute_time_taken_seconds, so
+    # a ranking loaded from SQL orders ties exactly as the incremental index does.
+    elapsed = (_epoch_micros(Player.completed_at) - _epoch_micros(Player.join_time)) // 1_000_000
+    time_taken = case(
+        (literal(total) <= 0, 0),
+        (
+            Player.completed_at.is_not(None) & Player.completion_remaining_seconds.is_not(None),
+            func.max(0, total - func.max(0, func.min(total, Player.completion_remaining_seconds))),
+        ),
+        (
+            Player.completed_at.is_not(None) & Player.join_time.is_not(None),
+            func.max(0, func.min(elapsed, total)),
+        ),
+        else_=live_time,
+    )
+
+    players = (
+        select(
+            Player.id.label("player_id"),
+            Player.username.label("username"),
+            Player.score.label("score"),
+            Player.current_level.label("current_level"),
+            time_taken.label("time_taken_seconds"),
+            Player.completed_at.is_not(None).label("is_completed"),
+        )
+        .where(Player.session_id == session.id, Player.is_banned.is_(False))
+        .subquery()
+    )
+    rank = func.row_number().over(
+        order_by=(
+            players.c.score.desc(),
+            players.c.time_taken_seconds.asc(),
+            func.lower(players.c.username).asc(),
+            players.c.player_id.asc(),
+        )
+    )
+    return select(
+        rank.label("rank"),
+        players.c.player_id,
+        players.c.username,
+        players.c.score,
+        players.c.current_level,
+        players.c.time_taken_seconds,
+        players.c.is_completed,
+    ).order_by(rank)
+
+
+async def fetch_leaderboard_rows(db: AsyncSession, session: SessionModel) -> list[LeaderboardRow]:
+    return [LeaderboardRow(*row) for row in await db.execute(leaderboard_query(session))]
+
+
+def live_time_taken_seconds(session: SessionModel) -> int:
+    """Time taken shared by every player who has not completed yet."""
+    return max(0, _session_total_seconds(session) - _clamp_remaining(session, None))
+
+
+class _RankedEntry:
+    __slots__ = ("player_id", "username", "score", "current_level", "completed_time", "key")
+
+    def __init__(self, player_id, username, score, current_level, completed_time):
+        self.player_id = player_id
+        self.username = username
+        self.score = score
+        self.current_level = current_level
+        self.completed_time = completed_time
+        if completed_time is None:
+            self.key = (-score, username.lower(), player_id)
+        else:
+            self.key = (-score, completed_time, username.lower(), player_id)
+
+    @classmethod
+    def from_player(cls, player: Player, session: SessionModel) -> "_RankedEntry":
+        completed_time = compute_time_taken_seconds(player, session) if player.completed_at else None
+        return cls(player.id, player.username, player.score, player.current_level, completed_time)
+
+    @classmethod
+    def from_row(cls, row: LeaderboardRow) -> "_RankedEntry":
+        completed_time = row.time_taken_seconds if row.is_completed else None
+        return cls(row.player_id, row.username, row.score, row.current_level, completed_time)
+
+
+class _SessionRanking:
+    """Ranked players of one session.
+
+    Completed players have a fixed time taken and are keyed on
+    (-score, time_taken, username).  Everyone else shares the live session
+    time, so they are keyed on (-score, username) and merged in at read time
+    with that shared value - the ticking clock never forces a re-sort.
+
+    The clock does reorder a completed player against active players with
+    the same score when the live time passes its time taken; `crossed`
+    finds those from (time taken, score) and the active players' scores.
+    """
+
+    __slots__ = ("completed", "active", "entries", "completed_times", "active_scores")
+
+    def __init__(self):
+        self.completed = SortedList()
+        self.active = SortedList()
+        self.entries: dict[int, _RankedEntry] = {}
+        self.completed_times = SortedList()  # (time taken, score, player id)
+        self.active_scores: Counter[int] = Counter()
+
+    def add(self, entry: _RankedEntry) -> None:
+        self.entries[entry.player_id] = entry
+        if entry.completed_time is None:
+            self.active.add(entry.key)
+            self.active_scores[entry.score] += 1
+        else:
+            self.completed.add(entry.key)
+            self.completed_times.add((entry.completed_time, entry.score, entry.player_id))
+
+    def discard(self, player_id: int) -> None:
+        entry = self.entries.pop(player_id, None)
+        if entry is None:
+            return
+        if entry.completed_time is None:
+            self.active.remove(entry.key)
+            self.active_scores[entry.score] -= 1
+            if not self.active_scores[entry.score]:
+                del self.active_scores[entry.score]
+        else:
+            self.completed.remove(entry.key)
+            self.completed_times.remove((entry.completed_time, entry.score, entry.player_id))
+
+    def rank(self, player_id: int, live_time: int) -> int:
+        """1-based rank of a player in `ranked(live_time)`, in O(log n)."""
+        entry = self.entries[player_id]
+        key = entry.key
+        if entry.completed_time is None:
+            ahead = self.active.bisect_left(key) + self.completed.bisect_left((key[0], live_time, key[1], key[2]))
+        else:
+            # Active players with the same score sort by the live time against this completed time.
+            if live_time < entry.completed_time:
+                bound = (key[0] + 1,)
+            elif live_time > entry.completed_time:
+                bound = (key[0],)
+            else:
+                bound = (key[0], key[2], key[3])
+            ahead = self.completed.bisect_left(key) + self.active.bisect_left(bound)
+        return ahead + 1
+
+    def crossed(self, low: int, high: int) -> list[int]:
+        """Completed players the live time passing from `low` to `high` reorders against an active one."""
+        return [
+            player_id
+            for _, score, player_id in self.completed_times.irange((low,), (high + 1,), inclusive=(True, False))
+            if score in self.active_scores
+        ]
+
+    def ranked(self, live_time: int):
+        active = ((key[0], live_time, key[1], key[2]) for key in self.active)
+        entries = self.entries
+        for key in heapq.merge(self.completed, active):
+            yield entries[key[3]], key[1]
+
+
+class LeaderboardIndex:
+    """Per-session ranked index kept in memory.
 
+    A session is loaded with `fetch_leaderboard_rows` the first time it is read; after
+    that the player routes keep it current through `upsert` / `remove`,
+    each of which is O(log n).  Mutations travel through `services.broker`
+    so every worker process applies them in the same order.  Listeners added
+    with `add_listener` are called with the session and player id after
+    each one.
+    """
+
+    def __init__(self):
+        self._sessions: dict[int, _SessionRanking] = {}
+        self._player_sessions: dict[int, int] = {}
+        self._loading: dict[int, asyncio.Future] = {}
+        # Mutations that arrive while a session's rows are being fetched,
+        # replayed on top of the fetched rows.
+        self._pending: dict[int, list[dict]] = {}
+        # Bumped whenever a ranking may have changed; cached responses key on it.
+        self.version = 0
+        self._listeners: list[Callable[[int, int], None]] = []
+
+    def add_listener(self, callback: Callable[[int, int], None]) -> None:
+        """Call `callback(session_id, player_id)` whenever a mutation may have moved that player's row."""
+        self._listeners.append(callback)
+
+    def _notify(self, session_id: int | None, player_id: int) -> None:
+        if session_id is None:
+            return
+        for callback in self._listeners:
+            try:
+                callback(session_id, player_id)
+            except Exception:
+                logger.exception("Leaderboard index listener failed")
+
+    async def _load(self, session: SessionModel) -> _SessionRanking:
+        ranking = self._sessions.get(session.id)
+        if ranking is not None:
+            return ranking
+        loading = self._loading.get(session.id)
+        if loading is None:
+            self._pending[session.id] = []
+            loading = self._loading[session.id] = asyncio.ensure_future(self._fetch(session))
+        return await asyncio.shield(loading)
+
+    async def _fetch(self, session: SessionModel) -> _SessionRanking:
+        try:
+            async with AsyncSessionLocal() as db:
+                rows = await fetch_leaderboard_rows(db, session)
+        finally:
+            self._loading.pop(session.id, None)
+            pending = self._pending.pop(session.id, [])
+
+        ranking = _SessionRanking()
+        for row in rows:
+            self._discard_elsewhere(row.player_id, session.id)
+            ranking.add(_RankedEntry.from_row(row))
+            self._player_sessions[row.player_id] = session.id
+        self._sessions[session.id] = ranking
+        self.version += 1
+        for message in pending:
+            self._apply(message)
+        return ranking
+
+    def _discard_elsewhere(self, player_id: int, session_id: int) -> None:
+        previous = self._player_sessions.get(player_id)
+        if previous is not None and previous != session_id:
+            self._remove(player_id)
+
+    def upsert(self, player: Player, session: SessionModel) -> None:
+        """Re-rank a player after its score, level or completion changed."""
+        if player.is_banned:
+            self.remove(player.id)
+            return
+        entry = _RankedEntry.from_player(player, session)
+        broker.publish(
+            "leaderboard_index",
+            {
+                "op": "upsert",
+                "session_id": session.id,
+                "entry": [entry.player_id, entry.username, entry.score, entry.current_level, entry.completed_time],
+            },
+        )
+
+    def remove(self, player_id: int) -> None:
+        broker.publish("leaderboard_index", {"op": "remove", "player_id": player_id})
+
+    def drop_session(self, session_id: int) -> None:
+        broker.publish("leaderboard_index", {"op": "drop", "session_id": session_id})
+
+    def resync(self, message: dict) -> None:
+        """Broker frames may have been lost: drop every loaded ranking so the next read refetches it."""
+        self.version += 1
+        self._sessions.clear()
+        self._player_sessions.clear()
+
+    def cached_score(self, session_id: int, player_id: int) -> int | None:
+        """The player's score if its session is already loaded; never reads the DB."""
+        ranking = self._sessions.get(session_id)
+        entry = ranking.entries.get(player_id) if ranking is not None else None
+        return entry.score if entry is not None else None
+
+    def _apply(self, message: dict) -> None:
+        op = message["op"]
+        self.version += 1
+        if op == "remove":
+            for pending in self._pending.values():
+                pending.append(message)
+        elif message["session_id"] in self._pending:
+            self._pending[message["session_id"]].append(message)
+            return
+        if op == "upsert":
+            entry = _RankedEntry(*message["entry"])
+            self._upsert(message["session_id"], entry)
+            self._notify(message["session_id"], entry.player_id)
+        elif op == "remove":
+            self._notify(self._remove(message["player_id"]), message["player_id"])
+        elif op == "drop":
+            self._drop_session(message["session_id"])
+
+    def _upsert(self, session_id: int, entry: _RankedEntry) -> None:
+        self._discard_elsewhere(entry.player_id, session_id)
+        ranking = self._sessions.get(session_id)
+        if ranking is None:
+            # Not loaded yet: the first read will pick the change up from the DB.
+            return
+        ranking.discard(entry.player_id)
+        ranking.add(entry)
+        self._player_sessions[entry.player_id] = session_id
+
+    def _remove(self, player_id: int) -> int | None:
+        """Drop the player from its loaded ranking; returns that session's id, if any."""
+        session_id = self._player_sessions.pop(player_id, None)
+        ranking = self._sessions.get(session_id) if session_id is not None else None
+        if ranking is None:
+            return None
+        ranking.discard(player_id)
+        return session_id
+
+    def _drop_session(self, session_id: int) -> None:
+        ranking = self._sessions.pop(session_id, None)
+        if ranking is not None:
+            for player_id in ranking.entries:
+                self._player_sessions.pop(player_id, None)
+
+    async def rows(self, session: SessionModel, limit: int | None = None) -> list[dict]:
+        ranking = await self._load(session)
+        ranked = ranking.ranked(live_time_taken_seconds(session))
+        if limit is not None:
+            ranked = islice(ranked, limit)
+        return [_row(entry, time_taken_seconds) for entry, time_taken_seconds in ranked]
+
+    def is_loaded(self, session_id: int) -> bool:
+        return session_id in self._sessions
+
+    def ranked_row(self, session_id: int, player_id: int, live_time: int) -> tuple[int, dict] | None:
+        """(rank, row) of one player of a loaded session, or None if it has no row there."""
+        ranking = self._sessions.get(session_id)
+        entry = ranking.entries.get(player_id) if ranking is not None else None
+        if entry is None:
+            return None
+        time_taken = live_time if entry.completed_time is None else entry.completed_time
+        return ranking.rank(player_id, live_time), _row(entry, time_taken)
+
+    def crossed(self, session_id: int, previous_live_time: int, live_time: int) -> list[int]:
+        """Players of a loaded session whose rank the live time moving between the two values may change."""
+        ranking = self._sessions.get(session_id)
+        if ranking is None:
+            return []
+        return ranking.crossed(min(previous_live_time, live_time), max(previous_live_time, live_time))
+
+
+def _row(entry: _RankedEntry, time_taken_seconds: int) -> dict:
     return {
-        "player_id": player.id,
-        "username": player.username,
-        "score": player.score,
-        "current_level": player.current_level,
+        "player_id": entry.player_id,
+        "username": entry.username,
+        "score": entry.score,
+        "current_level": entry.current_level,
         "time_taken_seconds": time_taken_seconds,
-        "is_completed": bool(player.completed_at),
+        "is_completed": entry.completed_time is not None,
     }
 
 
-def get_leaderboard(session: SessionModel) -> list[dict]:
+leaderboard_index = LeaderboardIndex()
+broker.subscribe("leaderboard_index", leaderboard_index._apply)
+broker.subscribe(RESYNC_CHANNEL, leaderboard_index.resync)
+
+
+async def get_leaderboard(session: SessionModel, limit: int | None = None) -> list[dict]:
     if session.leaderboard_frozen and session.frozen_snapshot:
         try:
-            return json.loads(session.frozen_snapshot)
+            rows = json.loads(session.frozen_snapshot)
         except json.JSONDecodeError:
             return []
+        return rows[:limit] if limit is not None else rows
 
-    rows = [_serialize_player(player, session) for player in session.players if not player.is_banned]
-    rows.sort(
-        key=lambda item: (
-            -item["score"],
-            item["time_taken_seconds"],
-            item["username"].lower(),
+    return await leaderboard_index.rows(session, limit)
+
+
+async def live_player_rows(db: AsyncSession, session: SessionModel) -> list[dict]:
+    """The admin live-players table for a session."""
+    players = (await db.scalars(select(Player).where(Player.session_id == session.id))).all()
+    dup_map = duplicate_ip_map(players)
+    now = datetime.utcnow()
+
+    rows = []
+    for player in players:
+        # Presence is written behind; a touch newer than the row means the player is back.
+        last_active, is_active = player.last_active, player.is_active
+        seen = presence.last_seen(player.id)
+        if seen is not None and (last_active is None or seen > last_active):
+            last_active, is_active = seen, True
+        rows.append(
+            {
+                "id": player.id,
+                "username": player.username,
+                "score": player.score,
+                "current_level": player.current_level,
+                "time_taken_seconds": compute_time_taken_seconds(player, session),
+                "is_completed": bool(player.completed_at),
+                "last_active_seconds_ago": max(0, int((now - last_active).total_seconds())) if last_active else None,
+                "ip_address": player.ip_address,
+                "is_active": is_active,
+                "is_banned": player.is_banned,
+                "duplicate_ip": bool(player.ip_address and dup_map.get(player.ip_address, 0) > 1),
+            }
         )
-    )
     return rows
 
 
-def set_leaderboard_freeze(session: SessionModel, frozen: bool) -> None:
-    session.leaderboard_frozen = frozen
-    if frozen:
-        session.frozen_snapshot = json.dumps(get_leaderboard(session))
-    else:
-        session.frozen_snapshot = None
+async def leaderboard_freeze_values(session: SessionModel, frozen: bool) -> dict:
+    """Session column values that freeze the leaderboard at its current standings, or unfreeze it."""
+    return {
+        "leaderboard_frozen": frozen,
+        "frozen_snapshot": json.dumps(await get_leaderboard(session)) if frozen else None,
+    }
 
 
-def analytics_for_session(session: SessionModel) -> dict:
-    players = [p for p in session.players if not p.is_banned]
-    if not players:
+async def analytics_for_session(session: SessionModel) -> dict:
+    ranked = [
+        {
+            "username": row["username"],
+            "score": row["score"],
+            "time_taken_seconds": row["time_taken_seconds"],
+        }
+        for row in await leaderboard_index.rows(session)
+    ]
+    if not ranked:
         return {
             "session_name": session.name,
             "total_participants": 0,
@@ -104,21 +497,10 @@ def analytics_for_session(session: SessionModel) -> dict:
             "generated_at": datetime.utcnow().isoformat(),
         }
 
-    ranked = [
-        {
-            "username": player.username,
-            "score": player.score,
-            "time_taken_seconds": compute_time_taken_seconds(player, session),
-        }
-        for player in players
-    ]
-    ranked.sort(key=lambda item: (-item["score"], item["time_taken_seconds"], item["username"].lower()))
-    top = ranked[0] if ranked else None
-
     return {
         "session_name": session.name,
-        "total_participants": len(players),
-        "top_player": top,
+        "total_participants": len(ranked),
+        "top_player": ranked[0],
         "leaderboard": ranked,
         "generated_at": datetime.utcnow().isoformat(),
     }
@@ -0,0 +1,360 @@
+"""
+Versioned leaderboard feed for /ws/live.
+
+A socket receives a full `leaderboard_snapshot` when it subscribes (or asks
+for a resync); after that the server only broadcasts `leaderboard_delta`
+messages describing what changed since the previous version:
+
+    {"op": "insert", "row": {...}}               new row, with its rank
+    {"op": "update", "row": {...}}               score / level / completion changed, new rank
+    {"op": "remove", "player_id": 7}
+
+Rows that merely shifted are not sent: a client applies the ops, then gives
+every row it did not receive the ranks left free, in the order those rows
+already had (`apply_ops`).  One player jumping to the top is a single op.
+
+A delta is computed whenever the leaderboard index applies a mutation
+(bursts coalesce into one delta), and when the session itself changes
+(frozen, ended).  It carries only the players mutated since the previous
+version, each ranked in O(log n) by the index; the full leaderboard is only
+read for a snapshot.
+
+The clock matters in one case: an active player sorts after a completed
+player with the same score once the live time passes that player's time
+taken.  The countdown calls `on_clock` every tick, which asks the index
+for completed players the live time crossed since the last version and
+publishes them as updates.
+
+Feed messages are published on the `session:{id}` topic.  Every delta
+carries `base_version` and `version`.  A client whose current version
+differs from `base_version` has missed a message and should send "resync"
+to get a fresh snapshot.
+
+Players who have not completed share the live session time, so their rows
+carry no `time_taken_seconds`; clients use `live_time_taken_seconds` from
+the payload instead.  That keeps the ticking clock from turning every
+active row into a delta each second.
+
+Only the broker leader computes the feed.  Other workers mirror it from the
+published snapshots and deltas so they can answer snapshot requests with
+the same versions, and ask the leader to republish when they have no copy.
+"""
+
+import asyncio
+import logging
+from itertools import count
+
+from database import AsyncSessionLocal
+from models import SessionModel
+from services.broker import RESYNC_CHANNEL, broker
+from services.leaderboard import get_leaderboard, leaderboard_index, live_time_taken_seconds
+from services.realtime import manager, player_topic, session_topic
+from services.session_state import session_state
+
+logger = logging.getLogger(__name__)
+
+
+class _VersionClock:
+    """Monotonic feed versions that also move past any version seen from another worker."""
+
+    def __init__(self):
+        self._last = 0
+
+    def next(self) -> int:
+        self._last += 1
+        return self._last
+
+    def observe(self, version: int) -> None:
+        self._last = max(self._last, version)
+
+
+_versions = _VersionClock()
+
+
+def _wire_row(row: dict, rank: int) -> dict:
+    wire = {
+        "rank": rank,
+        "player_id": row["player_id"],
+        "username": row["username"],
+        "score": row["score"],
+        "current_level": row["current_level"],
+        "is_completed": row["is_completed"],
+    }
+    if row["is_completed"]:
+        wire["time_taken_seconds"] = row["time_taken_seconds"]
+    return wire
+
+
+def apply_ops(rows: dict[int, dict], ops: list[dict]) -> None:
+    """Apply a delta's ops to rows keyed by player id, re-deriving the ranks of rows it did not carry."""
+    sent: set[int] = set()
+    for op in ops:
+        if op["op"] == "remove":
+            rows.pop(op["player_id"], None)
+        else:
+            rows[op["row"]["player_id"]] = op["row"]
+            sent.add(op["row"]["player_id"])
+    taken = {rows[player_id]["rank"] for player_id in sent}
+    free = (rank for rank in count(1) if rank not in taken)
+    kept = sorted((row for player_id, row in rows.items() if player_id not in sent), key=lambda row: row["rank"])
+    for row, rank in zip(kept, free):
+        if row["rank"] != rank:
+            rows[row["player_id"]] = {**row, "rank": rank}
+
+
+async def _wire_rows(session: SessionModel) -> dict[int, dict]:
+    return {
+        row["player_id"]: _wire_row(row, rank)
+        for rank, row in enumerate(await get_leaderboard(session), start=1)
+    }
+
+
+class _FeedState:
+    """The last published version of a session's feed.
+
+    The leader keeps the players clients hold a row for (`members`) and the
+    live time that version was ranked at; followers keep a mirror of the
+    rows (`rows`) to answer snapshot requests.
+    """
+
+    __slots__ = ("version", "frozen", "live_time", "members", "rows")
+
+    def __init__(
+        self,
+        version: int,
+        frozen: bool,
+        live_time: int = 0,
+        members: set[int] | None = None,
+        rows: dict[int, dict] | None = None,
+    ):
+        self.version = version
+        self.frozen = frozen
+        self.live_time = live_time
+        self.members = members
+        self.rows = rows
+
+    @classmethod
+    async def from_session(cls, session: SessionModel) -> tuple["_FeedState", dict[int, dict]]:
+        rows = await _wire_rows(session)
+        state = cls(_versions.next(), bool(session.leaderboard_frozen), live_time_taken_seconds(session), set(rows))
+        return state, rows
+
+
+class LeaderboardFeed:
+    def __init__(self):
+        self._states: dict[int, _FeedState] = {}
+        self._tasks: set[asyncio.Task] = set()
+        # Building a state can await a cold index load; the lock keeps two
+        # publishers from diffing against the same base version.
+        self._lock = asyncio.Lock()
+        # Sessions with a publish queued or running, and those changed again meanwhile.
+        self._following: set[int] = set()
+        self._changed: set[int] = set()
+        # Players mutated since each session's last published version.
+        self._dirty: dict[int, set[int]] = {}
+
+    async def snapshot(self, session: SessionModel) -> dict | None:
+        """Current snapshot payload, or None while a follower waits for the leader's copy."""
+        if not broker.is_leader:
+            state = self._states.get(session.id)
+            if state is None or state.rows is None:
+                broker.publish("leaderboard_feed", {"resync": session.id})
+                return None
+            return self._snapshot_payload(session, state, state.rows)
+        async with self._lock:
+            state = self._states.get(session.id)
+            if state is None or state.members is None:
+                state, rows = await self._fresh_state(session)
+            else:
+                # Read at this version or later; the next delta resends whatever changed since.
+                rows = await _wire_rows(session)
+        return self._snapshot_payload(session, state, rows)
+
+    def on_index_change(self, session_id: int, player_id: int) -> None:
+        """Queue a delta for a session whose ranking changed; changes made meanwhile share it."""
+        if not broker.is_leader:
+            return
+        self._dirty.setdefault(session_id, set()).add(player_id)
+        self._follow_soon(session_id)
+
+    def on_clock(self, session: SessionModel) -> None:
+        """Queue a delta if the live time has reordered tied players since the last version."""
+        state = self._states.get(session.id)
+        if not broker.is_leader or state is None or state.members is None or state.frozen:
+            return
+        live_time = live_time_taken_seconds(session)
+        if live_time == state.live_time:
+            return
+        if leaderboard_index.crossed(session.id, state.live_time, live_time):
+            self._follow_soon(session.id)
+        else:
+            state.live_time = live_time  # no order changed up to here
+
+    def _follow_soon(self, session_id: int) -> None:
+        self._changed.add(session_id)
+        if session_id in self._following:
+            return
+        self._following.add(session_id)
+        task = asyncio.ensure_future(self._follow(session_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _follow(self, session_id: int) -> None:
+        try:
+            while session_id in self._changed:
+                self._changed.discard(session_id)
+                session = session_state.latest
+                if session is None or session.id != session_id:
+                    async with AsyncSessionLocal() as db:
+                        session = await db.get(SessionModel, session_id)
+                if session is None:
+                    return
+                await self.publish(session)
+        except Exception:
+            logger.exception("Publishing the leaderboard delta for session %s failed", session_id)
+        finally:
+            self._following.discard(session_id)
+            self._changed.discard(session_id)
+
+    async def publish(self, session: SessionModel) -> None:
+        async with self._lock:
+            message = await self.advance(session)
+            if not message:
+                return
+            event, payload = message
+            await manager.broadcast(event, payload, topic=session_topic(session.id))
+
+            # Tell players whose own row changed, on their own topic only.
+            for op in payload.get("ops", ()):
+                if op["op"] == "remove":
+                    continue
+                row = op["row"]
+                topic = player_topic(row["player_id"])
+                if manager.has_subscribers(topic):
+                    await manager.broadcast("rank_update", {"rank": row["rank"], "score": row["score"]}, topic=topic)
+
+    async def advance(self, session: SessionModel) -> tuple[str, dict] | None:
+        """The delta from the last published version: the players mutated since, plus tied
+        players the clock reordered.
+
+        Returns the (event, payload) to broadcast, or None when nothing changed.
+        """
+        state = self._states.get(session.id)
+        frozen = bool(session.leaderboard_frozen)
+        if (
+            state is None
+            or state.members is None
+            or state.frozen != frozen
+            or not (frozen or leaderboard_index.is_loaded(session.id))
+        ):
+            state, rows = await self._fresh_state(session)
+            return "leaderboard_snapshot", self._snapshot_payload(session, state, rows)
+
+        changed = self._dirty.pop(session.id, set())
+        if frozen:
+            return None  # frozen rows don't change until the unfreeze snapshot
+        live_time = live_time_taken_seconds(session)
+        changed.update(leaderboard_index.crossed(session.id, state.live_time, live_time))
+        state.live_time = live_time
+
+        # Rows not sent keep their relative order, so clients derive their ranks (`apply_ops`).
+        removed, upserts = [], []
+        for player_id in changed:
+            ranked = leaderboard_index.ranked_row(session.id, player_id, live_time)
+            if ranked is None:
+                if player_id in state.members:
+                    state.members.discard(player_id)
+                    removed.append({"op": "remove", "player_id": player_id})
+                continue
+            op = "update" if player_id in state.members else "insert"
+            state.members.add(player_id)
+            upserts.append({"op": op, "row": _wire_row(ranked[1], ranked[0])})
+        ops = removed + sorted(upserts, key=lambda op: op["row"]["rank"])
+        if not ops:
+            return None
+
+        base_version = state.version
+        state.version = _versions.next()
+        return "leaderboard_delta", {
+            "session_id": session.id,
+            "base_version": base_version,
+            "version": state.version,
+            "frozen": state.frozen,
+            "live_time_taken_seconds": live_time_taken_seconds(session),
+            "ops": ops,
+        }
+
+    async def _fresh_state(self, session: SessionModel) -> tuple[_FeedState, dict[int, dict]]:
+        self._dirty.pop(session.id, None)  # the rows read next include those changes
+        state, rows = await _FeedState.from_session(session)
+        self._states[session.id] = state
+        return state, rows
+
+    def discard(self, session_id: int) -> None:
+        self._states.pop(session_id, None)
+        self._dirty.pop(session_id, None)
+
+    def observe_snapshot(self, payload: dict) -> None:
+        _versions.observe(payload["version"])
+        if broker.is_leader:
+            return
+        rows = {row["player_id"]: row for row in payload["rows"]}
+        self._states[payload["session_id"]] = _FeedState(payload["version"], payload["frozen"], rows=rows)
+
+    def observe_delta(self, payload: dict) -> None:
+        _versions.observe(payload["version"])
+        if broker.is_leader:
+            return
+        state = self._states.get(payload["session_id"])
+        if state is None or state.rows is None or state.version != payload["base_version"]:
+            # Missed a message: drop the mirror so the next snapshot request refetches it.
+            self._states.pop(payload["session_id"], None)
+            return
+        apply_ops(state.rows, payload["ops"])
+        state.version = payload["version"]
+        state.frozen = payload["frozen"]
+
+    def resync(self, message: dict) -> None:
+        """Broker frames may have been lost: followers drop their mirrors and fetch fresh snapshots."""
+        if not broker.is_leader:
+            self._states.clear()
+            self._dirty.clear()
+
+    def on_resync_request(self, message: dict) -> None:
+        if not broker.is_leader:
+            return
+        task = asyncio.ensure_future(self._republish(message["resync"]))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _republish(self, session_id: int) -> None:
+        async with AsyncSessionLocal() as db:
+            session = await db.get(SessionModel, session_id)
+        payload = await self.snapshot(session) if session else None
+        if payload is not None:
+            manager.publish("leaderboard_snapshot", payload, topic=session_topic(payload["session_id"]))
+
+    @staticmethod
+    def _snapshot_payload(session: SessionModel, state: _FeedState, rows: dict[int, dict]) -> dict:
+        return {
+            "session_id": session.id,
+            "version": state.version,
+            "frozen": state.frozen,
+            "live_time_taken_seconds": live_time_taken_seconds(session),
+            "rows": sorted(rows.values(), key=lambda row: row["rank"]),
+        }
+
+
+leaderboard_feed = LeaderboardFeed()
+manager.add_listener("leaderboard_snapshot", leaderboard_feed.observe_snapshot)
+manager.add_listener("leaderboard_delta", leaderboard_feed.observe_delta)
+broker.subscribe("leaderboard_feed", leaderboard_feed.on_resync_request)
+broker.subscribe(RESYNC_CHANNEL, leaderboard_feed.resync)
+leaderboard_index.add_listener(leaderboard_feed.on_index_change)
+
+
+async def publish_leaderboard(session: SessionModel) -> None:
+    """Publish a delta after a change to the session itself (freeze, end); index mutations publish on their own."""
+    if not broker.is_leader:
+        return  # the leader publishes when it applies the change
+    await leaderboard_feed.publish(session)
@@ -0,0 +1,156 @@
+"""
+In-memory player presence with write-behind to `players.last_active`.
+
+Heartbeats, token checks and gameplay calls only `touch()` the map; nothing
+is written per request.  Every worker flushes its own touches once per
+`flush()` with a single executemany UPDATE through the write queue, and
+shares them on the broker so each worker's map covers the whole cluster.
+The inactivity sweep reads stale players from the map instead of scanning
+the table; a session's rows are read once to seed the map for players not
+seen since this worker started.
+
+A touch remembers the token generation it was made with, and the flush
+only updates rows still at that generation.  A kick, ban or session end
+that commits while a flush is in flight therefore stays in effect: it
+bumps the generation, and the late flush cannot mark the player active
+again.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.orm import Session
+
+from database import AsyncSessionLocal
+from models import Player
+from services.broker import RESYNC_CHANNEL, broker
+from services.write_queue import write_queue
+
+
+class PresenceMap:
+    def __init__(self):
+        self._seen: dict[int, datetime] = {}
+        self._session_of: dict[int, int] = {}
+        # Touched in this worker, not yet flushed: when, and the token generation it was made with.
+        self._pending: dict[int, tuple[datetime, int]] = {}
+        self._inactive: set[int] = set()  # marked inactive since their last touch
+        self._seeded: set[int] = set()
+        self.flushes = 0
+        self.rows_flushed = 0
+
+    def touch(self, player_id: int, session_id: int, generation: int) -> None:
+        now = datetime.utcnow()
+        self._record(player_id, session_id, now)
+        self._pending[player_id] = (now, generation)
+
+    def last_seen(self, player_id: int) -> datetime | None:
+        return self._seen.get(player_id)
+
+    def forget(self, player_id: int) -> None:
+        """Drop a kicked or banned player so a pending flush can't mark them active again."""
+        broker.publish("presence", {"op": "forget", "player_id": player_id})
+
+    async def flush(self) -> int:
+        if not self._pending:
+            return 0
+        batch, self._pending = self._pending, {}
+        broker.publish(
+            "presence",
+            {
+                "op": "seen",
+                "entries": [[pid, self._session_of.get(pid), seen.isoformat()] for pid, (seen, _) in batch.items()],
+            },
+        )
+        rows = [
+            {"player_id": pid, "seen": seen, "generation": generation} for pid, (seen, generation) in batch.items()
+        ]
+        try:
+            await write_queue.submit(lambda db: _write_last_active(db, rows))
+        except Exception:
+            for pid, touched in batch.items():  # retry on the next flush
+                if pid not in self._pending:
+                    self._pending[pid] = touched
+            raise
+        self.flushes += 1
+        self.rows_flushed += len(rows)
+        return len(rows)
+
+    async def seed_session(self, session_id: int) -> None:
+        if session_id in self._seeded:
+            return
+        async with AsyncSessionLocal() as db:
+            rows = await db.execute(
+                select(Player.id, Player.last_active).where(
+                    Player.session_id == session_id,
+                    Player.is_active.is_(True),
+                    Player.last_active.is_not(None),
+                )
+            )
+            for player_id, last_active in rows:
+                self._record(player_id, session_id, last_active)
+        self._seeded.add(session_id)
+
+    def stale(self, session_id: int, before: datetime) -> list[int]:
+        """Players of the session last seen before `before` and not yet marked inactive."""
+        return [
+            pid
+            for pid, seen in self._seen.items()
+            if seen < before and self._session_of.get(pid) == session_id and pid not in self._inactive
+        ]
+
+    def mark_inactive(self, player_ids: list[int]) -> None:
+        self._inactive.update(player_ids)
+
+    def resync(self, message: dict) -> None:
+        """Broker frames may have been lost: re-read each session's last_active on its next sweep."""
+        self._seeded.clear()
+
+    def _record(self, player_id: int, session_id: int | None, seen: datetime) -> None:
+        previous = self._seen.get(player_id)
+        if previous is None or seen > previous:
+            self._seen[player_id] = seen
+            self._inactive.discard(player_id)
+        if session_id is not None:
+            self._session_of[player_id] = session_id
+
+    def _apply(self, message: dict) -> None:
+        if message["op"] == "forget":
+            player_id = message["player_id"]
+            self._seen.pop(player_id, None)
+            self._session_of.pop(player_id, None)
+            self._pending.pop(player_id, None)
+            self._inactive.discard(player_id)
+            return
+        for player_id, session_id, seen in message["entries"]:
+            self._record(player_id, session_id, datetime.fromisoformat(seen))
+
+    def metrics(self) -> dict:
+        return {
+            "tracked": len(self._seen),
+            "pending": len(self._pending),
+            "inactive": len(self._inactive),
+            "flushes": self.flushes,
+            "rows_flushed": self.rows_flushed,
+        }
+
+
+# Core statement, so rows deleted meanwhile are skipped rather than raising StaleDataError.
+# Rows whose token was revoked since the touch (kick, ban, session end) are skipped too.
+_LAST_ACTIVE_UPDATE = (
+    update(Player.__table__)
+    .where(
+        Player.__table__.c.id == bindparam("player_id"),
+        Player.__table__.c.token_generation == bindparam("generation"),
+        Player.__table__.c.is_banned.is_(False),
+    )
+    .values(last_active=bindparam("seen"), is_active=True)
+)
+
+
+def _write_last_active(db: Session, rows: list[dict]) -> None:
+    db.execute(_LAST_ACTIVE_UPDATE, rows)  # one executemany for the whole batch
+
+
+presence = PresenceMap()
+broker.subscribe("presence", presence._apply)
+broker.subscribe(RESYNC_CHANNEL, presence.resync)
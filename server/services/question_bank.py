@@ -0,0 +1,567 @@
+"""
+Versioned question bank, reloadable while the server runs.
+
+`questions.json` used to be read once at import, so fixing a typo
+mid-event meant a restart that dropped every WebSocket.  The bank is now a
+`BankVersion`: the parsed file plus everything derived from it - the
+(level, question_id) answer index and the pre-rendered `/api/questions`
+responses - built together and published by replacing one reference.
+Requests read `question_bank.current` once and use that version
+throughout, so none of them ever sees a half-built bank.
+
+A new version comes from either
+
+  * the file changing on disk: every worker polls its mtime
+    (`check_file`, a per-worker scheduler job) and reloads, or
+  * an admin upload (`upload`): validated and compiled first, then written
+    over the file atomically, so the other workers pick it up on their
+    next poll.
+
+Parsing, validation and compilation run in a thread off the event loop.
+A bank that fails validation is rejected (upload) or logged and ignored
+(file), and the current version keeps serving.
+
+Sessions may use a named set from `QUESTION_SETS_DIR` instead of the
+default bank (`question_sets`), each reloadable the same way.  A question
+may carry a pool of `variants` that override its text, options and
+answer; every player gets one of them, picked by hashing the session's
+seed, the player and the question id, so the assignment is stable across
+requests and workers without being stored.  Each variant's answers are
+normalized at compile time, so checking one is a hash lookup however large
+the pool.  Levels with variants are rendered per player (and kept in a
+bounded cache on the version); answers are never sent to clients.
+
+The pick is modulo the pool size, so resizing a pool reassigns variants.
+An upload that resizes a pool of a set a running or paused session uses is
+rejected; a file edit that does so is applied but logged, since players
+may then be graded against a variant other than the one they were shown.
+Resize pools between sessions, or in a new set.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+from collections import OrderedDict
+from contextlib import suppress
+from datetime import datetime
+
+from services.static_responses import StaticResponse
+
+logger = logging.getLogger(__name__)
+
+_SERVER_DIR = os.path.dirname(os.path.dirname(__file__))
+QUESTIONS_PATH = os.getenv("QUESTARENA_QUESTIONS_PATH", os.path.join(_SERVER_DIR, "questions.json"))
+QUESTION_SETS_DIR = os.getenv("QUESTARENA_QUESTION_SETS_DIR", os.path.join(_SERVER_DIR, "question_sets"))
+PLAYER_RESPONSE_CACHE_SIZE = 8192
+
+# Per-level scoring: maps (level, path_hint) -> points for correct answer
+# path_hint is derived from question_id prefix: "e" for easy, "h" for hard, None for flat
+SCORE_TABLE = {
+    (0, None): 10,
+    (1, None): 15,
+    (2, None): 20,
+    (3, "e"): 10,
+    (3, "h"): 40,
+    (4, "e"): 15,
+    (4, "h"): 60,
+}
+
+_QUESTION_LISTS = ("questions", "easy", "hard")
+_SET_NAME = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+# Never sent to clients: the answers, and the pool a player's variant was picked from.
+_PRIVATE_FIELDS = ("answer", "variants")
+
+
+class QuestionBankError(ValueError):
+    """The question file is not valid JSON or not shaped like a question bank."""
+
+
+def _path_hint_from_qid(question_id: str) -> str | None:
+    """Detect easy/hard from question ID convention: q3_e1 -> 'e', q3_h1 -> 'h'."""
+    parts = question_id.split("_")
+    if len(parts) >= 2:
+        tag = parts[1]
+        if tag.startswith("e"):
+            return "e"
+        if tag.startswith("h"):
+            return "h"
+    return None
+
+
+def normalize_answer(value: str | None) -> str:
+    if value is None:
+        return ""
+    return " ".join(str(value).strip().split()).casefold()
+
+
+def variant_pool(question: dict) -> list[dict]:
+    """The question as each of its variants (just itself when it has none)."""
+    variants = question.get("variants")
+    if not variants:
+        return [question]
+    base = {field: value for field, value in question.items() if field != "variants"}
+    return [{**base, **variant, "id": question["id"]} for variant in variants]
+
+
+def assign_variant(seed: int, player_id: int, question_id: str, pool_size: int) -> int:
+    """A player's variant of a question: stable for a session seed, spread evenly across players."""
+    if pool_size <= 1:
+        return 0
+    digest = hashlib.blake2b(f"{seed}:{player_id}:{question_id}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % pool_size
+
+
+def _accepted_answers(question: dict) -> frozenset[str]:
+    # "answer" may be a single string or a list of accepted answers.
+    answers = question.get("answer")
+    if not isinstance(answers, list):
+        answers = [answers]
+    return frozenset(normalize_answer(answer) for answer in answers if answer is not None)
+
+
+class CompiledQuestion:
+    """An answerable question with its accepted answers normalized and its points resolved."""
+
+    __slots__ = ("level", "question_id", "path", "points", "variants")
+
+    def __init__(self, level: int, question: dict, path: str):
+        self.level = level
+        self.question_id = question["id"]
+        self.path = path  # the list it came from: questions / easy / hard / hidden_route
+        self.points = SCORE_TABLE.get((level, _path_hint_from_qid(self.question_id)), 10)
+        # Accepted answers of each variant, in pool order.
+        self.variants = tuple(_accepted_answers(variant) for variant in variant_pool(question))
+
+    def variant_for(self, seed: int, player_id: int) -> int:
+        return assign_variant(seed, player_id, self.question_id, len(self.variants))
+
+    def is_correct(self, answer: str | None, variant: int = 0) -> bool:
+        return normalize_answer(answer) in self.variants[variant]
+
+
+def _question_groups(level_data: dict) -> list[tuple[str, list]]:
+    groups = [(path, level_data[path]) for path in _QUESTION_LISTS if path in level_data]
+    if "hidden_route" in level_data:
+        groups.append(("hidden_route", level_data["hidden_route"].get("questions", [])))
+    return groups
+
+
+def validate_questions(questions) -> None:
+    """Raise QuestionBankError describing the first problem found."""
+    if not isinstance(questions, dict) or not questions:
+        raise QuestionBankError("the bank must be a non-empty object keyed by level")
+    for key, level_data in questions.items():
+        if not key.isdigit():
+            raise QuestionBankError(f"level key {key!r} is not a number")
+        if not isinstance(level_data, dict) or not isinstance(level_data.get("title"), str):
+            raise QuestionBankError(f"level {key}: needs an object with a string 'title'")
+        if ("easy" in level_data) != ("hard" in level_data):
+            raise QuestionBankError(f"level {key}: 'easy' and 'hard' must be given together")
+        if not any(path in level_data for path in (*_QUESTION_LISTS, "question")):
+            raise QuestionBankError(f"level {key}: needs 'questions', 'easy'/'hard' or 'question'")
+        if "question" in level_data and not isinstance(level_data["question"], dict):
+            raise QuestionBankError(f"level {key}: 'question' must be an object")
+        if "hidden_route" in level_data and not isinstance(level_data["hidden_route"], dict):
+            raise QuestionBankError(f"level {key}: 'hidden_route' must be an object")
+        seen = set()
+        for path, items in _question_groups(level_data):
+            if not isinstance(items, list):
+                raise QuestionBankError(f"level {key}: '{path}' must be a list")
+            for position, question in enumerate(items):
+                where = f"level {key} {path}[{position}]"
+                if not isinstance(question, dict) or not isinstance(question.get("id"), str):
+                    raise QuestionBankError(f"{where}: needs a string 'id'")
+                variants = question.get("variants")
+                if variants is not None and (
+                    not isinstance(variants, list) or not variants or not all(isinstance(v, dict) for v in variants)
+                ):
+                    raise QuestionBankError(
+                        f"{where} ({question['id']}): 'variants' must be a non-empty list of objects"
+                    )
+                for variant in variant_pool(question):
+                    answer = variant.get("answer")
+                    answers = answer if isinstance(answer, list) else [answer]
+                    if not answers or not all(isinstance(item, str) and item.strip() for item in answers):
+                        raise QuestionBankError(
+                            f"{where} ({question['id']}): 'answer' must be a string or a list of strings"
+                        )
+                if question["id"] in seen:
+                    raise QuestionBankError(f"{where}: duplicate question id {question['id']!r}")
+                seen.add(question["id"])
+
+
+def compile_questions(questions: dict) -> dict[tuple[int, str], CompiledQuestion]:
+    """Index every answerable question of a validated bank by (level, question_id)."""
+    index: dict[tuple[int, str], CompiledQuestion] = {}
+    for key, level_data in questions.items():
+        level = int(key)
+        for path, items in _question_groups(level_data):
+            for question in items:
+                index[(level, question["id"])] = CompiledQuestion(level, question, path)
+    return index
+
+
+def _public(question: dict, variant: int = 0) -> dict:
+    question = variant_pool(question)[variant]
+    return {field: value for field, value in question.items() if field not in _PRIVATE_FIELDS}
+
+
+def level_payload(questions: dict, level: int, path: str | None, pick=None) -> dict:
+    """The /api/questions/{level} answer for a path.
+
+    `pick(question)` chooses the variant index of each question (the first
+    variant if omitted).
+    """
+    level_data = questions[str(level)]
+
+    def listed(items: list) -> list[dict]:
+        return [_public(question, pick(question) if pick else 0) for question in items]
+
+    if "easy" in level_data and "hard" in level_data:
+        if path in ("easy", "hard"):
+            return {"questions": listed(level_data[path]), "title": level_data["title"]}
+        return {
+            "message": "Choose path",
+            "paths": ["easy", "hard"],
+            "title": level_data["title"],
+        }
+
+    if level == 1 and path == "backlog_king" and "hidden_route" in level_data:
+        return {"questions": listed(level_data["hidden_route"]["questions"]), "title": "Backlog King Route"}
+
+    if "questions" in level_data:
+        return {"questions": listed(level_data["questions"]), "title": level_data["title"]}
+
+    if "question" in level_data:
+        return {"question": level_data["question"], "title": level_data["title"]}
+
+    return level_data
+
+
+def render_question_responses(questions: dict) -> dict[int, dict[str | None, StaticResponse]]:
+    """Every (level, path) answer of /api/questions, serialized and compressed once.
+
+    Paths a level does not know are answered like no path at all, so only
+    None and the recognised paths are rendered.
+    """
+    rendered = {}
+    for key in questions:
+        level = int(key)
+        default = level_payload(questions, level, None)
+        by_path = {None: StaticResponse(default)}
+        for path in ("easy", "hard", "backlog_king"):
+            payload = level_payload(questions, level, path)
+            if payload != default:
+                by_path[path] = StaticResponse(payload)
+        rendered[level] = by_path
+    return rendered
+
+
+def _variant_levels(questions: dict) -> frozenset[int]:
+    return frozenset(
+        int(key)
+        for key, level_data in questions.items()
+        if any(question.get("variants") for _, items in _question_groups(level_data) for question in items)
+    )
+
+
+class BankVersion:
+    """One immutable question bank and everything derived from it."""
+
+    __slots__ = (
+        "version",
+        "digest",
+        "loaded_at",
+        "source",
+        "questions",
+        "index",
+        "responses",
+        "variant_levels",
+        "_player_responses",
+    )
+
+    def __init__(self, raw: bytes, version: int, source: str):
+        try:
+            questions = json.loads(raw)
+        except (UnicodeDecodeError, json.JSONDecodeError) as exc:
+            raise QuestionBankError(f"not valid JSON: {exc}") from exc
+        validate_questions(questions)
+        self.version = version
+        self.digest = hashlib.sha256(raw).hexdigest()[:12]
+        self.loaded_at = datetime.utcnow()
+        self.source = source
+        self.questions = questions
+        self.index = compile_questions(questions)
+        self.responses = render_question_responses(questions)
+        # Levels whose questions differ per player; their responses are rendered on demand.
+        self.variant_levels = _variant_levels(questions)
+        self._player_responses: OrderedDict[tuple, StaticResponse] = OrderedDict()
+
+    def player_response(self, level: int, path: str | None, seed: int, player_id: int) -> StaticResponse:
+        """A variant level as one player of a session sees it."""
+        key = (level, path, seed, player_id)
+        response = self._player_responses.get(key)
+        if response is not None:
+            self._player_responses.move_to_end(key)
+            return response
+
+        def pick(question: dict) -> int:
+            return self.index[(level, question["id"])].variant_for(seed, player_id)
+
+        response = StaticResponse(level_payload(self.questions, level, path, pick))
+        self._player_responses[key] = response
+        if len(self._player_responses) > PLAYER_RESPONSE_CACHE_SIZE:
+            self._player_responses.popitem(last=False)
+        return response
+
+    def describe(self) -> dict:
+        return {
+            "version": self.version,
+            "digest": self.digest,
+            "loaded_at": self.loaded_at.isoformat(),
+            "source": self.source,
+            "levels": len(self.questions),
+            "questions": len(self.index),
+            "variants": sum(len(question.variants) for question in self.index.values()),
+        }
+
+    def resized_pools(self, previous: "BankVersion") -> list[str]:
+        """Questions of both versions whose variant pool changed size, i.e. whose assignments moved."""
+        return sorted(
+            question.question_id
+            for key, question in self.index.items()
+            if key in previous.index and len(previous.index[key].variants) != len(question.variants)
+        )
+
+
+def _file_stamp(path: str) -> tuple[int, int]:
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _stamp_or_none(path: str) -> tuple[int, int] | None:
+    try:
+        return _file_stamp(path)
+    except OSError:
+        return None
+
+
+def _read(path: str) -> tuple[bytes, tuple[int, int]]:
+    stamp = _file_stamp(path)
+    with open(path, "rb") as file:
+        return file.read(), stamp
+
+
+def _write_atomically(path: str, raw: bytes) -> tuple[int, int]:
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix=".questions-", suffix=".json", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(raw)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        with suppress(OSError):
+            os.unlink(temp_path)
+        raise
+    return _file_stamp(path)
+
+
+class QuestionBank:
+    def __init__(self, path: str = QUESTIONS_PATH, source: str = "startup"):
+        self._path = path
+        raw, self._stamp = _read(path)
+        self._current = BankVersion(raw, 1, source)
+        self._lock = asyncio.Lock()
+        self.reloads = 0
+        self.rejected = 0
+        self.last_error: str | None = None
+
+    @property
+    def current(self) -> BankVersion:
+        return self._current
+
+    async def check_file(self) -> None:
+        """Reload if the file changed since it was last read or written here."""
+        try:
+            stamp = await asyncio.to_thread(_file_stamp, self._path)
+        except OSError:
+            logger.exception("Cannot stat question bank %s", self._path)
+            return
+        if stamp == self._stamp:
+            return
+        async with self._lock:
+            try:
+                raw, stamp = await asyncio.to_thread(_read, self._path)
+            except OSError:
+                logger.exception("Cannot read question bank %s", self._path)
+                return
+            self._stamp = stamp  # a bad file is reported once, not on every poll
+            try:
+                version = await self._build(raw, "file")
+            except QuestionBankError as exc:
+                logger.error("Ignoring invalid question bank %s: %s", self._path, exc)
+                return
+            resized = version.resized_pools(self._current)
+            if resized:
+                logger.warning(
+                    "Question bank %s resized the variant pools of %s; players may get different variants",
+                    self._path,
+                    ", ".join(resized),
+                )
+            self._swap(version)
+
+    async def upload(self, raw: bytes, *, pinned: bool = False) -> BankVersion:
+        """Validate, persist and switch to an uploaded bank; raises QuestionBankError.
+
+        With `pinned` (a session is using the bank), a bank that resizes a
+        variant pool is rejected too.
+        """
+        async with self._lock:
+            version = await self._build(raw, "upload")
+            resized = version.resized_pools(self._current) if pinned else []
+            if resized:
+                self.rejected += 1
+                self.last_error = f"variant pools resized while a session uses this bank: {', '.join(resized)}"
+                raise QuestionBankError(self.last_error)
+            self._stamp = await asyncio.to_thread(_write_atomically, self._path, raw)
+            return self._swap(version)
+
+    async def _build(self, raw: bytes, source: str) -> BankVersion:
+        try:
+            return await asyncio.to_thread(BankVersion, raw, self._current.version + 1, source)
+        except QuestionBankError as exc:
+            self.rejected += 1
+            self.last_error = str(exc)
+            raise
+
+    def _swap(self, version: BankVersion) -> BankVersion:
+        if version.digest == self._current.digest:
+            return self._current  # same content (file touched, or re-uploaded)
+        self._current = version
+        self.reloads += 1
+        logger.info("Question bank v%d (%s) loaded from %s", version.version, version.digest, version.source)
+        return version
+
+    def metrics(self) -> dict:
+        return {
+            **self._current.describe(),
+            "path": self._path,
+            "reloads": self.reloads,
+            "rejected": self.rejected,
+            "last_error": self.last_error,
+        }
+
+
+class QuestionSets:
+    """The default bank plus the named sets sessions were created with, each loaded once."""
+
+    def __init__(self, default: QuestionBank, directory: str = QUESTION_SETS_DIR):
+        self.default = default
+        self._directory = directory
+        self._banks: dict[str, QuestionBank] = {}
+        self._lock = asyncio.Lock()  # one read per set, however many requests need it first
+        # Sets that failed to load: the file stamp they failed at (None: missing) and why.
+        # Sessions skip them until the watcher sees the file change.
+        self._broken: dict[str, tuple[tuple[int, int] | None, str]] = {}
+
+    def _path_of(self, name: str) -> str:
+        if not _SET_NAME.match(name):
+            raise QuestionBankError(f"invalid question set name {name!r} (letters, digits, '-' and '_')")
+        return os.path.join(self._directory, f"{name}.json")
+
+    def _open(self, name: str) -> QuestionBank:
+        try:
+            return QuestionBank(self._path_of(name), source="file")
+        except FileNotFoundError as exc:
+            raise QuestionBankError(f"unknown question set {name!r}") from exc
+
+    async def load(self, name: str | None) -> QuestionBank:
+        """The bank for a set name (None: the default), read off the event loop the first time."""
+        return await self._load(name, retry=True)
+
+    async def _load(self, name: str | None, retry: bool) -> QuestionBank:
+        if name is None:
+            return self.default
+        if name not in self._banks:
+            if not retry and name in self._broken:
+                raise QuestionBankError(self._broken[name][1])
+            async with self._lock:
+                if name not in self._banks:
+                    if not retry and name in self._broken:
+                        raise QuestionBankError(self._broken[name][1])
+                    await self._open_locked(name)
+        return self._banks[name]
+
+    async def _open_locked(self, name: str) -> None:
+        path = self._path_of(name)
+        stamp = await asyncio.to_thread(_stamp_or_none, path)
+        try:
+            bank = await asyncio.to_thread(self._open, name)
+        except QuestionBankError as exc:
+            previous = self._broken.get(name)
+            if previous is None or previous[0] != stamp:  # once per version of the file
+                logger.error("Question set %r is unusable (%s); sessions using it get the default bank", name, exc)
+            self._broken[name] = (stamp, str(exc))
+            raise
+        self._broken.pop(name, None)
+        self._banks[name] = bank
+
+    async def for_session(self, session) -> BankVersion:
+        """The bank version a session's questions come from."""
+        name = session.question_set
+        if name is None:
+            return self.default.current
+        bank = self._banks.get(name)
+        if bank is None:
+            try:
+                bank = await self._load(name, retry=False)  # e.g. first use after a restart, or on another worker
+            except QuestionBankError:
+                return self.default.current  # logged once, when it failed
+        return bank.current
+
+    async def upload(self, name: str | None, raw: bytes, *, pinned: bool = False) -> BankVersion:
+        """Validate and store a bank, creating the set if it is new; raises QuestionBankError."""
+        if name is None:
+            return await self.default.upload(raw, pinned=pinned)
+        path = self._path_of(name)
+        bank = self._banks.get(name)
+        if bank is None and os.path.exists(path):
+            with suppress(QuestionBankError):  # an unusable file is simply replaced
+                bank = await self.load(name)
+        if bank is not None:
+            return await bank.upload(raw, pinned=pinned)
+        await asyncio.to_thread(BankVersion, raw, 1, "upload")  # validate before writing anything
+        await asyncio.to_thread(os.makedirs, self._directory, exist_ok=True)
+        await asyncio.to_thread(_write_atomically, path, raw)
+        return (await self.load(name)).current
+
+    async def check_files(self) -> None:
+        for bank in (self.default, *self._banks.values()):
+            await bank.check_file()
+        for name, (stamp, _) in list(self._broken.items()):
+            if await asyncio.to_thread(_stamp_or_none, self._path_of(name)) != stamp:
+                del self._broken[name]  # changed: the next session request tries it again
+
+    def available(self) -> list[str]:
+        if not os.path.isdir(self._directory):
+            return []
+        names = (entry.removesuffix(".json") for entry in os.listdir(self._directory) if entry.endswith(".json"))
+        return sorted(name for name in names if _SET_NAME.match(name))
+
+    def metrics(self) -> dict:
+        return {
+            "default": self.default.metrics(),
+            "sets": {name: bank.metrics() for name, bank in self._banks.items()},
+            "unusable": {name: error for name, (_, error) in self._broken.items()},
+            "available": self.available(),
+        }
+
+
+question_bank = QuestionBank()
+question_sets = QuestionSets(question_bank)
@@ -1,40 +1,231 @@
 import asyncio
-from typing import Any
+import json
+import logging
+import statistics
+import time
+from collections import deque
+from contextlib import suppress
+from typing import Any, Callable
 
 from fastapi import WebSocket
 
+from services.broker import broker
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the stdlib encoder
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+# Frames a socket may have waiting before it is treated as a slow consumer and dropped.
+SEND_QUEUE_LIMIT = 64
+SEND_TIMEOUT_SECONDS = 2.0
+# Only the newest of these matters, so a queued older one is replaced instead of piling up.
+COALESCED_EVENTS = frozenset({"session_update"})
+_LATENCY_SAMPLES = 1024
+
+ADMIN_TOPIC = "admin"
+
+
+def session_topic(session_id: int) -> str:
+    return f"session:{session_id}"
+
+
+def player_topic(player_id: int) -> str:
+    return f"player:{player_id}"
+
+
+def encode_message(event: str, payload: Any) -> str:
+    """Serialize an event once into the text frame sent to every socket."""
+    message = {"event": event, "payload": payload}
+    if orjson is not None:
+        return orjson.dumps(message).decode("utf-8")
+    return json.dumps(message, ensure_ascii=False, separators=(",", ":"))
+
+
+class _Subscriber:
+    __slots__ = ("websocket", "queue", "wakeup", "task", "topics")
+
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.queue: deque[tuple[str, str]] = deque()
+        self.wakeup = asyncio.Event()
+        self.task: asyncio.Task | None = None
+        self.topics: frozenset[str] = frozenset()
+
 
 class ConnectionManager:
-    def __init__(self):
-        self._connections: set[WebSocket] = set()
-        self._lock = asyncio.Lock()
+    """Fans frames out to sockets through one bounded queue + writer task per socket.
+
+    `broadcast` only enqueues, so a stalled client never delays the others
+    (or the timer loop that calls it).  Events published with a topic only
+    reach sockets that subscribed to it (`session:{id}`, `admin`,
+    `player:{id}`); events without a topic go to every socket.
+
+    Broadcasts travel through `services.broker`, so with the hub backend
+    every worker process delivers them to the sockets it holds.
+    """
+
+    def __init__(self, queue_limit: int = SEND_QUEUE_LIMIT):
+        self._subscribers: dict[WebSocket, _Subscriber] = {}
+        self._topics: dict[str, set[_Subscriber]] = {}
+        self._listeners: dict[str, list[Callable[[Any], None]]] = {}
+        self._queue_limit = queue_limit
+        self._frames_enqueued = 0
+        self._frames_sent = 0
+        self._frames_coalesced = 0
+        self._frames_dropped = 0
+        self._slow_consumers_dropped = 0
+        self._send_latency_ms: deque[float] = deque(maxlen=_LATENCY_SAMPLES)
 
     async def connect(self, websocket: WebSocket) -> None:
         await websocket.accept()
-        async with self._lock:
-            self._connections.add(websocket)
+        subscriber = _Subscriber(websocket)
+        subscriber.task = asyncio.create_task(self._writer(subscriber))
+        self._subscribers[websocket] = subscriber
 
     async def disconnect(self, websocket: WebSocket) -> None:
-        async with self._lock:
-            if websocket in self._connections:
-                self._connections.remove(websocket)
+        subscriber = self._forget(websocket)
+        if subscriber and subscriber.task:
+            subscriber.task.cancel()
+
+    def _forget(self, websocket: WebSocket) -> _Subscriber | None:
+        subscriber = self._subscribers.pop(websocket, None)
+        if subscriber:
+            self._set_topics(subscriber, frozenset())
+        return subscriber
+
+    def _set_topics(self, subscriber: _Subscriber, topics: frozenset[str]) -> None:
+        for topic in subscriber.topics - topics:
+            members = self._topics.get(topic)
+            if members is not None:
+                members.discard(subscriber)
+                if not members:
+                    del self._topics[topic]
+        for topic in topics - subscriber.topics:
+            self._topics.setdefault(topic, set()).add(subscriber)
+        subscriber.topics = topics
+
+    def subscribe(self, websocket: WebSocket, topics: set[str]) -> None:
+        """Replace the topics a socket listens to."""
+        subscriber = self._subscribers.get(websocket)
+        if subscriber:
+            self._set_topics(subscriber, frozenset(topics))
+
+    def topics_of(self, websocket: WebSocket) -> frozenset[str]:
+        subscriber = self._subscribers.get(websocket)
+        return subscriber.topics if subscriber else frozenset()
+
+    def has_subscribers(self, topic: str) -> bool:
+        # Other workers' sockets are invisible here, so assume someone may be listening.
+        return broker.distributed or topic in self._topics
+
+    def add_listener(self, event: str, callback: Callable[[Any], None]) -> None:
+        """Observe every published `event` payload, in broker order, before fan-out."""
+        self._listeners.setdefault(event, []).append(callback)
+
+    async def broadcast(self, event: str, payload: Any, topic: str | None = None) -> None:
+        self.publish(event, payload, topic)
+
+    def publish(self, event: str, payload: Any, topic: str | None = None) -> None:
+        """Non-async form of `broadcast` for callers outside a coroutine."""
+        broker.publish("realtime", {"event": event, "payload": payload, "topic": topic})
+
+    def _on_published(self, message: dict) -> None:
+        event, payload, topic = message["event"], message["payload"], message["topic"]
+        for callback in self._listeners.get(event, ()):
+            callback(payload)
+        targets = self._subscribers.values() if topic is None else self._topics.get(topic)
+        if not targets:
+            return
+        frame = encode_message(event, payload)
+        for subscriber in list(targets):
+            self._enqueue(subscriber, event, frame)
+
+    async def send(self, websocket: WebSocket, event: str, payload: Any) -> None:
+        """Queue a frame for a single socket, behind anything already queued for it."""
+        subscriber = self._subscribers.get(websocket)
+        if subscriber:
+            self._enqueue(subscriber, event, encode_message(event, payload))
+
+    def _enqueue(self, subscriber: _Subscriber, event: str, frame: str) -> None:
+        queue = subscriber.queue
+        if event in COALESCED_EVENTS:
+            for index, (queued_event, _) in enumerate(queue):
+                if queued_event == event:
+                    del queue[index]
+                    self._frames_coalesced += 1
+                    break
+        if len(queue) >= self._queue_limit:
+            self._drop_slow_consumer(subscriber)
+            return
+        queue.append((event, frame))
+        self._frames_enqueued += 1
+        subscriber.wakeup.set()
+
+    def _drop_slow_consumer(self, subscriber: _Subscriber) -> None:
+        if self._forget(subscriber.websocket) is None:
+            return
+        self._frames_dropped += len(subscriber.queue) + 1
+        self._slow_consumers_dropped += 1
+        subscriber.queue.clear()
+        if subscriber.task:
+            subscriber.task.cancel()
+        logger.warning("Dropping slow websocket consumer (queue limit %d reached)", self._queue_limit)
+        asyncio.create_task(self._close(subscriber.websocket))
 
-    async def broadcast(self, event: str, payload: Any) -> None:
-        message = {"event": event, "payload": payload}
-        async with self._lock:
-            connections = list(self._connections)
+    @staticmethod
+    async def _close(websocket: WebSocket) -> None:
+        with suppress(Exception):
+            await websocket.close()
 
-        stale: list[WebSocket] = []
-        for conn in connections:
-            try:
-                await asyncio.wait_for(conn.send_json(message), timeout=2.0)
-            except Exception:
-                stale.append(conn)
+    async def _writer(self, subscriber: _Subscriber) -> None:
+        websocket = subscriber.websocket
+        queue = subscriber.queue
+        try:
+            while True:
+                while not queue:
+                    subscriber.wakeup.clear()
+                    await subscriber.wakeup.wait()
+                _, frame = queue.popleft()
+                started = time.perf_counter()
+                await asyncio.wait_for(websocket.send_text(frame), timeout=SEND_TIMEOUT_SECONDS)
+                self._send_latency_ms.append((time.perf_counter() - started) * 1000)
+                self._frames_sent += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Send failed or timed out: the socket is gone or hopelessly slow.
+            if self._forget(websocket) is not None:
+                self._frames_dropped += len(queue)
+                queue.clear()
+            # Close it too, so a client still connected notices and reconnects.
+            await self._close(websocket)
 
-        if stale:
-            async with self._lock:
-                for conn in stale:
-                    self._connections.discard(conn)
+    def metrics(self) -> dict:
+        depths = [len(subscriber.queue) for subscriber in self._subscribers.values()]
+        latencies = sorted(self._send_latency_ms)
+        return {
+            "connections": len(depths),
+            "topics": len(self._topics),
+            "queue_depth_total": sum(depths),
+            "queue_depth_max": max(depths, default=0),
+            "queue_limit": self._queue_limit,
+            "frames_enqueued": self._frames_enqueued,
+            "frames_sent": self._frames_sent,
+            "frames_coalesced": self._frames_coalesced,
+            "frames_dropped": self._frames_dropped,
+            "slow_consumers_dropped": self._slow_consumers_dropped,
+            "send_latency_ms": {
+                "samples": len(latencies),
+                "avg": round(statistics.fmean(latencies), 3) if latencies else None,
+                "p50": round(latencies[len(latencies) // 2], 3) if latencies else None,
+                "p99": round(latencies[int(len(latencies) * 0.99)], 3) if latencies else None,
+                "max": round(latencies[-1], 3) if latencies else None,
+            },
+        }
 
 
 manager = ConnectionManager()
+broker.subscribe("realtime", manager._on_published)
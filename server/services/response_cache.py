@@ -0,0 +1,143 @@
+"""
+Single-flight, micro-TTL cache for hot GET responses.
+
+When a session starts every client asks for `game_status` and the
+leaderboard within the same few hundred milliseconds, and each request
+used to rank, build and serialize the same answer on its own.  (Question
+payloads change only when the question bank is reloaded, so they are
+pre-rendered with each bank version instead; see
+`services.static_responses`.)
+Routes now hand `get()` a key, the version of the state the answer depends
+on and a coroutine that computes it:
+
+  * a cached body is reused while it is younger than the TTL and its
+    version still matches (`session_state.version`, the leaderboard
+    index's version), so a state change is never served stale for longer
+    than it takes the next request to notice the bump
+  * requests for a key whose body is being computed await that one
+    computation instead of starting their own
+  * the payload is serialized once; hits return the stored bytes
+
+The TTL comes from `QUESTARENA_RESPONSE_CACHE_MS` (default 500); 0 turns
+the cache off, so every request computes its own response.  Hits, misses
+and coalesced requests are counted per route; see `metrics()`.
+"""
+
+import asyncio
+import json
+import os
+import time
+from collections import Counter
+from typing import Any, Awaitable, Callable, Hashable
+
+from fastapi import Response
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the stdlib encoder
+    orjson = None
+
+TTL_SECONDS = float(os.getenv("QUESTARENA_RESPONSE_CACHE_MS", "500")) / 1000
+MAX_ENTRIES = 1024
+
+Compute = Callable[[], Awaitable[Any]]
+
+
+def _encode(payload: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _json_response(body: bytes) -> Response:
+    return Response(content=body, media_type="application/json")
+
+
+class _Entry:
+    __slots__ = ("body", "version", "expires_at")
+
+    def __init__(self, body: bytes, version: Hashable, expires_at: float):
+        self.body = body
+        self.version = version
+        self.expires_at = expires_at
+
+
+class ResponseCache:
+    def __init__(self, ttl: float = TTL_SECONDS, max_entries: int = MAX_ENTRIES):
+        self.ttl = ttl
+        self._max_entries = max_entries
+        self._entries: dict[tuple, _Entry] = {}
+        self._inflight: dict[tuple, asyncio.Future] = {}
+        self._hits: Counter[str] = Counter()
+        self._misses: Counter[str] = Counter()
+        self._coalesced: Counter[str] = Counter()
+
+    async def get(self, route: str, params: tuple, version: Hashable, compute: Compute) -> Response:
+        """The JSON response for `route(*params)` at `version`, computed at most once at a time."""
+        if self.ttl <= 0:
+            self._misses[route] += 1
+            return _json_response(_encode(await compute()))
+
+        key = (route, params)
+        entry = self._entries.get(key)
+        if entry is not None and entry.version == version and entry.expires_at > time.monotonic():
+            self._hits[route] += 1
+            return _json_response(entry.body)
+
+        flight = (key, version)
+        waiting = self._inflight.get(flight)
+        while waiting is not None:
+            # Shielded: a client that disconnects must not cancel the shared result.
+            body = await asyncio.shield(waiting)
+            if body is not None:
+                self._coalesced[route] += 1
+                return _json_response(body)
+            waiting = self._inflight.get(flight)  # its computation was cancelled: take over
+        self._misses[route] += 1
+        return _json_response(await self._compute(flight, compute))
+
+    async def _compute(self, flight: tuple, compute: Compute) -> bytes:
+        # Computed inline by the first request; later ones wait on `done`.
+        done = self._inflight[flight] = asyncio.get_running_loop().create_future()
+        try:
+            body = _encode(await compute())
+        except Exception as exc:
+            done.set_exception(exc)
+            done.exception()  # retrieved, whether or not anyone was waiting
+            raise
+        except BaseException:
+            done.set_result(None)
+            raise
+        finally:
+            del self._inflight[flight]
+        done.set_result(body)
+        key, version = flight
+        self._store(key, _Entry(body, version, time.monotonic() + self.ttl))
+        return body
+
+    def _store(self, key: tuple, entry: _Entry) -> None:
+        if key not in self._entries and len(self._entries) >= self._max_entries:
+            now = time.monotonic()
+            self._entries = {k: e for k, e in self._entries.items() if e.expires_at > now}
+            if len(self._entries) >= self._max_entries:
+                self._entries.clear()
+        self._entries[key] = entry
+
+    def metrics(self) -> dict:
+        routes = sorted(set(self._hits) | set(self._misses) | set(self._coalesced))
+        return {
+            "ttl_ms": self.ttl * 1000,
+            "entries": len(self._entries),
+            "inflight": len(self._inflight),
+            "routes": {
+                route: {
+                    "hits": self._hits[route],
+                    "misses": self._misses[route],
+                    "coalesced": self._coalesced[route],
+                }
+                for route in routes
+            },
+        }
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,237 @@
+"""
+Background job scheduler.
+
+Jobs are named coroutines, either periodic (`every`) or one-shot at a wall
+clock time (`run_at`).  A single task sleeps until the earliest job is due;
+`wake()` cuts that sleep short, optionally pulling a job forward, so state
+changes (a session starting, time being added) take effect immediately
+instead of on the next poll.
+
+Each due job runs as its own task, so a slow one (a reconcile query, a
+write queued behind a batch, a question bank recompile) never holds up the
+countdown or the session deadline.  A job still running when it falls due
+again is skipped until that run finishes.
+
+Jobs only run on the broker leader unless registered with
+`leader_only=False` (per-worker housekeeping); other workers keep the same
+job table, so a new leader picks it up, and run just their own jobs.
+
+Every job records when it last ran, how long it took, how late it started
+(lag) and how many runs raised; see `metrics()`.
+"""
+
+import asyncio
+import logging
+import statistics
+import time
+from collections import deque
+from contextlib import suppress
+from datetime import datetime
+from typing import Awaitable, Callable
+
+from services.broker import broker
+
+logger = logging.getLogger(__name__)
+
+FOLLOWER_POLL_SECONDS = 1.0
+_LAG_SAMPLES = 256
+
+JobFn = Callable[[], Awaitable[None]]
+
+
+class _Job:
+    __slots__ = (
+        "name",
+        "fn",
+        "interval",
+        "leader_only",
+        "due_at",
+        "runs",
+        "errors",
+        "last_error",
+        "last_run_at",
+        "last_duration_ms",
+        "lag_ms",
+    )
+
+    def __init__(self, name: str, fn: JobFn, interval: float | None, due_at: float, leader_only: bool = True):
+        self.name = name
+        self.fn = fn
+        self.interval = interval
+        self.leader_only = leader_only
+        self.due_at = due_at
+        self.runs = 0
+        self.errors = 0
+        self.last_error: str | None = None
+        self.last_run_at: datetime | None = None
+        self.last_duration_ms: float | None = None
+        self.lag_ms: deque[float] = deque(maxlen=_LAG_SAMPLES)
+
+    def metrics(self, now: float, pending: bool = True) -> dict:
+        lags = sorted(self.lag_ms)
+        return {
+            "kind": "periodic" if self.interval is not None else "one_shot",
+            "interval_seconds": self.interval,
+            "leader_only": self.leader_only,
+            "next_run_in_seconds": round(max(0.0, self.due_at - now), 3) if pending else None,
+            "runs": self.runs,
+            "errors": self.errors,
+            "last_error": self.last_error,
+            "last_run_at": self.last_run_at.isoformat() if self.last_run_at else None,
+            "last_duration_ms": round(self.last_duration_ms, 3) if self.last_duration_ms is not None else None,
+            "lag_ms": {
+                "last": round(self.lag_ms[-1], 3) if lags else None,
+                "avg": round(statistics.fmean(lags), 3) if lags else None,
+                "max": round(lags[-1], 3) if lags else None,
+            },
+        }
+
+
+class Scheduler:
+    def __init__(self):
+        self._jobs: dict[str, _Job] = {}
+        self._finished: dict[str, _Job] = {}
+        self._wakeup: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+        self._running: dict[str, asyncio.Task] = {}
+
+    def every(
+        self,
+        name: str,
+        interval: float,
+        fn: JobFn,
+        *,
+        run_now: bool = False,
+        leader_only: bool = True,
+    ) -> None:
+        """Register a periodic job; it first runs after one interval unless `run_now`."""
+        due_at = time.monotonic() + (0.0 if run_now else interval)
+        self._jobs[name] = _Job(name, fn, interval, due_at, leader_only)
+        self._notify()
+
+    def run_at(self, name: str, when: float, fn: JobFn) -> None:
+        """Schedule a one-shot job at epoch time `when`, replacing any pending job of that name."""
+        due_at = time.monotonic() + max(0.0, when - time.time())
+        previous = self._jobs.get(name) or self._finished.pop(name, None)
+        job = _Job(name, fn, None, due_at)
+        if previous is not None:
+            job.runs, job.errors, job.last_error = previous.runs, previous.errors, previous.last_error
+            job.last_run_at, job.last_duration_ms, job.lag_ms = (
+                previous.last_run_at,
+                previous.last_duration_ms,
+                previous.lag_ms,
+            )
+        self._jobs[name] = job
+        self._notify()
+
+    def cancel(self, name: str) -> None:
+        job = self._jobs.pop(name, None)
+        if job is not None and job.interval is None:
+            self._finished[name] = job
+
+    def wake(self, name: str | None = None) -> None:
+        """Interrupt the sleep; with a name, also make that job due right away."""
+        job = self._jobs.get(name) if name else None
+        if job is not None:
+            job.due_at = min(job.due_at, time.monotonic())
+        self._notify()
+
+    def _notify(self) -> None:
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+            self._wakeup = None
+        running = list(self._running.values())
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            leader = broker.is_leader
+            now = time.monotonic()
+            for job in sorted(self._runnable(leader), key=lambda job: job.due_at):
+                if job.due_at > now:
+                    break
+                self._start_job(job)
+
+            next_due = min((job.due_at for job in self._runnable(leader)), default=None)
+            timeout = None if next_due is None else next_due - time.monotonic()
+            if not leader:
+                # Keep checking whether this worker has taken over the leadership.
+                timeout = FOLLOWER_POLL_SECONDS if timeout is None else min(timeout, FOLLOWER_POLL_SECONDS)
+            await self._sleep(timeout)
+
+    def _runnable(self, leader: bool) -> list[_Job]:
+        """Jobs this worker may start now: not leader-only on a follower, and not already running."""
+        return [
+            job
+            for job in self._jobs.values()
+            if (leader or not job.leader_only) and job.name not in self._running
+        ]
+
+    def _start_job(self, job: _Job) -> None:
+        task = asyncio.create_task(self._run_job(job), name=f"scheduler:{job.name}")
+        self._running[job.name] = task
+        task.add_done_callback(lambda _: self._job_finished(job.name, task))
+
+    def _job_finished(self, name: str, task: asyncio.Task) -> None:
+        if self._running.get(name) is task:
+            del self._running[name]
+        self._notify()  # its next run is due at a new time
+
+    async def _sleep(self, timeout: float | None) -> None:
+        if timeout is not None and timeout <= 0:
+            return
+        with suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+
+    async def _run_job(self, job: _Job) -> None:
+        started = time.monotonic()
+        job.lag_ms.append(max(0.0, started - job.due_at) * 1000)
+        job.last_run_at = datetime.utcnow()
+        try:
+            await job.fn()
+        except Exception as exc:
+            job.errors += 1
+            job.last_error = repr(exc)
+            logger.exception("Scheduled job %r failed", job.name)
+        finally:
+            job.runs += 1
+            job.last_duration_ms = (time.monotonic() - started) * 1000
+
+        if job.interval is None:
+            # One-shot: retire it unless the job re-armed itself while running.
+            if self._jobs.get(job.name) is job:
+                del self._jobs[job.name]
+                self._finished[job.name] = job
+            return
+        next_due = job.due_at + job.interval
+        finished = time.monotonic()
+        job.due_at = next_due if next_due > finished else finished + job.interval
+
+    def metrics(self) -> dict:
+        now = time.monotonic()
+        return {
+            "leader": broker.is_leader,
+            "running": sorted(self._running),
+            "jobs": {
+                **{name: job.metrics(now, pending=False) for name, job in self._finished.items()},
+                **{name: job.metrics(now) for name, job in self._jobs.items()},
+            },
+        }
+
+
+scheduler = Scheduler()
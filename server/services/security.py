@@ -1,29 +1,34 @@
 import os
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from typing import Any, Dict
 
 import jwt
 from fastapi import Depends, HTTPException
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from database import get_db
 from models import Player
+from services.broker import RESYNC_CHANNEL, broker
 
 JWT_SECRET = os.getenv("QUESTARENA_JWT_SECRET", "questarena-dev-secret")
 JWT_ALGO = "HS256"
 PLAYER_TOKEN_HOURS = 10
 ADMIN_TOKEN_HOURS = 12
+PRINCIPAL_CACHE_SIZE = int(os.getenv("QUESTARENA_PRINCIPAL_CACHE_SIZE", "4096"))
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/unused", auto_error=False)
 
 
-def create_player_token(player_id: int, session_id: int, username: str) -> str:
+def create_player_token(player_id: int, session_id: int, username: str, generation: int) -> str:
     payload = {
         "sub": str(player_id),
         "session_id": session_id,
         "username": username,
         "role": "player",
+        "gen": generation,
         "exp": datetime.utcnow() + timedelta(hours=PLAYER_TOKEN_HOURS),
         "iat": datetime.utcnow(),
     }
@@ -46,26 +51,180 @@ def decode_token(token: str) -> Dict[str, Any]:
         raise HTTPException(status_code=401, detail="Invalid token") from exc
 
 
-def get_current_player(
-    token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db),
-) -> Player:
-    if not token:
-        raise HTTPException(status_code=401, detail="Missing bearer token")
-
+def token_generation(payload: Dict[str, Any]) -> int:
+    """The generation a player token was issued at; tokens from before generations count as 0."""
+    return int(payload.get("gen", 0))
+
+
+class PlayerPrincipal:
+    """The authenticated caller of a player route: enough to act on, without the row."""
+
+    __slots__ = ("id", "session_id", "username", "generation", "expires_at")
+
+    def __init__(self, id: int, session_id: int, username: str, generation: int, expires_at: float):
+        self.id = id
+        self.session_id = session_id
+        self.username = username
+        self.generation = generation
+        self.expires_at = expires_at
+
+
+class PrincipalCache:
+    """Bounded LRU from a verified player token to its principal.
+
+    A hit skips the JWT signature check and the player lookup.  Entries
+    are dropped explicitly whenever a token stops being valid - kick, ban,
+    progress reset, rejoin, session end - right away in the worker that
+    revoked it and through `services.broker` in the others; `exp` is still
+    checked on every hit.
+
+    Other workers can serve a revoked principal until the broker frame
+    arrives (or the next resync, if it was lost).  Routes that change the
+    player's row guard their writes on the generation and ban flag; the
+    heartbeat and activity routes only touch presence and the audit log,
+    and tolerate that window.
+    """
+
+    def __init__(self, max_size: int = PRINCIPAL_CACHE_SIZE):
+        self._max_size = max_size
+        self._entries: OrderedDict[str, PlayerPrincipal] = OrderedDict()
+        self._tokens_of: dict[int, set[str]] = {}
+        # Bumped by every invalidation, so a lookup that raced one is not cached.
+        self._version = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, token: str) -> PlayerPrincipal | None:
+        principal = self._entries.get(token)
+        if principal is not None and principal.expires_at > time.time():
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return principal
+        if principal is not None:
+            self._discard(token)
+        self.misses += 1
+        return None
+
+    def put(self, token: str, principal: PlayerPrincipal, version: int) -> None:
+        if version != self._version:
+            return
+        self._entries[token] = principal
+        self._tokens_of.setdefault(principal.id, set()).add(token)
+        while len(self._entries) > self._max_size:
+            self._discard(next(iter(self._entries)))
+            self.evictions += 1
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def invalidate_player(self, player_id: int) -> None:
+        self._invalidate({"op": "player", "player_id": player_id})
+
+    def invalidate_session(self, session_id: int) -> None:
+        self._invalidate({"op": "session", "session_id": session_id})
+
+    def _invalidate(self, message: dict) -> None:
+        self._apply(message)  # this worker at once; the broker copy then finds nothing left
+        broker.publish("principals", message)
+
+    def resync(self, message: dict) -> None:
+        """Broker frames (invalidations among them) may have been lost: drop every entry in this worker."""
+        self._apply({"op": "all"})
+
+    def _apply(self, message: dict) -> None:
+        self._version += 1
+        self.invalidations += 1
+        if message["op"] == "all":
+            self._entries.clear()
+            self._tokens_of.clear()
+        elif message["op"] == "player":
+            for token in list(self._tokens_of.get(message["player_id"], ())):
+                self._discard(token)
+        elif message["op"] == "session":
+            session_id = message["session_id"]
+            for token in [token for token, principal in self._entries.items() if principal.session_id == session_id]:
+                self._discard(token)
+
+    def _discard(self, token: str) -> None:
+        principal = self._entries.pop(token, None)
+        if principal is None:
+            return
+        tokens = self._tokens_of.get(principal.id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_of[principal.id]
+
+    def metrics(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "max_size": self._max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+principal_cache = PrincipalCache()
+broker.subscribe("principals", principal_cache._apply)
+broker.subscribe(RESYNC_CHANNEL, principal_cache.resync)
+
+
+async def resolve_principal(db: AsyncSession, token: str) -> PlayerPrincipal:
+    principal = principal_cache.get(token)
+    if principal is not None:
+        return principal
+
+    version = principal_cache.version
     payload = decode_token(token)
     if payload.get("role") != "player":
         raise HTTPException(status_code=401, detail="Invalid player token")
 
     player_id = payload.get("sub")
-    player = db.query(Player).filter(Player.id == int(player_id)).first() if player_id else None
+    player = await db.get(Player, int(player_id)) if player_id else None
     if not player:
         raise HTTPException(status_code=401, detail="Player not found")
     if player.is_banned:
         raise HTTPException(status_code=403, detail="Player is banned")
-    if player.auth_token != token:
+    if token_generation(payload) != player.token_generation:
         raise HTTPException(status_code=401, detail="Token no longer valid")
 
+    principal = PlayerPrincipal(
+        player.id, player.session_id, player.username, player.token_generation, float(payload.get("exp", 0))
+    )
+    principal_cache.put(token, principal, version)
+    return principal
+
+
+async def get_current_principal(
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_db),
+) -> PlayerPrincipal:
+    """Authenticate a player route that needs no more than the caller's identity."""
+    if not token:
+        raise HTTPException(status_code=401, detail="Missing bearer token")
+    return await resolve_principal(db, token)
+
+
+async def get_current_player(
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_db),
+) -> Player:
+    if not token:
+        raise HTTPException(status_code=401, detail="Missing bearer token")
+    principal = await resolve_principal(db, token)
+    player = await db.get(Player, principal.id)  # from the identity map right after a cache miss
+    if not player:
+        raise HTTPException(status_code=401, detail="Player not found")
+    if player.is_banned:
+        raise HTTPException(status_code=403, detail="Player is banned")
+    if player.token_generation != principal.generation:
+        # Revoked since the principal was cached: the row is authoritative, whatever the cache says.
+        raise HTTPException(status_code=401, detail="Token no longer valid")
     return player
 
 
@@ -0,0 +1,177 @@
+"""
+Deadline-based session clock.
+
+A running session stores an absolute `ends_at` deadline and the time left is
+derived from it on read, so nothing is written while the clock runs.
+`remaining_seconds` holds the time left as of the last state transition,
+which is what waiting, paused and ended sessions report.  Only transitions
+(start, pause, resume, add/subtract time, end) touch the database.
+
+`running_clock` mirrors the live session's clock in every worker (through
+the broker) so the per-second countdown broadcast needs no query, and keeps
+a one-shot scheduler job armed for the deadline.
+"""
+
+import math
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable
+
+from models import SessionModel
+from services.broker import broker
+from services.scheduler import scheduler
+
+
+def session_remaining_seconds(session: SessionModel, now: datetime | None = None) -> int:
+    if session.status == "running" and session.ends_at is not None:
+        now = now or datetime.utcnow()
+        return max(0, math.ceil((session.ends_at - now).total_seconds()))
+    return max(0, int(session.remaining_seconds or 0))
+
+
+def session_update_payload(session: SessionModel) -> dict:
+    return {
+        "session_id": session.id,
+        "status": session.status,
+        "remaining_seconds": session_remaining_seconds(session),
+        "duration_minutes": session.duration_minutes,
+    }
+
+
+def start_clock(session: SessionModel, now: datetime | None = None) -> None:
+    now = now or datetime.utcnow()
+    if session.status == "paused":
+        resume_clock(session, now)
+        return
+    if session.status == "running":
+        return
+    session.status = "running"
+    if not session.start_time:
+        session.start_time = now
+    session.ends_at = now + timedelta(seconds=max(0, int(session.remaining_seconds or 0)))
+
+
+def pause_clock(session: SessionModel, now: datetime | None = None) -> None:
+    now = now or datetime.utcnow()
+    session.remaining_seconds = session_remaining_seconds(session, now)
+    session.status = "paused"
+    session.ends_at = None
+    session.paused_at = now
+
+
+def resume_clock(session: SessionModel, now: datetime | None = None) -> None:
+    now = now or datetime.utcnow()
+    _settle_pause(session, now)
+    session.status = "running"
+    session.ends_at = now + timedelta(seconds=max(0, int(session.remaining_seconds or 0)))
+
+
+def adjust_clock(session: SessionModel, delta_seconds: int, now: datetime | None = None) -> int:
+    """Add (or with a negative delta, take away) time; returns the new time left."""
+    now = now or datetime.utcnow()
+    remaining = max(0, session_remaining_seconds(session, now) + delta_seconds)
+    session.remaining_seconds = remaining
+    if session.status == "running":
+        session.ends_at = now + timedelta(seconds=remaining)
+    return remaining
+
+
+def stop_clock(session: SessionModel, now: datetime | None = None, remaining: int | None = None) -> None:
+    """End the session, keeping the time that was left unless `remaining` overrides it."""
+    now = now or datetime.utcnow()
+    session.remaining_seconds = session_remaining_seconds(session, now) if remaining is None else remaining
+    _settle_pause(session, now)
+    session.status = "ended"
+    session.end_time = now
+    session.ends_at = None
+
+
+def _settle_pause(session: SessionModel, now: datetime) -> None:
+    if session.paused_at is not None:
+        paused = int((now - session.paused_at).total_seconds())
+        session.paused_seconds = (session.paused_seconds or 0) + max(0, paused)
+        session.paused_at = None
+
+
+def _epoch(value: datetime | None) -> float | None:
+    return value.replace(tzinfo=timezone.utc).timestamp() if value else None
+
+
+class _ClockState:
+    __slots__ = ("session_id", "status", "ends_at", "remaining_seconds", "duration_minutes")
+
+    def __init__(self, session_id, status, ends_at, remaining_seconds, duration_minutes):
+        self.session_id = session_id
+        self.status = status
+        self.ends_at = ends_at
+        self.remaining_seconds = remaining_seconds
+        self.duration_minutes = duration_minutes
+
+    def remaining(self) -> int:
+        if self.status == "running" and self.ends_at is not None:
+            return max(0, math.ceil(self.ends_at - time.time()))
+        return self.remaining_seconds
+
+    def payload(self) -> dict:
+        return {
+            "session_id": self.session_id,
+            "status": self.status,
+            "remaining_seconds": self.remaining(),
+            "duration_minutes": self.duration_minutes,
+        }
+
+
+DeadlineHandler = Callable[[int], Awaitable[None]]
+
+DEADLINE_JOB = "session_deadline"
+COUNTDOWN_JOB = "session_countdown"
+
+
+class RunningClock:
+    """The live session's clock as last published; keeps the deadline job in step with it."""
+
+    def __init__(self):
+        self.current: _ClockState | None = None
+        self._on_deadline: DeadlineHandler | None = None
+
+    def on_deadline(self, handler: DeadlineHandler) -> None:
+        self._on_deadline = handler
+
+    def track(self, session: SessionModel) -> None:
+        """Publish the session's committed clock to every worker."""
+        broker.publish(
+            "session_clock",
+            {
+                "session_id": session.id,
+                "status": session.status,
+                "ends_at": _epoch(session.ends_at) if session.status == "running" else None,
+                "remaining_seconds": session_remaining_seconds(session),
+                "duration_minutes": session.duration_minutes,
+            },
+        )
+
+    def _apply(self, message: dict) -> None:
+        if message["status"] == "ended":
+            if self.current and self.current.session_id != message["session_id"]:
+                return  # an older session ended; the live clock is unaffected
+            self.current = None
+        else:
+            self.current = _ClockState(
+                message["session_id"],
+                message["status"],
+                message["ends_at"],
+                message["remaining_seconds"],
+                message["duration_minutes"],
+            )
+
+        clock = self.current
+        if clock and clock.status == "running" and clock.ends_at is not None and self._on_deadline:
+            handler, session_id = self._on_deadline, clock.session_id
+            scheduler.run_at(DEADLINE_JOB, clock.ends_at, lambda: handler(session_id))
+        else:
+            scheduler.cancel(DEADLINE_JOB)
+        scheduler.wake(COUNTDOWN_JOB)
+
+
+running_clock = RunningClock()
+broker.subscribe("session_clock", running_clock._apply)
@@ -0,0 +1,224 @@
+"""
+The current session, held in memory.
+
+Only the newest session can be live (creating one ends the previous), so
+the "latest live session" query every route used to run is replaced by a
+snapshot of the newest session and its player counters.  It is loaded at
+startup and kept current write-through: whoever commits a change to the
+session calls `track()` (which also republishes the clock), and the routes
+that register, kick, ban, complete or reset a player `adjust_players()`.
+Updates travel through `services.broker` so every worker holds the same
+state.
+
+The counters are total, active, banned and completed players of the
+newest session.  Not every change passes through a route (heartbeats mark
+players active again in bulk, the inactivity sweep marks them inactive),
+so a slow scheduler job `reconcile()`s them against one aggregate query.
+
+`latest` / `live` return a detached `SessionModel` copy: read its fields,
+but load the row by id (`load_live`) to change it.
+"""
+
+import asyncio
+import logging
+from datetime import datetime
+
+from sqlalchemy import case, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from database import AsyncSessionLocal
+from models import Player, SessionModel
+from services.broker import RESYNC_CHANNEL, broker
+from services.session_clock import running_clock
+
+logger = logging.getLogger(__name__)
+
+LIVE_STATUSES = ("waiting", "running", "paused")
+PLAYER_COUNTERS = ("total", "active", "banned", "completed")
+
+_FIELDS = [column.name for column in SessionModel.__table__.columns]
+_DATETIME_FIELDS = {
+    column.name for column in SessionModel.__table__.columns if column.type.python_type is datetime
+}
+
+_LATEST_SESSION = select(SessionModel).order_by(SessionModel.created_at.desc()).limit(1)
+
+
+def _player_counts_query(session_id: int):
+    not_banned = Player.is_banned.is_(False)
+    return select(
+        func.count(Player.id),
+        func.count(case((Player.is_active.is_(True) & not_banned, 1))),
+        func.count(case((Player.is_banned.is_(True), 1))),
+        func.count(case((Player.completed_at.is_not(None) & not_banned, 1))),
+    ).where(Player.session_id == session_id)
+
+
+def _empty_counts() -> dict[str, int]:
+    return dict.fromkeys(PLAYER_COUNTERS, 0)
+
+
+def _encode(session: SessionModel) -> dict:
+    fields = {}
+    for field in _FIELDS:
+        value = getattr(session, field)
+        fields[field] = value.isoformat() if field in _DATETIME_FIELDS and value is not None else value
+    return fields
+
+
+def _decode(fields: dict) -> SessionModel:
+    values = {
+        field: datetime.fromisoformat(value) if field in _DATETIME_FIELDS and value is not None else value
+        for field, value in fields.items()
+    }
+    return SessionModel(**values)
+
+
+class SessionState:
+    def __init__(self):
+        self._session: SessionModel | None = None
+        self._counts = _empty_counts()
+        # Bumped by every counter change, so a reconcile that raced one is not applied.
+        self._counts_version = 0
+        # Bumped by every applied update; cached responses built from the state key on it.
+        self.version = 0
+        self.reconciles = 0
+        self.corrections = 0
+        self._tasks: set[asyncio.Task] = set()
+
+    @property
+    def latest(self) -> SessionModel | None:
+        """The newest session, whatever its status."""
+        return self._session
+
+    @property
+    def live(self) -> SessionModel | None:
+        session = self._session
+        return session if session is not None and session.status in LIVE_STATUSES else None
+
+    @property
+    def player_count(self) -> int:
+        """Players of the newest session, banned ones excluded."""
+        return self._counts["total"] - self._counts["banned"]
+
+    @property
+    def player_counts(self) -> dict[str, int]:
+        """Total, active, banned and completed players of the newest session (active and
+        completed exclude banned players)."""
+        return dict(self._counts)
+
+    async def load_live(self, db: AsyncSession) -> SessionModel | None:
+        """The live session's row, attached to `db` for changes."""
+        live = self.live
+        return await db.get(SessionModel, live.id) if live is not None else None
+
+    def load(self, db: Session) -> SessionModel | None:
+        """Startup: read the newest session and its count (synchronous engine); returns that session.
+
+        With the hub broker the state only lands once the published snapshot
+        comes back, so use the returned row rather than `latest` right after.
+        """
+        session = db.scalars(_LATEST_SESSION).first()
+        counts = dict(zip(PLAYER_COUNTERS, db.execute(_player_counts_query(session.id)).one())) if session else None
+        self._publish_snapshot(session, counts)
+        return session
+
+    async def reload(self, db: AsyncSession) -> None:
+        """Re-read from the database, e.g. after the newest session was deleted."""
+        session = await db.scalar(_LATEST_SESSION)
+        counts = await self._count_players(db, session.id) if session else None
+        self._publish_snapshot(session, counts)
+
+    async def reconcile(self, db: AsyncSession) -> bool:
+        """Re-count the newest session's players; returns True if the counters had drifted."""
+        session, version = self._session, self._counts_version
+        if session is None:
+            return False
+        counts = await self._count_players(db, session.id)
+        self.reconciles += 1
+        if version != self._counts_version or counts == self._counts:
+            return False  # changed meanwhile: the next run checks again
+        logger.info("Player counters of session %s drifted: %s -> %s", session.id, self._counts, counts)
+        self.corrections += 1
+        broker.publish("session_state", {"op": "counts", "session_id": session.id, "counts": counts})
+        return True
+
+    def track(self, session: SessionModel) -> None:
+        """Publish a session's committed state (and clock) to every worker."""
+        running_clock.track(session)
+        broker.publish("session_state", {"op": "session", "session": _encode(session)})
+
+    def adjust_players(
+        self, session_id: int, *, total: int = 0, active: int = 0, banned: int = 0, completed: int = 0
+    ) -> None:
+        """Apply a committed change to a session's player counters (ignored unless it is the newest)."""
+        delta = {"total": total, "active": active, "banned": banned, "completed": completed}
+        delta = {counter: change for counter, change in delta.items() if change}
+        if delta:
+            broker.publish("session_state", {"op": "players", "session_id": session_id, "delta": delta})
+
+    def resync(self, message: dict) -> None:
+        """Broker frames may have been lost: the leader re-reads the newest session and republishes it."""
+        if not broker.is_leader:
+            return
+        task = asyncio.ensure_future(self._reload())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _reload(self) -> None:
+        try:
+            async with AsyncSessionLocal() as db:
+                await self.reload(db)
+        except Exception:
+            logger.exception("Reloading the session state after a broker resync failed")
+
+    def metrics(self) -> dict:
+        return {
+            "session_id": self._session.id if self._session else None,
+            "player_counts": self.player_counts,
+            "reconciles": self.reconciles,
+            "corrections": self.corrections,
+        }
+
+    async def _count_players(self, db: AsyncSession, session_id: int) -> dict[str, int]:
+        row = (await db.execute(_player_counts_query(session_id))).one()
+        return dict(zip(PLAYER_COUNTERS, row))
+
+    def _publish_snapshot(self, session: SessionModel | None, counts: dict[str, int] | None) -> None:
+        if session is not None:
+            running_clock.track(session)
+        broker.publish(
+            "session_state",
+            {"op": "load", "session": _encode(session) if session else None, "player_counts": counts},
+        )
+
+    def _apply(self, message: dict) -> None:
+        op = message["op"]
+        current = self._session
+        self.version += 1
+        if op == "load":
+            self._session = _decode(message["session"]) if message["session"] else None
+            self._counts = message["player_counts"] or _empty_counts()
+            self._counts_version += 1
+        elif op == "session":
+            session = _decode(message["session"])
+            if current is None or session.id > current.id:
+                self._session, self._counts = session, _empty_counts()  # a new session starts empty
+                self._counts_version += 1
+            elif session.id == current.id:
+                self._session = session
+            # else: an older session changed (ended on creating a new one); not tracked
+        elif current is None or message["session_id"] != current.id:
+            return  # counters of a session that is no longer the newest
+        elif op == "players":
+            for counter, change in message["delta"].items():
+                self._counts[counter] = max(0, self._counts[counter] + change)
+            self._counts_version += 1
+        elif op == "counts":
+            self._counts = message["counts"]
+
+
+session_state = SessionState()
+broker.subscribe("session_state", session_state._apply)
+broker.subscribe(RESYNC_CHANNEL, session_state.resync)
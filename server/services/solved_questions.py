@@ -0,0 +1,82 @@
+"""
+Per-player set of cleared question ids, kept in memory.
+
+`submit_answer` used to query `player_question_clears` on every call to
+spot repeats, and players re-submit solved questions constantly (spamming
+the button, or the client retrying on a flaky LAN).  A player's set is
+read from the table the first time it is needed; after that it is kept
+current from the routes - `add` after a credit, `reset` when progress is
+reset or a rejoin moves the player to a new session - so repeats are
+answered from memory.  The first read uses the request's own session: the
+request already holds a pooled connection, and a burst of first submits
+each checking out a second one would drain the pool.
+
+The unique clear row stays the source of truth for crediting; this set
+only decides when the database need not be asked.  Mutations travel
+through `services.broker` so every worker process applies them.
+"""
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import PlayerQuestionClear
+from services.broker import RESYNC_CHANNEL, broker
+
+
+class SolvedQuestions:
+    def __init__(self):
+        self._solved: dict[int, set[str]] = {}
+        # Bumped by every mutation, so a fetch that raced one is not cached.
+        self._versions: dict[int, int] = {}
+        self._epoch = 0
+
+    async def of(self, db: AsyncSession, player_id: int) -> set[str]:
+        """The player's cleared question ids, fetched on the caller's session the first time."""
+        solved = self._solved.get(player_id)
+        if solved is not None:
+            return solved
+        version = (self._epoch, self._versions.get(player_id, 0))
+        rows = await db.scalars(
+            select(PlayerQuestionClear.question_id).where(PlayerQuestionClear.player_id == player_id)
+        )
+        fetched = set(rows)
+        if player_id in self._solved:
+            return self._solved[player_id]  # a concurrent fetch finished first
+        if version == (self._epoch, self._versions.get(player_id, 0)):
+            self._solved[player_id] = fetched
+        return fetched
+
+    def add(self, player_id: int, question_id: str) -> None:
+        broker.publish("solved_questions", {"op": "add", "player_id": player_id, "question_id": question_id})
+
+    def reset(self, player_id: int) -> None:
+        """Forget a player's set; the next read fetches it again."""
+        broker.publish("solved_questions", {"op": "reset", "player_id": player_id})
+
+    def clear(self) -> None:
+        """Forget every set, e.g. after players were deleted and their ids may be reused."""
+        broker.publish("solved_questions", {"op": "clear"})
+
+    def resync(self, message: dict) -> None:
+        """Broker frames may have been lost: forget every set (in this worker only)."""
+        self._apply({"op": "clear"})
+
+    def _apply(self, message: dict) -> None:
+        op = message["op"]
+        if op == "clear":
+            self._solved.clear()
+            self._epoch += 1
+            return
+        player_id = message["player_id"]
+        self._versions[player_id] = self._versions.get(player_id, 0) + 1
+        if op == "add":
+            solved = self._solved.get(player_id)
+            if solved is not None:  # not loaded yet: the first read fetches it from the DB
+                solved.add(message["question_id"])
+        elif op == "reset":
+            self._solved.pop(player_id, None)
+
+
+solved_questions = SolvedQuestions()
+broker.subscribe("solved_questions", solved_questions._apply)
+broker.subscribe(RESYNC_CHANNEL, solved_questions.resync)
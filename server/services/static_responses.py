@@ -0,0 +1,100 @@
+"""
+Pre-rendered JSON responses for content that changes only when it is rebuilt.
+
+A `StaticResponse` serializes its payload once and keeps the body, a gzip
+and a brotli variant and a strong ETag for each: the body's hash, suffixed with the coding for
+the compressed ones (`"<hash>-gzip"`, `"<hash>-br"`), since every
+content-coding is a different representation.  `respond()` then only picks
+a variant for the request: an `If-None-Match` naming any coding of the
+same body gets an empty 304 carrying the chosen variant's tag, otherwise
+the smallest encoding the client accepts is returned as stored bytes.
+Responses are sent with `Cache-Control: no-cache`, so clients keep them but
+revalidate each time, and a reloaded question bank (a new `StaticResponse`
+with a new hash) is picked up on the next fetch.
+"""
+
+import gzip
+import hashlib
+import json
+from typing import Any
+
+from fastapi import Request, Response
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the stdlib encoder
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # in requirements.txt; without it, br is simply not offered
+    brotli = None
+
+CACHE_CONTROL = "no-cache"
+# Bodies smaller than this are sent as they are: compression would not pay for its header.
+MIN_COMPRESS_BYTES = 512
+_CODINGS = ("br", "gzip")
+
+
+def _encode(payload: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _accepted_encodings(header: str) -> set[str]:
+    accepted = set()
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        params = params.strip()
+        q = params[2:] if params.startswith("q=") else "1"
+        try:
+            if float(q) > 0:
+                accepted.add(coding.strip().lower())
+        except ValueError:
+            continue
+    return accepted
+
+
+def _etag_matches(header: str, digest: str) -> bool:
+    """Whether `If-None-Match` names any coding of the body with this digest."""
+    if header.strip() == "*":
+        return True
+    for tag in header.split(","):
+        opaque = tag.strip().removeprefix("W/").strip('"')
+        for coding in _CODINGS:
+            opaque = opaque.removesuffix(f"-{coding}")
+        if opaque == digest:
+            return True
+    return False
+
+
+class StaticResponse:
+    __slots__ = ("body", "digest", "etag", "_variants")
+
+    def __init__(self, payload: Any):
+        self.body = _encode(payload)
+        self.digest = hashlib.sha256(self.body).hexdigest()[:32]
+        self.etag = f'"{self.digest}"'  # the identity representation's
+        # Preferred first; each kept only when it is actually smaller.
+        self._variants: list[tuple[str, bytes]] = []
+        if len(self.body) >= MIN_COMPRESS_BYTES:
+            if brotli is not None:
+                self._variants.append(("br", brotli.compress(self.body)))
+            self._variants.append(("gzip", gzip.compress(self.body, compresslevel=9, mtime=0)))
+            self._variants = [(coding, data) for coding, data in self._variants if len(data) < len(self.body)]
+
+    def respond(self, request: Request) -> Response:
+        accepted = _accepted_encodings(request.headers.get("accept-encoding", ""))
+        coding, data = next(((c, d) for c, d in self._variants if c in accepted), (None, self.body))
+        headers = {
+            "ETag": f'"{self.digest}-{coding}"' if coding else self.etag,
+            "Cache-Control": CACHE_CONTROL,
+            "Vary": "Accept-Encoding",
+        }
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and _etag_matches(if_none_match, self.digest):
+            return Response(status_code=304, headers=headers)
+        if coding:
+            headers["Content-Encoding"] = coding
+        return Response(content=data, media_type="application/json", headers=headers)
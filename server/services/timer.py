@@ -1,70 +1,132 @@
-import asyncio
-from datetime import datetime
+from datetime import datetime, timedelta
 
-from database import SessionLocal
-from models import Log, SessionModel
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from database import AsyncSessionLocal
+from models import SessionModel
 from services.anti_cheat import mark_inactive_players
-from services.leaderboard import get_leaderboard
-from services.realtime import manager
-
-
-async def timer_loop() -> None:
-    while True:
-        try:
-            db = SessionLocal()
-            running_session = (
-                db.query(SessionModel)
-                .filter(SessionModel.status == "running")
-                .order_by(SessionModel.created_at.desc())
-                .first()
-            )
-
-            pushed_update = False
-            if running_session:
-                running_session.remaining_seconds = max(0, running_session.remaining_seconds - 1)
-                if running_session.remaining_seconds <= 0:
-                    running_session.status = "ended"
-                    running_session.end_time = datetime.utcnow()
-                    db.add(
-                        Log(
-                            session_id=running_session.id,
-                            player_id=None,
-                            action_type="session_ended",
-                            details="Timer reached zero",
-                        )
-                    )
-                db.commit()
-                db.refresh(running_session)
-                pushed_update = True
-
-            marked = mark_inactive_players(db, timeout_minutes=5)
-            if marked:
-                pushed_update = True
-
-            if pushed_update and running_session:
-                await manager.broadcast(
-                    "session_update",
-                    {
-                        "session_id": running_session.id,
-                        "status": running_session.status,
-                        "remaining_seconds": running_session.remaining_seconds,
-                        "duration_minutes": running_session.duration_minutes,
-                    },
-                )
-                await manager.broadcast(
-                    "leaderboard_update",
-                    {
-                        "session_id": running_session.id,
-                        "frozen": running_session.leaderboard_frozen,
-                        "rows": get_leaderboard(running_session),
-                    },
-                )
-        except Exception:
-            pass
-        finally:
-            try:
-                db.close()
-            except Exception:
-                pass
-
-        await asyncio.sleep(1)
+from services.audit_log import audit_log
+from services.leaderboard import live_player_rows
+from services.leaderboard_feed import leaderboard_feed, publish_leaderboard
+from services.presence import presence
+from services.question_bank import question_sets
+from services.realtime import ADMIN_TOPIC, manager
+from services.scheduler import scheduler
+from services.security import principal_cache
+from services.session_clock import (
+    COUNTDOWN_JOB,
+    running_clock,
+    session_remaining_seconds,
+    session_update_payload,
+    stop_clock,
+)
+from services.session_state import session_state
+from services.write_queue import write_queue
+
+COUNTDOWN_INTERVAL_SECONDS = 1
+PLAYERS_PUSH_INTERVAL_SECONDS = 3
+INACTIVITY_SWEEP_INTERVAL_SECONDS = 30
+INACTIVITY_TIMEOUT_MINUTES = 5
+CLOCK_SNAPSHOT_INTERVAL_SECONDS = 30
+PRESENCE_FLUSH_INTERVAL_SECONDS = 5
+PLAYER_COUNTS_RECONCILE_INTERVAL_SECONDS = 60
+QUESTION_BANK_WATCH_INTERVAL_SECONDS = 5
+
+
+async def end_session_at_deadline(session_id: int) -> None:
+    def end(wdb: Session) -> tuple[SessionModel | None, bool]:
+        session = wdb.get(SessionModel, session_id)
+        if not session or session.status != "running" or session_remaining_seconds(session) > 0:
+            return session, False
+        stop_clock(session, remaining=0)
+        return session, True
+
+    session, ended = await write_queue.submit(end)
+    if not ended:
+        if session is not None and session.status == "running":
+            # Woke a hair early, or the deadline moved meanwhile: re-arm for the stored one.
+            running_clock.track(session)
+        return
+    audit_log.record(session.id, "session_ended", "Timer reached zero")
+    principal_cache.invalidate_session(session.id)
+    session_state.track(session)
+    await manager.broadcast("session_update", session_update_payload(session))
+    await publish_leaderboard(session)
+
+
+def _running_session_id() -> int | None:
+    clock = running_clock.current
+    return clock.session_id if clock and clock.status == "running" else None
+
+
+async def broadcast_countdown() -> None:
+    """Push the derived countdown while a session runs, and any ranks the clock reordered."""
+    session_id = _running_session_id()
+    if session_id is None:
+        return
+    await manager.broadcast("session_update", running_clock.current.payload())
+    session = session_state.latest
+    if session is not None and session.id == session_id:
+        leaderboard_feed.on_clock(session)
+
+
+async def push_admin_players() -> None:
+    session_id = _running_session_id()
+    if session_id is None or not manager.has_subscribers(ADMIN_TOPIC):
+        return
+    async with AsyncSessionLocal() as db:
+        session = await db.get(SessionModel, session_id)
+        players = await live_player_rows(db, session) if session else None
+    if players is not None:
+        await manager.broadcast("players_update", {"session_id": session_id, "players": players}, topic=ADMIN_TOPIC)
+
+
+async def sweep_inactive_players() -> None:
+    clock = running_clock.current
+    if clock is None:
+        return
+    await presence.seed_session(clock.session_id)
+    threshold = datetime.utcnow() - timedelta(minutes=INACTIVITY_TIMEOUT_MINUTES)
+    stale = presence.stale(clock.session_id, threshold)
+    if stale:
+        marked = await write_queue.submit(lambda db: mark_inactive_players(db, stale))
+        presence.mark_inactive(stale)
+        session_state.adjust_players(clock.session_id, active=-marked)
+
+
+async def persist_clock_snapshot() -> None:
+    """Keep sessions.remaining_seconds roughly current for readers of the raw table."""
+    session_id = _running_session_id()
+    if session_id is None:
+        return
+    remaining = running_clock.current.remaining()
+    await write_queue.submit(
+        lambda db: db.execute(
+            update(SessionModel)
+            .where(SessionModel.id == session_id, SessionModel.status == "running")
+            .values(remaining_seconds=remaining)
+            .execution_options(synchronize_session=False)
+        )
+    )
+
+
+async def reconcile_player_counts() -> None:
+    """Correct the in-memory player counters from the table (heartbeats reactivate players in bulk)."""
+    async with AsyncSessionLocal() as db:
+        await session_state.reconcile(db)
+
+
+def schedule_background_jobs() -> None:
+    running_clock.on_deadline(end_session_at_deadline)
+    scheduler.every(COUNTDOWN_JOB, COUNTDOWN_INTERVAL_SECONDS, broadcast_countdown, run_now=True)
+    scheduler.every("admin_players_push", PLAYERS_PUSH_INTERVAL_SECONDS, push_admin_players)
+    scheduler.every("inactivity_sweep", INACTIVITY_SWEEP_INTERVAL_SECONDS, sweep_inactive_players)
+    scheduler.every("clock_snapshot", CLOCK_SNAPSHOT_INTERVAL_SECONDS, persist_clock_snapshot)
+    scheduler.every("player_counts_reconcile", PLAYER_COUNTS_RECONCILE_INTERVAL_SECONDS, reconcile_player_counts)
+    # Every worker writes behind (and shares) the touches it received itself.
+    scheduler.every("presence_flush", PRESENCE_FLUSH_INTERVAL_SECONDS, presence.flush, leader_only=False)
+    # Every worker reloads question files itself when they change (edited, or uploaded through another worker).
+    scheduler.every(
+        "question_bank_watch", QUESTION_BANK_WATCH_INTERVAL_SECONDS, question_sets.check_files, leader_only=False
+    )
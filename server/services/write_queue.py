@@ -0,0 +1,184 @@
+"""
+Single-writer queue for SQLite writes.
+
+SQLite takes one writer at a time, so concurrent handlers each committing
+their own transaction just queue up on the database lock (and on fsync).
+Instead, every write a request or background job makes is submitted here
+as an *intent*: a plain callable that receives the writer's Session, stages
+its changes and returns a result.  (Only the startup schema and bootstrap
+writes in `main.prepare_database` bypass it; they run before it starts.)
+
+A task on the event loop collects whatever is queued (while writes arrive
+in bursts it first lingers `FLUSH_WINDOW_SECONDS` so the burst lands
+together; a lone write goes straight through) and hands the batch to the
+writer thread, which owns the only writer connection.  There each intent
+runs inside a SAVEPOINT — a failing intent is rolled back on its own and
+only its caller sees the exception — and the whole batch commits at once.
+Callers await their intent's result, which resolves once the batch is
+durable.  Handing over whole batches, not single writes, keeps the thread
+hand-offs (and GIL ping-pong with the event loop) to one per commit.
+
+Intents run off the event loop, so they must not await, must not commit,
+and should read what they change from the session they are given rather
+than trusting objects loaded by the request.
+"""
+
+import asyncio
+import logging
+import os
+import statistics
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from sqlalchemy.orm import Session
+
+from database import WriterSessionLocal
+
+logger = logging.getLogger(__name__)
+
+FLUSH_WINDOW_SECONDS = float(os.getenv("QUESTARENA_WRITE_WINDOW_MS", "2")) / 1000
+MAX_BATCH_SIZE = 256
+_SAMPLES = 256
+
+WriteIntent = Callable[[Session], Any]
+
+
+class WriteQueue:
+    def __init__(self, window: float = FLUSH_WINDOW_SECONDS, max_batch: int = MAX_BATCH_SIZE):
+        self._window = window
+        self._max_batch = max_batch
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+        # The writer thread; only ever handed one whole batch at a time.
+        self._executor: ThreadPoolExecutor | None = None
+        self._submitted = 0
+        self._failed = 0
+        self._batches = 0
+        self._commit_failures = 0
+        self._batch_sizes: deque[int] = deque(maxlen=_SAMPLES)
+        self._flush_ms: deque[float] = deque(maxlen=_SAMPLES)
+        self._wait_ms: deque[float] = deque(maxlen=_SAMPLES)
+
+    async def submit(self, intent: WriteIntent) -> Any:
+        """Run `intent` in the next batch and return its result once committed."""
+        self._submitted += 1
+        if self._queue is None:
+            # Not started (offline scripts): a batch of one, still off the loop.
+            started = time.monotonic()
+            [(ok, value)] = await asyncio.to_thread(self._write, [intent])
+            self._count([started], [(ok, value)], time.monotonic() - started)
+            if not ok:
+                raise value
+            return value
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((intent, future, time.monotonic()))
+        return await future
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="questarena-writer")
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the writer after committing everything already submitted."""
+        if self._task is None:
+            return
+        self._queue.put_nowait(None)
+        await self._task
+        self._executor.shutdown()
+        self._queue = self._task = self._executor = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        busy = False
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            if busy and self._window:
+                await asyncio.sleep(self._window)
+            stopping = False
+            while len(batch) < self._max_batch and not self._queue.empty():
+                item = self._queue.get_nowait()
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            started = time.monotonic()
+            outcomes = await loop.run_in_executor(self._executor, self._write, [intent for intent, _, _ in batch])
+            self._count([queued_at for _, _, queued_at in batch], outcomes, time.monotonic() - started)
+            for (_, future, _), (ok, value) in zip(batch, outcomes):
+                if future.done():
+                    continue  # caller went away
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+            busy = len(batch) > 1
+            if stopping:
+                return
+
+    def _write(self, intents: list[WriteIntent]) -> list[tuple[bool, Any]]:
+        """Apply one batch in a single transaction (runs on the writer thread)."""
+        try:
+            with WriterSessionLocal() as db:
+                # A lone intent has nothing to be isolated from: skip the SAVEPOINT round trips.
+                isolate = len(intents) > 1
+                outcomes = [_attempt(db, intent, isolate) for intent in intents]
+                db.commit()
+            return outcomes
+        except Exception as exc:
+            self._commit_failures += 1
+            logger.exception("Write batch of %d intents failed to commit", len(intents))
+            return [(False, exc)] * len(intents)
+
+    def _count(self, queued_at: list[float], outcomes: list[tuple[bool, Any]], flush_seconds: float) -> None:
+        finished = time.monotonic()
+        self._batches += 1
+        self._batch_sizes.append(len(outcomes))
+        self._flush_ms.append(flush_seconds * 1000)
+        self._wait_ms.extend((finished - at) * 1000 for at in queued_at)
+        self._failed += sum(1 for ok, _ in outcomes if not ok)
+
+    def metrics(self) -> dict:
+        sizes = list(self._batch_sizes)
+        waits = sorted(self._wait_ms)
+        return {
+            "running": self._task is not None,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "flush_window_ms": self._window * 1000,
+            "submitted": self._submitted,
+            "failed": self._failed,
+            "batches": self._batches,
+            "commit_failures": self._commit_failures,
+            "batch_size": {
+                "avg": round(statistics.fmean(sizes), 2) if sizes else None,
+                "max": max(sizes) if sizes else None,
+            },
+            "flush_ms_avg": round(statistics.fmean(self._flush_ms), 3) if self._flush_ms else None,
+            "wait_ms": {
+                "p50": round(waits[len(waits) // 2], 3) if waits else None,
+                "p99": round(waits[min(len(waits) - 1, int(len(waits) * 0.99))], 3) if waits else None,
+                "max": round(waits[-1], 3) if waits else None,
+            },
+        }
+
+
+def _attempt(db: Session, intent: WriteIntent, isolate: bool) -> tuple[bool, Any]:
+    try:
+        if not isolate:
+            return True, intent(db)
+        with db.begin_nested():
+            return True, intent(db)
+    except Exception as exc:
+        if not isolate:
+            db.rollback()
+        return False, exc
+
+
+write_queue = WriteQueue()
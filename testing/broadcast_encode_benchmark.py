@@ -0,0 +1,102 @@
+"""
+Broadcast Encoding Micro-Benchmark
+==================================
+Measures the JSON encoding cost of one realtime broadcast as the number of
+connected sockets grows:
+
+  per-socket   - send_json() per connection (the payload is re-serialized
+                 once for every socket)
+  once/json    - services.realtime.encode_message with the stdlib encoder
+  once/orjson  - services.realtime.encode_message with orjson (if installed)
+
+The payload is a 300-row leaderboard snapshot.
+
+Usage:
+    python testing/broadcast_encode_benchmark.py
+
+Requires: fastapi  (pip install -r server/requirements.txt), optional orjson
+"""
+
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "server"))
+
+from services import realtime  # noqa: E402
+
+CONNECTION_COUNTS = [1, 10, 100, 500, 1000]
+ROUNDS = 20
+ROW_COUNT = 300
+
+PAYLOAD = {
+    "session_id": 1,
+    "version": 42,
+    "frozen": False,
+    "live_time_taken_seconds": 754,
+    "rows": [
+        {
+            "rank": rank,
+            "player_id": rank,
+            "username": f"team_{rank:04d}",
+            "score": 500 - rank,
+            "current_level": rank % 6,
+            "is_completed": rank % 3 == 0,
+            "time_taken_seconds": 600 + rank,
+        }
+        for rank in range(1, ROW_COUNT + 1)
+    ],
+}
+
+
+def per_socket(connections: int) -> None:
+    message = {"event": "leaderboard_snapshot", "payload": PAYLOAD}
+    for _ in range(connections):
+        json.dumps(message, ensure_ascii=False, separators=(",", ":"))
+
+
+def once_stdlib(connections: int) -> None:
+    saved, realtime.orjson = realtime.orjson, None
+    try:
+        frame = realtime.encode_message("leaderboard_snapshot", PAYLOAD)
+    finally:
+        realtime.orjson = saved
+    for _ in range(connections):
+        _ = frame
+
+
+def once_orjson(connections: int) -> None:
+    frame = realtime.encode_message("leaderboard_snapshot", PAYLOAD)
+    for _ in range(connections):
+        _ = frame
+
+
+def measure(fn, connections: int) -> float:
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        fn(connections)
+    return (time.perf_counter() - start) / ROUNDS * 1000
+
+
+def main() -> None:
+    has_orjson = realtime.orjson is not None
+    header = f"{'sockets':>8} | {'per-socket':>11} | {'once/json':>10}"
+    if has_orjson:
+        header += f" | {'once/orjson':>11}"
+    print(header)
+    print("-" * len(header))
+    for connections in CONNECTION_COUNTS:
+        line = (
+            f"{connections:>8} | {measure(per_socket, connections):>9.2f}ms"
+            f" | {measure(once_stdlib, connections):>8.2f}ms"
+        )
+        if has_orjson:
+            line += f" | {measure(once_orjson, connections):>9.2f}ms"
+        print(line)
+    if not has_orjson:
+        print("\norjson not installed - `pip install orjson` to compare the fast encoder")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Realtime Broker Ordering Test
+=============================
+Starts 4 worker processes that share one services.broker.HubBroker hub
+(exactly as 4 uvicorn workers would with QUESTARENA_BROKER=hub).  Every
+worker publishes a burst of numbered messages and records everything it
+receives.  The test then verifies that:
+
+  * every worker received every message from every worker,
+  * each publisher's messages arrived in the order they were published,
+  * all workers observed the same total order,
+  * exactly one worker hosted the hub (the leader).
+
+Usage:
+    python testing/broker_ordering_test.py
+
+Exits non-zero on failure.  Requires only the standard library.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "server"))
+
+WORKERS = 4
+MESSAGES_PER_WORKER = 2_000
+TIMEOUT_SECONDS = 30
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def worker(index: int, port: int, ready, go, results) -> None:
+    from services.broker import HubBroker
+
+    async def run() -> None:
+        broker = HubBroker("127.0.0.1", port)
+        received: list[tuple[int, int]] = []
+        done = asyncio.Event()
+        expected = WORKERS * MESSAGES_PER_WORKER
+
+        def on_message(message) -> None:
+            received.append((message["worker"], message["seq"]))
+            if len(received) == expected:
+                done.set()
+
+        broker.subscribe("test", on_message)
+        await broker.start()
+        ready.put(index)
+        while not go.is_set():
+            await asyncio.sleep(0.01)
+
+        for seq in range(MESSAGES_PER_WORKER):
+            broker.publish("test", {"worker": index, "seq": seq})
+            if seq % 100 == 0:
+                await asyncio.sleep(0)
+
+        try:
+            await asyncio.wait_for(done.wait(), timeout=TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        # Keep the hub up until every worker has reported back.
+        results.put((index, broker.is_leader, received))
+        await asyncio.sleep(2)
+        await broker.stop()
+
+    asyncio.run(run())
+
+
+def main() -> int:
+    ctx = multiprocessing.get_context("spawn")
+    port = free_port()
+    ready, results, go = ctx.Queue(), ctx.Queue(), ctx.Event()
+    procs = [ctx.Process(target=worker, args=(i, port, ready, go, results)) for i in range(WORKERS)]
+    for proc in procs:
+        proc.start()
+    for _ in procs:
+        ready.get(timeout=TIMEOUT_SECONDS)
+
+    start = time.perf_counter()
+    go.set()
+    reports = [results.get(timeout=TIMEOUT_SECONDS + 5) for _ in procs]
+    elapsed = time.perf_counter() - start
+    for proc in procs:
+        proc.join(timeout=10)
+
+    failures = []
+    leaders = [index for index, is_leader, _ in reports if is_leader]
+    if len(leaders) != 1:
+        failures.append(f"expected exactly one hub leader, got {leaders}")
+
+    expected_total = WORKERS * MESSAGES_PER_WORKER
+    orders = {}
+    for index, _, received in reports:
+        if len(received) != expected_total:
+            failures.append(f"worker {index} received {len(received)}/{expected_total} messages")
+        for publisher in range(WORKERS):
+            seqs = [seq for source, seq in received if source == publisher]
+            if seqs != list(range(MESSAGES_PER_WORKER)):
+                failures.append(f"worker {index} saw publisher {publisher} out of order or incomplete")
+        orders[index] = received
+
+    reference = orders.get(0)
+    for index, received in orders.items():
+        if received != reference:
+            failures.append(f"worker {index} observed a different total order than worker 0")
+
+    print(f"workers={WORKERS} messages/worker={MESSAGES_PER_WORKER} leader={leaders} elapsed={elapsed:.2f}s")
+    print(f"delivered {expected_total * WORKERS} frames ({expected_total * WORKERS / elapsed:,.0f}/s)")
+    if failures:
+        for failure in failures:
+            print("FAIL:", failure)
+        return 1
+    print("PASS: every worker received every message in the same order")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+"""
+Duplicate Submit Stress Test
+============================
+Checks that `POST /api/submit_answer` credits each question exactly once
+when the same correct answer arrives many times at once (a player with
+several tabs open, or a client retrying).  Every player fires `--copies`
+identical correct submits in parallel for each level-0..2 question, then
+the script verifies that:
+
+  * every (player, question) got exactly one "correct", the rest
+    "already_answered", and no request failed
+  * each player's leaderboard score equals the score returned by their
+    last "correct" response, i.e. nothing was credited twice
+
+The script creates and starts a fresh session, so run it against a
+throwaway database.
+
+Usage:
+    cd server && uvicorn main:app --port 8000
+    python testing/duplicate_submit_stress_test.py --base-url http://127.0.0.1:8000
+
+Options: --players 20 --copies 8
+
+Requires: httpx  (pip install -r server/requirements.txt)
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from collections import Counter
+
+import httpx
+
+ADMIN_PASSWORD = "arena2026"
+LEVELS = ("0", "1", "2")
+QUESTIONS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "server", "questions.json")
+
+
+def load_questions() -> list[tuple[int, str, str]]:
+    with open(QUESTIONS_PATH, "r", encoding="utf-8") as file:
+        questions = json.load(file)
+    picked = []
+    for level in LEVELS:
+        for question in questions[level]["questions"]:
+            answer = question["answer"]
+            picked.append((int(level), question["id"], answer[0] if isinstance(answer, list) else answer))
+    return picked
+
+
+async def setup(client: httpx.AsyncClient, players: int) -> list[tuple[str, str]]:
+    admin = (await client.post("/api/admin_login", json={"password": ADMIN_PASSWORD})).json()["token"]
+    headers = {"Authorization": f"Bearer {admin}"}
+    (await client.post("/api/admin/session/create", json={"name": "dup stress", "duration_minutes": 60}, headers=headers)).raise_for_status()
+
+    stamp = int(time.time()) % 100_000
+    registered = []
+    for index in range(players):
+        username = f"dup_{stamp}_{index}"
+        response = await client.post("/api/player/register", json={"username": username})
+        response.raise_for_status()
+        registered.append((username, response.json()["token"]))
+    (await client.post("/api/admin/session/start", headers=headers)).raise_for_status()
+    return registered
+
+
+async def submit(
+    client: httpx.AsyncClient, token: str, level: int, question_id: str, answer: str
+) -> tuple[str, int | None]:
+    body = {"level": level, "question_id": question_id, "answer": answer}
+    try:
+        response = await client.post("/api/submit_answer", json=body, headers={"Authorization": f"Bearer {token}"})
+    except httpx.HTTPError as exc:
+        return f"error:{type(exc).__name__}", None
+    if response.status_code != 200:
+        return f"http_{response.status_code}", None
+    payload = response.json()
+    return payload["status"], payload.get("new_score")
+
+
+async def hammer_player(client: httpx.AsyncClient, token: str, questions, copies: int) -> list:
+    """All questions of one player, each submitted `copies` times concurrently."""
+    results = []
+    for level, question_id, answer in questions:
+        outcomes = await asyncio.gather(*(submit(client, token, level, question_id, answer) for _ in range(copies)))
+        results.append((question_id, outcomes))
+    return results
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--players", type=int, default=20)
+    parser.add_argument("--copies", type=int, default=8)
+    args = parser.parse_args()
+
+    questions = load_questions()
+    limits = httpx.Limits(max_connections=args.players * args.copies + 10)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=60.0, limits=limits) as client:
+        players = await setup(client, args.players)
+        started = time.perf_counter()
+        per_player = await asyncio.gather(*(hammer_player(client, token, questions, args.copies) for _, token in players))
+        elapsed = time.perf_counter() - started
+        board = {row["username"]: row["score"] for row in (await client.get("/api/leaderboard")).json()}
+
+    statuses: Counter[str] = Counter()
+    problems = []
+    for (username, _), results in zip(players, per_player):
+        last_credited = 0
+        for question_id, outcomes in results:
+            statuses.update(status for status, _ in outcomes)
+            failed = [status for status, _ in outcomes if status not in ("correct", "already_answered")]
+            if failed:
+                problems.append(f"{username} {question_id}: {', '.join(failed)}")
+            correct = [score for status, score in outcomes if status == "correct"]
+            if len(correct) != 1:
+                problems.append(f"{username} {question_id}: {len(correct)} correct responses")
+            last_credited = max([last_credited, *correct])
+        if board.get(username) != last_credited:
+            problems.append(f"{username}: leaderboard score {board.get(username)} != credited {last_credited}")
+
+    total = sum(statuses.values())
+    print(f"players={args.players} copies={args.copies} questions={len(questions)}")
+    print(f"{total} submits in {elapsed:.1f}s ({total / elapsed:,.0f}/s): {dict(statuses)}")
+    if problems:
+        print(f"FAILED: {len(problems)} problems")
+        for problem in problems[:20]:
+            print("  " + problem)
+        return 1
+    print("OK: every question credited exactly once")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
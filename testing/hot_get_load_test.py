@@ -0,0 +1,179 @@
+"""
+Hot GET Load Test
+=================
+Replays the burst that follows a session start: `--clients` pollers each
+fetch `/api/game_status`, `/api/leaderboard` and `/api/questions/{level}`
+`--rounds` times, all at once, while registered players keep submitting
+correct answers (so the leaderboard and session state keep changing).
+
+The burst runs twice in-process against a throwaway database, each time
+on a fresh session, first with
+the response cache off (`QUESTARENA_RESPONSE_CACHE_MS=0`: every request
+computes and serializes its own answer) and then with the default TTL,
+and reports for each:
+
+  * requests/s and p50 / p95 latency
+  * SELECTs issued on the request engine during the burst
+  * responses computed vs. served from cache or coalesced onto an
+    in-flight computation (question payloads are pre-rendered at startup
+    and never computed per request)
+
+Usage:
+    python testing/hot_get_load_test.py [--clients 300] [--rounds 5] [--players 100]
+
+Requires: httpx, sqlalchemy[asyncio], aiosqlite  (pip install -r server/requirements.txt)
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+SERVER_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "server")
+sys.path.insert(0, SERVER_DIR)
+
+# database.py opens ./questarena.db, so work from a scratch directory.
+os.chdir(tempfile.mkdtemp(prefix="questarena-hot-get-"))
+
+import httpx  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+import main  # noqa: E402
+import routes.session  # noqa: E402
+from database import async_engine  # noqa: E402
+from services.leaderboard import leaderboard_index  # noqa: E402
+from services.response_cache import TTL_SECONDS, ResponseCache  # noqa: E402
+
+ADMIN_PASSWORD = "arena2026"
+LEVELS = (0, 1, 2)
+SUBMIT_INTERVAL_SECONDS = 0.05
+
+selects = 0
+
+
+def count_selects(conn, cursor, statement, parameters, context, executemany) -> None:
+    global selects
+    if statement.lstrip().upper().startswith("SELECT"):
+        selects += 1
+
+
+def correct_answers() -> list[tuple[int, str, str]]:
+    with open(os.path.join(SERVER_DIR, "questions.json"), "r", encoding="utf-8") as file:
+        questions = json.load(file)
+    answers = []
+    for level in LEVELS:
+        for question in questions[str(level)]["questions"]:
+            answer = question["answer"]
+            answers.append((level, question["id"], answer[0] if isinstance(answer, list) else answer))
+    return answers
+
+
+async def setup(client: httpx.AsyncClient, label: str, players: int) -> list[dict]:
+    """A fresh running session with `players` registered teams; returns their auth headers."""
+    admin = (await client.post("/api/admin_login", json={"password": ADMIN_PASSWORD})).json()["token"]
+    admin_headers = {"Authorization": f"Bearer {admin}"}
+    (await client.post("/api/admin/session/create", json={"name": f"hot get {label}", "duration_minutes": 60}, headers=admin_headers)).raise_for_status()
+    tokens = []
+    for index in range(players):
+        response = await client.post("/api/player/register", json={"username": f"hot_{label}_{index:04d}"})
+        response.raise_for_status()
+        tokens.append({"Authorization": f"Bearer {response.json()['token']}"})
+    (await client.post("/api/admin/session/start", headers=admin_headers)).raise_for_status()
+    return tokens
+
+
+async def submitter(client: httpx.AsyncClient, token: dict, answers, stop: asyncio.Event) -> int:
+    """One player answering its questions in order until the burst is over; returns how many it sent."""
+    sent = 0
+    for level, question_id, answer in answers:
+        if stop.is_set():
+            break
+        body = {"level": level, "question_id": question_id, "answer": answer}
+        await client.post("/api/submit_answer", json=body, headers=token)
+        sent += 1
+        await asyncio.sleep(SUBMIT_INTERVAL_SECONDS)
+    return sent
+
+
+async def poller(client: httpx.AsyncClient, index: int, rounds: int, latencies: list[float]) -> int:
+    errors = 0
+    paths = ("/api/game_status", "/api/leaderboard", f"/api/questions/{LEVELS[index % len(LEVELS)]}")
+    for _ in range(rounds):
+        for path in paths:
+            started = time.perf_counter()
+            response = await client.get(path)
+            latencies.append((time.perf_counter() - started) * 1000)
+            errors += response.status_code != 200
+    return errors
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+async def burst(client: httpx.AsyncClient, tokens, answers, clients: int, rounds: int) -> dict:
+    global selects
+    session_id = (await client.get("/api/game_status")).json()["session_id"]
+    leaderboard_index.drop_session(session_id)  # start from a cold ranking, as after a restart
+    latencies: list[float] = []
+    stop = asyncio.Event()
+    submitting = asyncio.gather(*(submitter(client, token, answers, stop) for token in tokens))
+    selects = 0
+    started = time.perf_counter()
+    errors = await asyncio.gather(*(poller(client, index, rounds, latencies) for index in range(clients)))
+    elapsed = time.perf_counter() - started
+    burst_selects = selects
+    stop.set()
+    submitted = sum(await submitting)
+    metrics = routes.session.response_cache.metrics()["routes"]
+    return {
+        "requests": len(latencies),
+        "rps": len(latencies) / elapsed,
+        "p50": percentile(latencies, 0.50),
+        "p95": percentile(latencies, 0.95),
+        "errors": sum(errors),
+        "selects": burst_selects,
+        "submits": submitted,
+        "computed": sum(route["misses"] for route in metrics.values()),
+        "hits": sum(route["hits"] for route in metrics.values()),
+        "coalesced": sum(route["coalesced"] for route in metrics.values()),
+    }
+
+
+async def main_async() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=300)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--players", type=int, default=100)
+    args = parser.parse_args()
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", count_selects)
+    answers = correct_answers()
+    await main.startup()
+    try:
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60.0) as client:
+            print(f"clients={args.clients} rounds={args.rounds} players={args.players} ttl={TTL_SECONDS * 1000:.0f} ms")
+            print(
+                f"{'cache':<6} {'requests':>8} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'errors':>6}"
+                f" {'SELECTs':>8} {'submits':>8} {'computed':>9} {'hits':>6} {'coalesced':>9}"
+            )
+            for label, ttl in (("off", 0.0), ("on", TTL_SECONDS)):
+                tokens = await setup(client, label, args.players)
+                routes.session.response_cache = ResponseCache(ttl=ttl)
+                result = await burst(client, tokens, answers, args.clients, args.rounds)
+                print(
+                    f"{label:<6} {result['requests']:>8} {result['rps']:>8,.0f} {result['p50']:>8.1f}"
+                    f" {result['p95']:>8.1f} {result['errors']:>6} {result['selects']:>8} {result['submits']:>8}"
+                    f" {result['computed']:>9} {result['hits']:>6} {result['coalesced']:>9}"
+                )
+    finally:
+        await main.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main_async())
@@ -0,0 +1,136 @@
+"""
+Leaderboard Query Benchmark
+===========================
+Seeds a throwaway SQLite database with 1k / 10k / 50k players (a third of
+them completed, each with a completion log) and times two ways of building
+the ranked leaderboard:
+
+  orm  - load session.players as ORM objects, lazy-load each completed
+         player's logs, compute time taken in Python and sort
+  sql  - services.leaderboard.leaderboard_query (one statement,
+         row_number() window, __slots__ records)
+
+Usage:
+    python testing/leaderboard_benchmark.py
+
+Requires: sqlalchemy  (pip install -r server/requirements.txt)
+"""
+
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "server"))
+
+from sqlalchemy import create_engine, insert  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from database import Base  # noqa: E402
+from models import Log, Player, SessionModel  # noqa: E402
+from services.leaderboard import LeaderboardRow, compute_time_taken_seconds, leaderboard_query  # noqa: E402
+
+PLAYER_COUNTS = [1_000, 10_000, 50_000]
+ROUNDS = 5
+DURATION_MINUTES = 30
+
+
+def seed(db, player_count: int) -> int:
+    start = datetime.utcnow() - timedelta(minutes=20)
+    session = SessionModel(
+        name="bench",
+        duration_minutes=DURATION_MINUTES,
+        remaining_seconds=600,
+        status="running",
+        start_time=start,
+    )
+    db.add(session)
+    db.flush()
+
+    players = []
+    for i in range(player_count):
+        completed = random.random() < 0.33
+        players.append(
+            {
+                "username": f"team_{i:06d}",
+                "session_id": session.id,
+                "score": random.choice([0, 10, 25, 45, 85, 145, 245]),
+                "current_level": random.randint(0, 6),
+                "join_time": start,
+                "last_active": start,
+                "completed_at": start + timedelta(seconds=random.randint(60, 1200)) if completed else None,
+            }
+        )
+    db.execute(insert(Player), players)
+
+    logs = []
+    for player_id, completed_at in db.query(Player.id, Player.completed_at).filter(Player.completed_at.is_not(None)):
+        remaining = DURATION_MINUTES * 60 - int((completed_at - start).total_seconds())
+        logs.append(
+            {
+                "session_id": session.id,
+                "player_id": player_id,
+                "action_type": "game_complete",
+                "details": f"Player marked game complete; remaining_seconds={remaining}",
+                "timestamp": completed_at,
+            }
+        )
+    if logs:
+        db.execute(insert(Log), logs)
+    db.commit()
+    return session.id
+
+
+def orm_path(db, session_id: int) -> list:
+    session = db.query(SessionModel).filter(SessionModel.id == session_id).first()
+    rows = [
+        (player.score, compute_time_taken_seconds(player, session), player.username)
+        for player in session.players
+        if not player.is_banned
+    ]
+    rows.sort(key=lambda item: (-item[0], item[1], item[2].lower()))
+    return rows
+
+
+def sql_path(db, session_id: int) -> list:
+    session = db.query(SessionModel).filter(SessionModel.id == session_id).first()
+    return [LeaderboardRow(*row) for row in db.execute(leaderboard_query(session))]
+
+
+def timed(factory, fn, session_id: int) -> list[float]:
+    samples = []
+    for _ in range(ROUNDS):
+        db = factory()
+        try:
+            t0 = time.perf_counter()
+            fn(db, session_id)
+            samples.append((time.perf_counter() - t0) * 1000)
+        finally:
+            db.close()
+    return samples
+
+
+def main() -> None:
+    print(f"{'players':>8} | {'orm median':>11} | {'sql median':>11} | speedup")
+    print("-" * 48)
+    for count in PLAYER_COUNTS:
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+            Base.metadata.create_all(bind=engine)
+            factory = sessionmaker(bind=engine, autoflush=False)
+
+            db = factory()
+            session_id = seed(db, count)
+            db.close()
+
+            orm_ms = statistics.median(timed(factory, orm_path, session_id))
+            sql_ms = statistics.median(timed(factory, sql_path, session_id))
+            print(f"{count:>8} | {orm_ms:>9.1f}ms | {sql_ms:>9.1f}ms | {orm_ms / sql_ms:>6.1f}x")
+            engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
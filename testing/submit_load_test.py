@@ -0,0 +1,133 @@
+"""
+Submit Answer + WebSocket Load Test
+===================================
+Drives a running QuestArena server with concurrent `POST /api/submit_answer`
+traffic while a pool of WebSockets stays subscribed to /ws/live, then
+reports:
+
+  * submit_answer latency (p50 / p95 / p99 / max) and throughput
+  * the worst gap between `session_update` frames seen by any socket
+    (the countdown is pushed once a second, so anything well above 1s
+    means the event loop was blocked)
+
+The script creates and starts a fresh session, so run it against a
+throwaway database.
+
+Usage:
+    cd server && uvicorn main:app --port 8000
+    python testing/submit_load_test.py --base-url http://127.0.0.1:8000
+
+Options: --players 50 --sockets 200 --duration 20
+
+Requires: httpx, websockets  (pip install -r server/requirements.txt)
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import httpx
+import websockets
+
+ADMIN_PASSWORD = "arena2026"
+QUESTION_IDS = ["q0_1", "q0_2", "q0_3"]
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+async def setup(client: httpx.AsyncClient, players: int) -> list[str]:
+    admin = (await client.post("/api/admin_login", json={"password": ADMIN_PASSWORD})).json()["token"]
+    headers = {"Authorization": f"Bearer {admin}"}
+    (await client.post("/api/admin/session/create", json={"name": "load test", "duration_minutes": 60}, headers=headers)).raise_for_status()
+
+    stamp = int(time.time()) % 100_000
+    tokens = []
+    for index in range(players):
+        response = await client.post("/api/player/register", json={"username": f"load_{stamp}_{index}"})
+        response.raise_for_status()
+        tokens.append(response.json()["token"])
+    (await client.post("/api/admin/session/start", headers=headers)).raise_for_status()
+    return tokens
+
+
+async def submitter(client: httpx.AsyncClient, token: str, stop_at: float, latencies: list[float], errors: list[int]):
+    headers = {"Authorization": f"Bearer {token}"}
+    attempt = 0
+    while time.perf_counter() < stop_at:
+        body = {"level": 0, "question_id": QUESTION_IDS[attempt % len(QUESTION_IDS)], "answer": f"guess {attempt}"}
+        attempt += 1
+        started = time.perf_counter()
+        try:
+            response = await client.post("/api/submit_answer", json=body, headers=headers)
+            if response.status_code != 200:
+                errors.append(response.status_code)
+        except httpx.HTTPError:
+            errors.append(0)
+        latencies.append((time.perf_counter() - started) * 1000)
+
+
+async def listener(ws_url: str, token: str, stop_at: float, gaps: list[float]):
+    async with websockets.connect(ws_url, max_size=None) as ws:
+        await ws.send(json.dumps({"action": "subscribe", "token": token}))
+        last = None
+        while time.perf_counter() < stop_at:
+            try:
+                frame = await asyncio.wait_for(ws.recv(), timeout=max(0.1, stop_at - time.perf_counter()))
+            except asyncio.TimeoutError:
+                break
+            if json.loads(frame).get("event") != "session_update":
+                continue
+            now = time.perf_counter()
+            if last is not None:
+                gaps.append(now - last)
+            last = now
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--players", type=int, default=50)
+    parser.add_argument("--sockets", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=20.0)
+    args = parser.parse_args()
+
+    limits = httpx.Limits(max_connections=args.players + 10)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=30.0, limits=limits) as client:
+        tokens = await setup(client, args.players)
+        ws_url = args.base_url.replace("http", "ws", 1) + "/ws/live"
+
+        latencies: list[float] = []
+        errors: list[int] = []
+        gaps: list[float] = []
+        stop_at = time.perf_counter() + args.duration
+        listeners = [
+            asyncio.create_task(listener(ws_url, tokens[i % len(tokens)], stop_at, gaps)) for i in range(args.sockets)
+        ]
+        await asyncio.sleep(1.0)  # let the sockets subscribe first
+        await asyncio.gather(*(submitter(client, token, stop_at, latencies, errors) for token in tokens))
+        await asyncio.gather(*listeners, return_exceptions=True)
+
+    print(f"players={args.players} sockets={args.sockets} duration={args.duration:.0f}s")
+    if latencies:
+        print(
+            f"submit_answer: {len(latencies)} requests ({len(latencies) / (args.duration - 1):,.0f}/s), "
+            f"errors={len(errors)}"
+        )
+        print(
+            f"  latency ms  p50={percentile(latencies, 0.50):.1f}  p95={percentile(latencies, 0.95):.1f}"
+            f"  p99={percentile(latencies, 0.99):.1f}  max={max(latencies):.1f}"
+        )
+    if gaps:
+        print(
+            f"session_update gap s  median={statistics.median(gaps):.2f}  p99={percentile(gaps, 0.99):.2f}"
+            f"  max={max(gaps):.2f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
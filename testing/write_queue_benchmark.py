@@ -0,0 +1,139 @@
+"""
+Write Throughput Benchmark
+==========================
+Seeds a throwaway SQLite database with one running session and 500 players,
+then has N concurrent coroutines perform player writes (bump last_active and
+append an activity log, like POST /api/player/activity) two ways:
+
+  direct - each write opens an AsyncSession on the shared pool and commits
+           its own transaction (how handlers wrote before the write queue)
+  queue  - each write is submitted to services.write_queue and committed
+           in a batch by the single writer thread
+
+and reports writes/s plus per-write latency at each concurrency level.
+
+Usage:
+    python testing/write_queue_benchmark.py [--writes 4000]
+
+Requires: sqlalchemy[asyncio], aiosqlite  (pip install -r server/requirements.txt)
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+SERVER_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "server")
+sys.path.insert(0, SERVER_DIR)
+
+# database.py opens ./questarena.db, so work from a scratch directory.
+os.chdir(tempfile.mkdtemp(prefix="questarena-writes-"))
+
+from sqlalchemy import insert, update  # noqa: E402
+
+from database import AsyncSessionLocal, Base, SessionLocal, async_engine, engine, writer_engine  # noqa: E402
+from models import Log, Player, SessionModel  # noqa: E402
+from services.write_queue import write_queue  # noqa: E402
+
+CONCURRENCY = [1, 10, 50, 200]
+PLAYER_COUNT = 500
+
+
+def seed() -> int:
+    Base.metadata.create_all(bind=engine)
+    with SessionLocal() as db:
+        session = SessionModel(name="bench", duration_minutes=30, remaining_seconds=1800, status="running")
+        db.add(session)
+        db.flush()
+        db.execute(
+            insert(Player),
+            [{"username": f"team_{i:04d}", "session_id": session.id} for i in range(PLAYER_COUNT)],
+        )
+        db.commit()
+        return session.id
+
+
+def touch_statement(player_id: int):
+    return (
+        update(Player)
+        .where(Player.id == player_id)
+        .values(last_active=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+
+
+def activity_log(session_id: int, player_id: int) -> Log:
+    return Log(session_id=session_id, player_id=player_id, action_type="player_event:bench", details="x")
+
+
+async def direct_write(session_id: int, player_id: int) -> None:
+    async with AsyncSessionLocal() as db:
+        await db.execute(touch_statement(player_id))
+        db.add(activity_log(session_id, player_id))
+        await db.commit()
+
+
+async def queued_write(session_id: int, player_id: int) -> None:
+    def intent(db) -> None:
+        db.execute(touch_statement(player_id))
+        db.add(activity_log(session_id, player_id))
+
+    await write_queue.submit(intent)
+
+
+async def run(write, session_id: int, writers: int, total: int) -> tuple[float, list[float], int]:
+    latencies: list[float] = []
+    errors = 0
+    per_writer = max(1, total // writers)
+
+    async def worker(index: int) -> None:
+        nonlocal errors
+        for n in range(per_writer):
+            started = time.perf_counter()
+            try:
+                await write(session_id, 1 + (index * per_writer + n) % PLAYER_COUNT)
+            except Exception:  # "database is locked" once busy_timeout runs out
+                errors += 1
+                continue
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(writers)))
+    return time.perf_counter() - started, latencies, errors
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--writes", type=int, default=4000)
+    args = parser.parse_args()
+
+    session_id = seed()
+    print(f"{'mode':<7} {'writers':>7} {'writes/s':>10} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for writers in CONCURRENCY:
+        for mode, write in (("direct", direct_write), ("queue", queued_write)):
+            if mode == "queue":
+                await write_queue.start()
+            try:
+                elapsed, latencies, errors = await run(write, session_id, writers, args.writes)
+            finally:
+                if mode == "queue":
+                    await write_queue.stop()
+            print(
+                f"{mode:<7} {writers:>7} {len(latencies) / elapsed:>10,.0f} {percentile(latencies, 0.50):>9.2f}"
+                f" {percentile(latencies, 0.99):>9.2f} {errors:>7}"
+            )
+    print(write_queue.metrics())
+    writer_engine.dispose()
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())